@@ -0,0 +1,103 @@
+"""
+The report analysis pipeline, independent of Streamlit:
+model lookup → result cache → payload (PDF text layer or preprocessed pages) →
+rate-limited, streamed Gemini call (Markdown, or schema-constrained JSON).
+"""
+import time
+
+from analysis_cache import analysis_cache, cache_key
+from gemini_client import get_gemini_model, invalidate_gemini_model
+from metrics import metrics
+from rate_limit import gemini_limiter
+from reports import build_analysis_prompt, prepare_pages
+from structured_report import GENERATION_CONFIG, build_structured_prompt, parse_structured_report
+
+
+class AnalysisError(Exception):
+    """The analysis could not start (e.g. no usable Gemini model)."""
+
+
+def is_model_missing(exc) -> bool:
+    err = str(exc)
+    return "404" in err or "not found" in err.lower()
+
+
+def analyze_report(file_bytes, pages, language, on_wait=None, on_text=None, structured=False):
+    """
+    Analyse one report. Returns a dict with the answer `text`, `model_name`, whether it
+    came from the `cached` results, and upload / timing stats for fresh calls.
+    With structured=True the text is schema-constrained JSON and the parsed
+    StructuredReport is returned as `report`.
+    on_wait(queue_position) fires while queued for the rate limiter;
+    on_text(text_so_far) fires as Gemini streams a Markdown answer.
+    """
+    mode = "json" if structured else "markdown"
+    analysis_started = time.perf_counter()
+    with metrics.span("model_lookup"):
+        model, model_name = get_gemini_model()
+    if model is None:
+        metrics.inc("errors_total", stage="model_lookup", error="AnalysisError")
+        raise AnalysisError(f"Could not connect to AI model. Details: {model_name}")
+
+    prompt = build_structured_prompt(language) if structured else build_analysis_prompt(language)
+    key = cache_key(file_bytes, language, model_name, prompt)
+    cached = analysis_cache.get(key)
+    if cached is not None:
+        metrics.inc("analyses_total", mode=mode, result="cached")
+        result = {"text": cached, "model_name": model_name, "cached": True}
+        if structured:
+            result["report"] = parse_structured_report(cached)
+        return result
+
+    with metrics.span("prepare"):
+        parts, upload_stats = prepare_pages(pages, file_bytes)
+    extra = {"generation_config": GENERATION_CONFIG} if structured else {}
+    try:
+        # All pages go in one request so latency stays close to a single page
+        started = time.perf_counter()
+        # Includes any wait for the rate limiter, which is also timed on its own as "queue"
+        with metrics.span("model"):
+            stream = gemini_limiter.call(model.generate_content, [prompt, *parts], stream=True, on_wait=on_wait, **extra)
+            first_text_s = None
+            text = ""
+            for chunk in stream:
+                try:
+                    text += chunk.text
+                except ValueError:
+                    continue  # e.g. a last chunk carrying only the finish reason
+                if first_text_s is None:
+                    first_text_s = time.perf_counter() - started
+                if on_text is not None and not structured:  # half-written JSON isn't worth showing
+                    on_text(text)
+        model_s = time.perf_counter() - started
+    except Exception as e:
+        if is_model_missing(e):
+            invalidate_gemini_model()
+        raise
+    if not text:
+        metrics.inc("errors_total", stage="model", error="EmptyResponse")
+        raise AnalysisError("The AI returned an empty response.")
+    report = None
+    if structured:
+        try:
+            report = parse_structured_report(text)
+        except ValueError:
+            metrics.inc("errors_total", stage="parse", error="IncompleteJSON")
+            raise AnalysisError("The AI returned an incomplete structured response. Please try again.")
+        text = report.to_json()
+
+    analysis_cache.put(key, text)
+    metrics.inc("analyses_total", mode=mode, result="fresh")
+    metrics.observe("stage_seconds", first_text_s or model_s, stage="first_text")
+    metrics.observe("stage_seconds", time.perf_counter() - analysis_started, stage="analysis")
+    result = {
+        "text": text,
+        "model_name": model_name,
+        "cached": False,
+        "upload_stats": upload_stats,
+        "first_text_s": first_text_s or model_s,
+        "model_s": model_s,
+    }
+    if structured:
+        result["report"] = report
+    return result
@@ -0,0 +1,182 @@
+"""
+Content-addressed cache of finished analyses.
+The key covers everything that decides Gemini's answer — the uploaded bytes, language,
+model and prompt text — so re-uploading the same report, switching tabs or retrying
+returns the stored text instead of another 10–20 s API call.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import metrics
+
+# Defaults; override with REPORTSAY_CACHE_* environment variables
+MEMORY_MAX_BYTES = 32 * 1024 * 1024
+DISK_MAX_BYTES = 256 * 1024 * 1024
+TTL_S = 60 * 60
+
+
+def cache_key(file_bytes: bytes, language: str, model_name: str, prompt: str) -> str:
+    """SHA-256 over the report bytes and every input that shapes the answer."""
+    h = hashlib.sha256()
+    for part in (file_bytes, language.encode(), model_name.encode(), prompt.encode()):
+        h.update(len(part).to_bytes(8, 'big'))  # length-prefix so fields can't run together
+        h.update(part)
+    return h.hexdigest()
+
+
+class AnalysisCache:
+    """
+    In-memory LRU tier (bounded by total text size) in front of an optional
+    on-disk tier (one file per key, oldest evicted first). Entries expire after `ttl`.
+    """
+
+    def __init__(self, memory_max_bytes=MEMORY_MAX_BYTES, disk_dir=None,
+                 disk_max_bytes=DISK_MAX_BYTES, ttl=TTL_S):
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (stored_at, text)
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, key: str):
+        """Return the cached analysis text, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[0] < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                self._drop(key)
+
+        found = self._disk_get(key, now)
+        with self._lock:
+            if found is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+        stored_at, text = found
+        self._memory_put(key, text, stored_at)  # promoted, but it expires when the file would
+        return text
+
+    def put(self, key: str, text: str):
+        now = time.time()
+        self._memory_put(key, text, now)
+        self._disk_put(key, text)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "memory_bytes": self._memory_bytes,
+            }
+
+    # ── memory tier ──
+    def _memory_put(self, key, text, stored_at):
+        size = len(text.encode('utf-8'))
+        if size > self.memory_max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (stored_at, text)
+            self._memory_bytes += size
+            while self._memory_bytes > self.memory_max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        _, text = self._entries.pop(key)
+        self._memory_bytes -= len(text.encode('utf-8'))
+
+    # ── disk tier ──
+    def _path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.txt")
+
+    def _disk_get(self, key, now):
+        """(stored_at, text) from the disk tier, or None."""
+        if not self.disk_dir:
+            return None
+        path = self._path(key)
+        try:
+            stored_at = os.path.getmtime(path)
+            if now - stored_at >= self.ttl:
+                os.remove(path)
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                return stored_at, f.read()
+        except OSError:
+            return None
+
+    def _disk_put(self, key, text):
+        if not self.disk_dir:
+            return
+        tmp = None
+        try:
+            # A temp file of its own per write: processes sharing the directory can store
+            # the same key at once, and the last os.replace wins with a whole file
+            with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=self.disk_dir, prefix=key,
+                                             suffix='.tmp', delete=False) as f:
+                tmp = f.name
+                f.write(text)
+            os.replace(tmp, self._path(key))
+            tmp = None
+            self._disk_evict()
+        except OSError:
+            pass  # the disk tier is best-effort
+        finally:
+            if tmp is not None:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+
+    def _disk_evict(self):
+        files = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith('.txt'):
+                path = os.path.join(self.disk_dir, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+def _from_env():
+    env = os.environ
+    return AnalysisCache(
+        memory_max_bytes=int(env.get("REPORTSAY_CACHE_MEMORY_BYTES", MEMORY_MAX_BYTES)),
+        disk_dir=env.get("REPORTSAY_CACHE_DIR") or None,
+        disk_max_bytes=int(env.get("REPORTSAY_CACHE_DISK_BYTES", DISK_MAX_BYTES)),
+        ttl=float(env.get("REPORTSAY_CACHE_TTL_S", TTL_S)),
+    )
+
+
+# Shared by every Streamlit session in this process
+analysis_cache = _from_env()
+metrics.register("analysis_cache", analysis_cache.stats)
@@ -1,13 +1,23 @@
 import streamlit as st
-import google.generativeai as genai
-from PIL import Image
-import json
-import os
 import datetime
-import requests
-import tempfile
-import re
-import io
+import hashlib
+import html
+
+# Heavy SDKs (google.generativeai, PyMuPDF, reportlab) are imported lazily by these
+# modules, on the first analysis / PDF rather than on every cold start. Our NumPy code
+# (price matrix, basket, quick check) waits for the Price Checker tab or the first quick
+# check; Streamlit itself still imports NumPy to serve the image favicon below.
+from analysis import AnalysisError, analyze_report, is_model_missing
+from assets import APP_CSS, COMMON_TESTS
+from gemini_client import configure_gemini, warm_gemini_model
+from jobs import analysis_jobs
+from price_history import price_history
+from lab_registry import LabRegistry
+from metrics import start_export
+from price_snapshot import catalog_snapshot, price_snapshot, registry_snapshot
+from rate_limit import is_rate_limited
+from reports import MAX_PDF_PAGES, extract_pdf_text, generate_pdf_report, open_uploaded_file
+from structured_report import generate_structured_pdf, parse_structured_report, to_html
 
 # ─────────────────────────────────────────────
 # 1. PAGE CONFIG
@@ -21,129 +31,19 @@ st.set_page_config(
 # ─────────────────────────────────────────────
 # 2. CSS DESIGN SYSTEM
 # ─────────────────────────────────────────────
-st.markdown("""
-<style>
-/* ---------- BASE ---------- */
-.main { background-color: #f4f8ff; }
-header { visibility: hidden; }
-.block-container { padding-top: 1rem; }
-
-/* ---------- HERO ---------- */
-.hero-container {
-    display: flex; align-items: center; justify-content: center;
-    background: linear-gradient(135deg, #e8f4ff 0%, #f0f7ff 100%);
-    padding: 2.5rem; border-radius: 18px;
-    box-shadow: 0 4px 20px rgba(0,123,255,0.08);
-    margin-bottom: 28px; border: 1px solid #d0e8ff;
-}
-.hero-logo { width: 90px; height: auto; margin-right: 24px; }
-.hero-title { font-size: 3.2rem; font-weight: 900; color: #005ecb !important;
-    line-height: 1.1; margin: 0; font-family: 'Helvetica Neue', sans-serif; }
-.hero-subtitle { font-size: 1.15rem; color: #4a6fa5; margin: 6px 0 0 0; font-weight: 400; }
-.hero-badge {
-    display: inline-block; background: #007BFF; color: white;
-    font-size: 0.75rem; font-weight: 700; padding: 3px 10px;
-    border-radius: 20px; margin-top: 8px; letter-spacing: 0.5px;
-}
-
-/* ---------- TABS ---------- */
-.stTabs [data-baseweb="tab-list"] {
-    gap: 8px; background-color: transparent;
-    border-bottom: 2px solid #d0e0f7; padding-bottom: 0;
-}
-.stTabs [data-baseweb="tab"] {
-    height: 50px; background-color: #ffffff;
-    border-radius: 10px 10px 0 0; padding: 10px 20px;
-    border: 1px solid #d0e0f7; border-bottom: none;
-    color: #555; font-weight: 600; flex: 1;
-}
-.stTabs [data-baseweb="tab"][aria-selected="true"] {
-    background-color: #e0f0ff !important; color: #005ecb !important;
-    border: 2px solid #005ecb; border-bottom: none; font-weight: 800;
-}
-.stTabs [data-baseweb="tab"]:hover { color: #005ecb; background-color: #f0f7ff; }
-
-/* ---------- SECTION HEADERS ---------- */
-.section-header {
-    font-size: 1.3rem; font-weight: 700; color: #333;
-    margin-bottom: 12px; padding-bottom: 6px;
-    border-bottom: 2px solid #e0eeff;
-}
-
-/* ---------- REPORT BOX ---------- */
-.report-box {
-    background: #ffffff; padding: 28px; border-radius: 14px;
-    border-left: 5px solid #007BFF;
-    box-shadow: 0 6px 20px rgba(0,123,255,0.07); margin-top: 20px;
-}
-.report-box h3 { color: #005ecb; margin-top: 0; }
-
-/* ---------- DISCLAIMER BOX ---------- */
-.disclaimer-box {
-    background: #fff8e1; padding: 14px 18px; border-radius: 10px;
-    border-left: 4px solid #ffc107; margin-top: 16px;
-    font-size: 0.9rem; color: #7a5c00;
-}
-
-/* ---------- PRIVACY BADGE ---------- */
-.privacy-badge {
-    background: #e8f5e9; border: 1px solid #a5d6a7; border-radius: 8px;
-    padding: 10px 14px; font-size: 0.85rem; color: #2e7d32;
-    display: flex; align-items: center; gap: 8px; margin-top: 12px;
-}
-
-/* ---------- LAB CARDS ---------- */
-.lab-card {
-    background: #ffffff; border-radius: 14px; padding: 20px;
-    margin-bottom: 15px; box-shadow: 0 4px 12px rgba(0,0,0,0.06);
-    border: 1px solid #e1e8f5; text-align: center;
-    transition: transform 0.2s, box-shadow 0.2s;
-    height: 230px; display: flex; flex-direction: column;
-    justify-content: space-between;
-}
-.lab-card:hover {
-    transform: translateY(-5px);
-    box-shadow: 0 12px 24px rgba(0,123,255,0.15);
-    border-color: #007BFF;
-}
-.lab-name { font-size: 1rem; font-weight: 700; color: #333; }
-.lab-price { font-size: 2rem; font-weight: 900; color: #1a7a3a; margin: 10px 0; }
-.lab-price-missing { font-size: 1rem; color: #888; font-style: italic; margin: 15px 0; }
-.lab-btn {
-    display: block; width: 100%; padding: 10px 0;
-    background: linear-gradient(135deg, #007BFF, #0056b3);
-    color: white !important; text-decoration: none; border-radius: 8px;
-    font-weight: 600; transition: opacity 0.2s; text-align: center;
-}
-.lab-btn:hover { opacity: 0.88; }
-
-/* ---------- INFO CARDS ---------- */
-.info-card {
-    background: #f0f7ff; border-radius: 12px; padding: 18px;
-    border: 1px solid #cce0ff; margin-bottom: 12px; font-size: 0.9rem; color: #334;
-}
-
-/* ---------- STEP BADGE ---------- */
-.step-badge {
-    display: inline-block; background: #007BFF; color: white;
-    border-radius: 50%; width: 26px; height: 26px; text-align: center;
-    line-height: 26px; font-weight: 800; font-size: 0.85rem; margin-right: 8px;
-}
-</style>
-""", unsafe_allow_html=True)
+st.markdown(APP_CSS, unsafe_allow_html=True)
 
 # ─────────────────────────────────────────────
 # 3. API SETUP
 # ─────────────────────────────────────────────
 api_configured = False
 if "MY_API_KEY" in st.secrets:
-    try:
-        genai.configure(api_key=st.secrets["MY_API_KEY"])
-        api_configured = True
-    except Exception as e:
-        st.error(f"⚠️ API configuration failed: {e}")
+    configure_gemini(st.secrets["MY_API_KEY"])
+    api_configured = True
+    warm_gemini_model()  # imports the SDK and lists models off the script thread
 else:
     st.error("⚠️ API Key missing. Please add `MY_API_KEY` to Streamlit Secrets.")
+start_export()  # once per process; only when REPORTSAY_METRICS_FILE / _PORT is set
 
 # ─────────────────────────────────────────────
 # 4. SESSION STATE INIT
@@ -152,8 +52,18 @@ if "analysis_result" not in st.session_state:
     st.session_state.analysis_result = None
 if "analysis_language" not in st.session_state:
     st.session_state.analysis_language = "English"
-if "last_filename" not in st.session_state:
-    st.session_state.last_filename = None
+if "analysis_structured" not in st.session_state:
+    st.session_state.analysis_structured = False
+if "last_upload" not in st.session_state:
+    st.session_state.last_upload = None  # content hash of the file the results belong to
+if "opened_upload" not in st.session_state:
+    st.session_state.opened_upload = None
+if "analysis_job" not in st.session_state:
+    st.session_state.analysis_job = None
+if "quick_check" not in st.session_state:
+    st.session_state.quick_check = None
+if "pdf_failures" not in st.session_state:
+    st.session_state.pdf_failures = {}
 
 # ─────────────────────────────────────────────
 # 5. HERO HEADER
@@ -173,227 +83,143 @@ st.markdown("""
 # 6. HELPER FUNCTIONS
 # ─────────────────────────────────────────────
 
-def get_gemini_model():
-    """Get best available Gemini model with proper error handling."""
-    try:
-        all_models = [
-            m for m in genai.list_models()
-            if 'generateContent' in m.supported_generation_methods
-        ]
-        # Prefer flash (fast & cheap), then pro
-        for m in all_models:
-            if 'flash' in m.name:
-                return genai.GenerativeModel(m.name), m.name
-        for m in all_models:
-            if '1.5-pro' in m.name:
-                return genai.GenerativeModel(m.name), m.name
-        if all_models:
-            return genai.GenerativeModel(all_models[0].name), all_models[0].name
-        return None, None
-    except Exception as e:
-        return None, str(e)
-
-
-def open_uploaded_file(uploaded_file):
-    """
-    Safely open uploaded file as a PIL Image.
-    Handles JPG, PNG, and PDF (first page only).
-    Returns (image, error_message).
-    """
-    MAX_SIZE_MB = 10
-    file_bytes = uploaded_file.getvalue()
-
-    if len(file_bytes) > MAX_SIZE_MB * 1024 * 1024:
-        return None, f"File is too large ({len(file_bytes)//1024//1024} MB). Please upload a file under {MAX_SIZE_MB} MB."
-
-    file_type = uploaded_file.type
-
-    if file_type == "application/pdf":
-        try:
-            import fitz  # PyMuPDF
-            doc = fitz.open(stream=file_bytes, filetype="pdf")
-            if doc.page_count == 0:
-                return None, "PDF appears to be empty."
-            page = doc[0]
-            pix = page.get_pixmap(dpi=150)
-            image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-            return image, None
-        except ImportError:
-            return None, "PDF support requires PyMuPDF. Please add `pymupdf` to requirements.txt."
-        except Exception as e:
-            return None, f"Could not read PDF: {e}"
-    else:
-        try:
-            image = Image.open(io.BytesIO(file_bytes))
-            image.verify()  # Check it's a valid image
-            image = Image.open(io.BytesIO(file_bytes))  # Re-open after verify
-            return image, None
-        except Exception as e:
-            return None, f"Could not open image: {e}"
-
-
-def build_analysis_prompt(language: str) -> str:
-    """Return a structured, consistent prompt for medical report analysis."""
-    return f"""You are a professional medical lab report interpreter. A patient has uploaded their lab report.
+def run_analysis_job(job, file_bytes, pages, language, structured=False):
+    """Runs on a worker thread: no Streamlit calls, progress goes on the job for the UI to poll."""
+    def on_wait(position):
+        if position > 1:
+            job.message = f"⏳ The AI is busy — you are #{position} in line."
+        else:
+            job.message = "⏳ You're next — waiting for a free slot with the AI..."
 
-Analyze the report carefully and respond ONLY in {language}.
+    def on_text(text):
+        job.message = "🤖 AI is writing your analysis..."
+        job.partial = text
 
-Structure your response exactly as follows:
+    job.message = "🤖 AI is reading your report — this takes 10–20 seconds..."
+    result = analyze_report(file_bytes, pages, language, on_wait=on_wait, on_text=on_text, structured=structured)
+    result["language"] = language
+    result["structured"] = structured
+    return result
 
----
-**🧪 Tests Detected**
-List all tests found in the report (e.g., CBC, HbA1c, etc.)
 
-**✅ Normal Results**
-List each result that is within the normal reference range. Format: Test Name → Value (Normal Range)
+@st.fragment(run_every=1.0)
+def show_job_progress(job_id: str):
+    """Polls the background job once a second; a full rerun shows the finished result."""
+    job = analysis_jobs.get(job_id)
+    if job is None or job.done:
+        st.rerun()
+    st.info(job.message or "⏳ Waiting for a free analysis slot...")
+    if job.partial:
+        st.markdown(report_box_html(job.partial), unsafe_allow_html=True)
 
-**⚠️ Abnormal Results**
-List each result outside the normal range. For each one, briefly explain in simple terms what it may suggest. Format: Test Name → Value (Normal Range) — What this means
 
-**📋 Summary**
-A 2–3 sentence plain-language summary of the overall report for a non-medical reader.
+def forget_analysis_job():
+    st.session_state.analysis_job = None
 
-**💡 Suggested Next Steps**
-What should the patient discuss with their doctor? List 2–3 specific points.
 
----
-⚕️ **Important Disclaimer:** This analysis is generated by AI and is for informational purposes only. It does not constitute medical advice, diagnosis, or treatment. Always consult a qualified physician before making any health decisions.
-"""
+def deferred_pdf(build_pdf, text: str, language: str, failures: dict):
+    """
+    Download data built on click. The build runs outside the script run, so a failure
+    is noted in `failures` (this session's dict) for the next rerun to show.
+    """
+    def build():
+        try:
+            return build_pdf(text, language)
+        except Exception as e:
+            failures["pdf"] = str(e)
+            raise
+    return build
 
 
-def generate_pdf_report(analysis_text: str, language: str) -> bytes:
+def open_upload(uploaded_file):
     """
-    Generate a clean PDF report.
-    Uses reportlab for proper Unicode (Urdu) support.
-    Falls back to FPDF for environments without reportlab.
+    open_uploaded_file, memoized per upload (by content hash) in this session, so reruns
+    from widget clicks and job polls don't send the PDF through the render pool again.
+    Returns (digest, pages, error).
     """
-    try:
-        from reportlab.lib.pagesizes import A4
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib.units import cm
-        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-        from reportlab.lib import colors
-        from reportlab.lib.enums import TA_LEFT
-
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4,
-                                leftMargin=2*cm, rightMargin=2*cm,
-                                topMargin=2*cm, bottomMargin=2*cm)
-
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle('title', fontSize=18, fontName='Helvetica-Bold',
-                                     textColor=colors.HexColor('#005ecb'), spaceAfter=6)
-        sub_style = ParagraphStyle('sub', fontSize=10, fontName='Helvetica',
-                                   textColor=colors.HexColor('#666666'), spaceAfter=14)
-        body_style = ParagraphStyle('body', fontSize=11, fontName='Helvetica',
-                                    leading=16, spaceAfter=6, alignment=TA_LEFT)
-
-        # Clean markdown for PDF
-        clean = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', analysis_text)
-        clean = re.sub(r'\*(.*?)\*', r'<i>\1</i>', clean)
-        clean = re.sub(r'^#+\s+', '', clean, flags=re.MULTILINE)
-
-        story = [
-            Paragraph("ReportSay", title_style),
-            Paragraph(f"AI Medical Report Analysis · Generated {datetime.datetime.now().strftime('%d %b %Y, %H:%M')} · Language: {language}", sub_style),
-            Spacer(1, 0.3*cm),
-        ]
-
-        for line in clean.split('\n'):
-            line = line.strip()
-            if line == '---':
-                story.append(Spacer(1, 0.3*cm))
-            elif line:
-                try:
-                    story.append(Paragraph(line, body_style))
-                except Exception:
-                    story.append(Paragraph(line.encode('ascii', 'replace').decode(), body_style))
-
-        doc.build(story)
-        return buffer.getvalue()
-
-    except ImportError:
-        # Fallback: FPDF (latin-1 only, Urdu will be replaced with ?)
-        from fpdf import FPDF
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_font("Arial", 'B', 16)
-        pdf.cell(0, 10, "ReportSay – AI Analysis", ln=True, align='C')
-        pdf.set_font("Arial", size=10)
-        pdf.cell(0, 8, f"Generated: {datetime.datetime.now().strftime('%d %b %Y %H:%M')}   Language: {language}", ln=True, align='C')
-        pdf.ln(5)
-        pdf.set_font("Arial", size=11)
-        clean = re.sub(r'\*\*|__|\*|_|^#+\s+', '', analysis_text, flags=re.MULTILINE)
-        safe = clean.encode('latin-1', 'replace').decode('latin-1')
-        pdf.multi_cell(0, 7, txt=safe)
-        return pdf.output(dest='S').encode('latin-1')
+    digest = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+    opened = st.session_state.opened_upload
+    if opened is None or opened[0] != digest:
+        opened = st.session_state.opened_upload = (digest, *open_uploaded_file(uploaded_file))
+    return opened
+
+
+def show_analysis_error(e: Exception):
+    err = str(e)
+    if isinstance(e, AnalysisError):
+        st.error(f"⚠️ {err}")
+    elif is_rate_limited(e):
+        st.warning("🚦 The AI is still over its rate limit after several retries. Please wait 30–60 seconds and try again.")
+    elif is_model_missing(e):
+        st.error("❌ The AI model is no longer available. Please try again.")
+    elif "400" in err:
+        st.error("❌ The image could not be processed. Try a clearer photo or different format.")
+    else:
+        st.error(f"❌ AI Error: {err}")
 
 
-# ─────────────────────────────────────────────
-# 7. PRICE DATABASE FALLBACK
-# ─────────────────────────────────────────────
-FALLBACK_PRICES = {
-    "Chughtai Lab": {
-        "CBC": 700, "HbA1c": 1200, "Glucose Profile": 500,
-        "Lipid Profile": 1800, "LFTs": 2200, "RFTs": 1600,
-        "Thyroid Profile": 2500, "Vitamins": 1800
-    },
-    "Shaukat Khanum": {
-        "CBC": 900, "HbA1c": 1500, "Glucose Profile": 600,
-        "Lipid Profile": 2200, "LFTs": 2800, "RFTs": 2000,
-        "Thyroid Profile": 3000, "Vitamins": 2200
-    },
-    "Mughal Labs": {
-        "CBC": 800,
-    "HbA1c": 2300,
-    "Glucose Profile": 450,
-    "Lipid Profile": 2500,
-    "LFTs": 2200,
-    "RFTs": 1650,
-    "Cardiac Profile": 6400,
-    "Thyroid Profile": 3950,
-    "Vitamins": 3950
-    },
-    "IDC": {
-        "CBC": 650, "HbA1c": 1100, "Glucose Profile": 450,
-        "Lipid Profile": 1700, "LFTs": 2000, "RFTs": 1500,
-        "Thyroid Profile": 2400, "Vitamins": 1700
-    },
-    "Al-Noor": {
-        "CBC": 450, "HbA1c": 850, "Glucose Profile": 350,
-        "Lipid Profile": 1300, "LFTs": 1600, "RFTs": 1100,
-        "Thyroid Profile": 1900, "Vitamins": 1400
-    },
-    "Excel Labs": {
-        "CBC": 600, "HbA1c": 1000, "Glucose Profile": 420,
-        "Lipid Profile": 1600, "LFTs": 1900, "RFTs": 1400,
-        "Thyroid Profile": 2300, "Vitamins": 1600
-    }
-}
-
-LAB_LOCATIONS = {
-    "Mughal Labs":      "https://www.google.com/maps/search/Mughal+Labs+Lahore",
-    "Shaukat Khanum":   "https://www.google.com/maps/search/Shaukat+Khanum+Laboratory+Lahore",
-    "IDC":              "https://www.google.com/maps/search/Islamabad+Diagnostic+Centre+Lahore",
-    "Chughtai Lab":     "https://www.google.com/maps/search/Chughtai+Lab+Lahore",
-    "Al-Noor":          "https://www.google.com/maps/search/Al-Noor+Diagnostic+Centre+Lahore",
-    "Excel Labs":       "https://www.google.com/maps/search/Excel+Labs+Lahore"
-}
-
-COMMON_TESTS = [
-    "Select a test...", "CBC", "HbA1c", "Glucose Profile",
-    "Lipid Profile", "LFTs", "RFTs", "Cardiac Profile",
-    "Thyroid Profile", "Vitamins"
-]
+def run_quick_check(file_bytes: bytes):
+    """Flag values locally against reference ranges; None when the file has no text layer to read."""
+    from reference_ranges import quick_check  # NumPy loads on first use, not on every cold start
+    if file_bytes[:5] != b"%PDF-":
+        return None
+    try:
+        text = extract_pdf_text(file_bytes)
+    except Exception:
+        return None
+    return quick_check(text) if text else None
+
+
+def show_quick_check(results: list):
+    if not results:
+        st.info("No recognised test values were found. Use the full AI analysis instead.")
+        return
+    abnormal = sum(r["flag"] != "normal" for r in results)
+    st.markdown(f"#### ⚡ Quick Check — {abnormal} of {len(results)} value(s) outside the usual range")
+    st.dataframe(
+        [{
+            "Status": {"low": "⬇️ Low", "high": "⬆️ High"}.get(r["flag"], "✅ Normal"),
+            "Test": r["test"],
+            "Value": f"{r['value']:g} {r['unit']}",
+            "Usual range": f"{r['low']:g} – {r['high']:g}",
+            "Panel": r["panel"],
+        } for r in results],
+        hide_index=True,
+        use_container_width=True,
+    )
+    st.caption("Typical adult ranges — the range printed on your report takes precedence. "
+               "Run the full AI analysis for an explanation.")
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def load_price_trend(test: str, today: datetime.date) -> dict:
+    """12-month price trend for one test from the history store, as chart columns."""
+    return price_history.trend_table(test, since=today - datetime.timedelta(days=365), until=today)
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def load_recent_price_changes(today: datetime.date) -> list:
+    return price_history.biggest_changes(days=7, limit=5, today=today)
+
+
+def report_box_html(analysis_text: str) -> str:
+    """The analysis card; also re-rendered chunk by chunk while Gemini is still streaming."""
+    return f"""
+    <div class="report-box">
+        <h3>📝 AI Analysis Result</h3>
+        {analysis_text.replace(chr(10), '<br>')}
+    </div>
+    """
+
 
 # ─────────────────────────────────────────────
-# 8. TABS
+# 7. TABS
 # ─────────────────────────────────────────────
 tab1, tab2, tab3 = st.tabs([
     "📄 AI Report Analysis",
     "💰 Smart Price Checker",
     "ℹ️ How It Works"
-])
+], key="tab", on_change="rerun")
 
 # ══════════════════════════════════════════════
 # TAB 1 — AI REPORT ANALYSIS
@@ -419,7 +245,7 @@ with tab1:
             type=['png', 'jpg', 'jpeg', 'pdf'],
             help="Supported: PNG, JPG, JPEG, PDF. Max size: 10 MB."
         )
-        st.caption("📌 Tip: For PDFs, only the **first page** is analyzed. Crop or photograph a single report page for best results.")
+        st.caption(f"📌 Tip: PDFs are analyzed up to the first **{MAX_PDF_PAGES} pages**. For photos, capture one report page per image for best results.")
 
     with col2:
         st.markdown('<div class="section-header">🌐 Language</div>', unsafe_allow_html=True)
@@ -429,18 +255,24 @@ with tab1:
             help="AI will interpret and explain results in your chosen language."
         )
         st.caption("Urdu support is in beta. Medical terms may still appear in English.")
+        structured = st.toggle(
+            "⚡ Compact result",
+            help="The AI returns a table of values with a short summary instead of a long write-up — usually faster."
+        )
 
     # ── File processing ──
     if uploaded_file:
 
-        # Reset results if a new file is uploaded
-        if uploaded_file.name != st.session_state.last_filename:
-            st.session_state.analysis_result = None
-            st.session_state.last_filename = uploaded_file.name
-
         st.markdown("---")
 
-        image, error = open_uploaded_file(uploaded_file)
+        upload_digest, pages, error = open_upload(uploaded_file)
+
+        # Reset results (and stop waiting on the old file's analysis) if a new file is uploaded
+        if upload_digest != st.session_state.last_upload:
+            st.session_state.analysis_result = None
+            st.session_state.quick_check = None
+            forget_analysis_job()
+            st.session_state.last_upload = upload_digest
 
         if error:
             st.error(f"❌ {error}")
@@ -449,153 +281,278 @@ with tab1:
             col_img1, col_img2, col_img3 = st.columns([1, 2, 1])
             with col_img2:
                 st.markdown('<div style="background:white;padding:15px;border-radius:12px;border:1px solid #ddd;box-shadow:0 4px 6px rgba(0,0,0,0.05);">', unsafe_allow_html=True)
-                st.image(image, caption="Document Preview (Page 1)", use_container_width=True)
+                # A digital PDF is previewed by its first page only (it is analysed as text)
+                page_count = pages[0].info.get("page_count", len(pages))
+                st.image(
+                    pages,
+                    caption=[f"Document Preview (Page {i} of {page_count})" for i in range(1, len(pages) + 1)],
+                    use_container_width=True
+                )
                 st.markdown('</div>', unsafe_allow_html=True)
 
             st.write("")
 
-            # Analyze button
-            if st.button("✨ Analyze Report Now", use_container_width=True, type="primary"):
+            col_btn1, col_btn2 = st.columns([2, 1])
+
+            # Quick check — local reference ranges only, no AI call (digital PDFs)
+            with col_btn2:
+                if st.button("⚡ Quick Check (no AI)", use_container_width=True):
+                    results = run_quick_check(uploaded_file.getvalue())
+                    if results is None:
+                        st.session_state.quick_check = None
+                        st.warning("Quick check needs a digital PDF report. Use the full AI analysis for photos and scans.")
+                    else:
+                        st.session_state.quick_check = results
+
+            # Analyze button — the analysis runs on a background worker, not this script thread
+            with col_btn1:
+                analyze_clicked = st.button("✨ Analyze Report Now", use_container_width=True, type="primary")
+            if analyze_clicked:
                 if not api_configured:
                     st.error("API key is not configured. Cannot analyze.")
                 else:
-                    with st.spinner("🤖 AI is reading your report — this takes 10–20 seconds..."):
-                        model, model_name = get_gemini_model()
-                        if model is None:
-                            st.error(f"⚠️ Could not connect to AI model. Details: {model_name}")
-                        else:
-                            try:
-                                prompt = build_analysis_prompt(language)
-                                response = model.generate_content([prompt, image])
-                                st.session_state.analysis_result = response.text
-                                st.session_state.analysis_language = language
-                                st.success(f"✅ Analysis complete using {model_name.split('/')[-1]}")
-                            except Exception as e:
-                                err = str(e)
-                                if "429" in err:
-                                    st.warning("🚦 API rate limit reached. Please wait 30–60 seconds and try again.")
-                                elif "400" in err:
-                                    st.error("❌ The image could not be processed. Try a clearer photo or different format.")
-                                else:
-                                    st.error(f"❌ AI Error: {err}")
-
-            # ── Show result (persists in session) ──
-            if st.session_state.analysis_result:
-                st.markdown(f"""
-                <div class="report-box">
-                    <h3>📝 AI Analysis Result</h3>
-                    {st.session_state.analysis_result.replace(chr(10), '<br>')}
-                </div>
-                """, unsafe_allow_html=True)
+                    job_id = analysis_jobs.submit(run_analysis_job, uploaded_file.getvalue(), pages, language, structured)
+                    st.session_state.analysis_job = job_id
+                    st.session_state.analysis_result = None
+                    # Session state only: a job ID in the URL would let anyone holding the link read the analysis
+
+    if st.session_state.quick_check is not None:
+        show_quick_check(st.session_state.quick_check)
+
+    # ── Background analysis progress (also recovers the job after a reconnect) ──
+    job_id = st.session_state.analysis_job
+    if job_id:
+        job = analysis_jobs.get(job_id)
+        if job is None:
+            forget_analysis_job()
+            st.info("That analysis is no longer available. Please analyze the report again.")
+        elif not job.done:
+            show_job_progress(job_id)
+        else:
+            forget_analysis_job()
+            if job.status == "done":
+                result = job.result
+                st.session_state.analysis_result = result["text"]
+                st.session_state.analysis_language = result["language"]
+                st.session_state.analysis_structured = result["structured"]
+                if result["cached"]:
+                    st.success("✅ Loaded your earlier analysis of this report (no new AI call)")
+                else:
+                    st.success(f"✅ Analysis complete using {result['model_name'].split('/')[-1]}")
+                    upload_stats = result["upload_stats"]
+                    st.caption(
+                        f"📦 Sent {upload_stats['pages']} page(s) as {upload_stats['mode']}, "
+                        f"{upload_stats['bytes'] / 1024:,.0f} KB "
+                        f"(prepared in {upload_stats['preprocess_s']:.2f}s) · "
+                        f"first text after {result['first_text_s']:.1f}s, "
+                        f"complete in {result['model_s']:.1f}s"
+                    )
+            else:
+                show_analysis_error(job.error)
 
-                st.markdown("""
-                <div class="disclaimer-box">
-                    ⚕️ <strong>Disclaimer:</strong> This is an AI-generated interpretation for informational use only.
-                    It is not a substitute for professional medical advice. Always consult your doctor.
-                </div>
-                """, unsafe_allow_html=True)
+    # ── Show result (persists in session) ──
+    if st.session_state.analysis_result:
+        if st.session_state.analysis_structured:
+            st.markdown(to_html(parse_structured_report(st.session_state.analysis_result)), unsafe_allow_html=True)
+        else:
+            st.markdown(report_box_html(st.session_state.analysis_result), unsafe_allow_html=True)
 
-                # PDF Download
-                st.write("")
-                try:
-                    pdf_bytes = generate_pdf_report(
-                        st.session_state.analysis_result,
-                        st.session_state.analysis_language
-                    )
-                    st.download_button(
-                        label="📥 Download Analysis as PDF",
-                        data=pdf_bytes,
-                        file_name=f"ReportSay_Analysis_{datetime.datetime.now().strftime('%Y%m%d_%H%M')}.pdf",
-                        mime="application/pdf",
-                        use_container_width=True
-                    )
-                except Exception as e:
-                    st.warning(f"PDF generation failed: {e}. You can copy the text above manually.")
+        st.markdown("""
+        <div class="disclaimer-box">
+            ⚕️ <strong>Disclaimer:</strong> This is an AI-generated interpretation for informational use only.
+            It is not a substitute for professional medical advice. Always consult your doctor.
+        </div>
+        """, unsafe_allow_html=True)
 
-                # Clear button
-                if st.button("🗑️ Clear & Analyze Another Report", use_container_width=True):
-                    st.session_state.analysis_result = None
-                    st.session_state.last_filename = None
-                    st.rerun()
+        # PDF Download — built only when the button is clicked, memoized per text + language
+        st.write("")
+        analysis_text = st.session_state.analysis_result
+        analysis_language = st.session_state.analysis_language
+        build_pdf = generate_structured_pdf if st.session_state.analysis_structured else generate_pdf_report
+        pdf_error = st.session_state.pdf_failures.pop("pdf", None)
+        if pdf_error:
+            st.warning(f"PDF generation failed: {pdf_error}. You can copy the text above manually.")
+        st.download_button(
+            label="📥 Download Analysis as PDF",
+            data=deferred_pdf(build_pdf, analysis_text, analysis_language, st.session_state.pdf_failures),
+            file_name=f"ReportSay_Analysis_{datetime.datetime.now().strftime('%Y%m%d_%H%M')}.pdf",
+            mime="application/pdf",
+            use_container_width=True
+        )
+
+        # Clear button
+        if st.button("🗑️ Clear & Analyze Another Report", use_container_width=True):
+            st.session_state.analysis_result = None
+            st.session_state.quick_check = None
+            st.session_state.last_upload = None
+            st.session_state.opened_upload = None
+            st.rerun()
 
 # ══════════════════════════════════════════════
 # TAB 2 — SMART PRICE CHECKER
 # ══════════════════════════════════════════════
 with tab2:
-    st.markdown("### 🏥 Compare Lab Test Prices in Lahore")
-    st.caption("Prices shown are approximate. Contact labs directly to confirm current rates.")
-
-    # Load from JSON if available, otherwise use fallback
-    json_path = 'data/lab_prices.json'
-    data_source = "static fallback"
-    lab_data = FALLBACK_PRICES
-
-    if os.path.exists(json_path):
-        try:
-            with open(json_path, 'r') as f:
-                lab_data = json.load(f)
-            mtime = os.path.getmtime(json_path)
-            dt = datetime.datetime.fromtimestamp(mtime).strftime("%d %b %Y %H:%M")
+    # Lazy tab: this body (and NumPy with the price matrix) only runs once it is opened
+    if tab2.open:
+        # data/labs.json: which labs exist, their cities, map links and fallback prices
+        registry_snap = registry_snapshot.get()
+        registry = registry_snap.data if registry_snap is not None else LabRegistry([])
+        cities = registry.cities()
+        if len(cities) > 1:
+            city = st.selectbox("City:", options=cities)
+        else:
+            city = cities[0] if cities else "Lahore"
+        st.markdown(f"### 🏥 Compare Lab Test Prices in {city}")
+        st.caption("Prices shown are approximate. Contact labs directly to confirm current rates.")
+
+        # Shared, process-wide snapshot of the live price matrix, otherwise the fallback
+        snapshot = price_snapshot.get()
+        if snapshot is not None:
+            matrix = snapshot.data
+            dt = datetime.datetime.fromtimestamp(snapshot.mtime).strftime("%d %b %Y %H:%M")
             data_source = f"live database (updated {dt})"
-        except Exception:
-            st.warning("⚠️ Could not load live price database. Showing approximate prices.")
-
-    st.caption(f"📊 Source: {data_source}")
-
-    selected_test = st.selectbox("Select a Test:", options=COMMON_TESTS)
-
-    if selected_test and selected_test != "Select a test...":
-        st.markdown(f"#### 💰 Price Comparison for: **{selected_test}**")
-
-        cols = st.columns(3)
-        prices_found = []
-
-        for idx, (lab_name, tests) in enumerate(lab_data.items()):
-            price = tests.get(selected_test)
-            if not price:
-                for k, v in tests.items():
-                    if selected_test.lower() in k.lower() and len(k) < 30:
-                        price = v
-                        break
-
-            if price:
-                prices_found.append(int(price))
+        else:
+            matrix = registry.fallback_matrix()
+            data_source = "static fallback"
+            if price_snapshot.error:
+                st.warning("⚠️ Could not load live price database. Showing approximate prices.")
+        if len(cities) > 1:
+            matrix = matrix.select_labs(registry.labs_in(city))
+
+        st.caption(f"📊 Source: {data_source}")
+
+        selected_test = st.selectbox("Select a Test:", options=COMMON_TESTS)
+
+        if selected_test and selected_test != "Select a test...":
+            st.markdown(f"#### 💰 Price Comparison for: **{selected_test}**")
+
+            cols = st.columns(3)
+
+            # One column of the labs × tests matrix: a price per lab, 0 where it isn't offered
+            for idx, (lab_name, price) in enumerate(zip(matrix.labs, matrix.test_prices(selected_test).tolist())):
+                price_display = f'<div class="lab-price">Rs. {price:,}</div>' if price else '<div class="lab-price-missing">Call to confirm</div>'
+                map_link = registry.location(lab_name)
+
+                with cols[idx % 3]:
+                    st.markdown(f"""
+                    <div class="lab-card">
+                        <div class="lab-name">{lab_name}</div>
+                        {price_display}
+                        <a href="{map_link}" target="_blank" class="lab-btn">📍 Get Directions</a>
+                    </div>
+                    """, unsafe_allow_html=True)
+
+            # Price summary
+            summary = matrix.test_summary(selected_test)
+            if summary:
+                st.markdown(f"""
+                <div class="info-card" style="margin-top:20px;">
+                    💡 <strong>Price Summary for {selected_test}:</strong> &nbsp;
+                    Lowest: <strong>Rs. {summary['min']:,}</strong> ({summary['cheapest_lab']}) &nbsp;|&nbsp;
+                    Highest: <strong>Rs. {summary['max']:,}</strong> &nbsp;|&nbsp;
+                    Average: <strong>Rs. {summary['avg']:,}</strong>
+                </div>
+                """, unsafe_allow_html=True)
 
-            try:
-                price_display = f'<div class="lab-price">Rs. {int(price):,}</div>' if price else '<div class="lab-price-missing">Call to confirm</div>'
-            except (ValueError, TypeError):
-                price_display = f'<div class="lab-price">Rs. {price}</div>' if price else '<div class="lab-price-missing">Call to confirm</div>'
-            map_link = LAB_LOCATIONS.get(lab_name, "https://www.google.com/maps/search/diagnostic+labs+lahore")
+            # Price trend — the history store only holds changes, so this is a small indexed query
+            trend = load_price_trend(selected_test, datetime.date.today())
+            if len(trend.get("Date", [])) > 1:
+                st.markdown(f"#### 📈 {selected_test} price trend (last 12 months)")
+                st.line_chart(trend, x="Date", y_label="Rs.")
+
+        recent_changes = load_recent_price_changes(datetime.date.today())
+        if recent_changes:
+            with st.expander("📈 Biggest price changes this week"):
+                for lab, test, old, new, day in recent_changes:
+                    st.markdown(
+                        f"**{test}** at {lab}: Rs. {old:,} → **Rs. {new:,}** "
+                        f"({(new - old) / old:+.0%}, {day.strftime('%d %b')})"
+                    )
 
-            with cols[idx % 3]:
+        # ── Basket: the whole panel a doctor ordered ──
+        from basket import MAX_SPLIT_LABS, optimize_basket
+        st.markdown("---")
+        st.markdown("#### 🧺 Price a Whole Panel")
+        basket_tests = st.multiselect("Tests your doctor ordered:", options=list(matrix.tests),
+                                      placeholder="e.g. CBC, LFTs, RFTs, Lipid Profile, HbA1c")
+        max_labs = st.radio("Visit at most:", options=list(range(1, MAX_SPLIT_LABS + 1)), index=1,
+                            format_func=lambda k: "1 lab" if k == 1 else f"{k} labs", horizontal=True)
+
+        if basket_tests:
+            best = optimize_basket(matrix, basket_tests, max_labs=max_labs)
+            single, split = best["single"], best["split"]
+            if single:
                 st.markdown(f"""
-                <div class="lab-card">
-                    <div class="lab-name">{lab_name}</div>
-                    {price_display}
-                    <a href="{map_link}" target="_blank" class="lab-btn">📍 Get Directions</a>
+                <div class="info-card">
+                    🏥 <strong>Cheapest single lab:</strong> {html.escape(single['lab'])} —
+                    <strong>Rs. {single['total']:,}</strong> for all {len(best['tests'])} tests
+                    (most expensive: Rs. {best['priciest_single']['total']:,} at {html.escape(best['priciest_single']['lab'])})
                 </div>
                 """, unsafe_allow_html=True)
+            else:
+                st.info("No single lab lists every one of these tests — see the split below.")
+
+            if split and len(split["labs"]) > 1:
+                cols = st.columns(len(split["labs"]))
+                for col, (lab_name, tests) in zip(cols, split["labs"].items()):
+                    subtotal = sum(matrix.price(lab_name, t) for t in tests)
+                    map_link = registry.location(lab_name)
+                    with col:
+                        st.markdown(f"""
+                        <div class="lab-card">
+                            <div class="lab-name">{html.escape(lab_name)}</div>
+                            <div class="lab-price">Rs. {subtotal:,}</div>
+                            {html.escape(", ".join(tests))}<br>
+                            <a href="{map_link}" target="_blank" class="lab-btn">📍 Get Directions</a>
+                        </div>
+                        """, unsafe_allow_html=True)
+                saving = f" — you save <strong>Rs. {best['savings']:,}</strong>" if best["savings"] else ""
+                st.markdown(f"""
+                <div class="info-card">
+                    💡 <strong>Split across {len(split['labs'])} labs:</strong>
+                    Rs. {split['total']:,} in total{saving}
+                </div>
+                """, unsafe_allow_html=True)
+            elif single and max_labs > 1:
+                st.caption(f"Splitting across up to {max_labs} labs doesn't beat {single['lab']}.")
+            elif not split:
+                st.warning(f"These tests aren't all available within {max_labs} lab(s). Try allowing more labs.")
+            if best["unavailable"]:
+                st.caption(f"No listed prices for: {', '.join(best['unavailable'])}")
+
+        # ── Search every lab's full test list ──
+        if catalog_snapshot.exists():
+            st.markdown("---")
+            st.markdown("#### 🔎 Search All Tests")
+            query = st.text_input("Type any test name (e.g. Ferritin, Vitamin B12, Urine C/E):")
+            if query:
+                catalog = catalog_snapshot.get()
+                if catalog is not None:
+                    matches = catalog.data.search(query, limit=10)
+                else:
+                    matches = None
+                    st.warning("⚠️ Could not load the full test catalog.")
+
+                if matches:
+                    for test_name, offers in matches:
+                        prices = " &nbsp;|&nbsp; ".join(
+                            f"{html.escape(lab)}: <strong>Rs. {price:,}</strong>" for lab, _, price in offers
+                        )
+                        st.markdown(f"""
+                        <div class="info-card">
+                            <b>{html.escape(test_name)}</b><br>{prices}
+                        </div>
+                        """, unsafe_allow_html=True)
+                elif matches is not None:
+                    st.info("No matching tests found. Try a shorter or different spelling.")
 
-        # Price summary
-        if prices_found:
-            min_p, max_p = min(prices_found), max(prices_found)
-            avg_p = sum(prices_found) // len(prices_found)
-            st.markdown(f"""
-            <div class="info-card" style="margin-top:20px;">
-                💡 <strong>Price Summary for {selected_test}:</strong> &nbsp;
-                Lowest: <strong>Rs. {min_p:,}</strong> &nbsp;|&nbsp;
-                Highest: <strong>Rs. {max_p:,}</strong> &nbsp;|&nbsp;
-                Average: <strong>Rs. {avg_p:,}</strong>
-            </div>
-            """, unsafe_allow_html=True)
-
-    st.markdown("---")
-    st.markdown("""
-    <div class="info-card">
-        📞 <strong>Tip:</strong> Many labs offer home sample collection for an additional Rs. 200–500.
-        Call ahead to book a slot and confirm prices, as they may vary by branch.
-    </div>
-    """, unsafe_allow_html=True)
+        st.markdown("---")
+        st.markdown("""
+        <div class="info-card">
+            📞 <strong>Tip:</strong> Many labs offer home sample collection for an additional Rs. 200–500.
+            Call ahead to book a slot and confirm prices, as they may vary by branch.
+        </div>
+        """, unsafe_allow_html=True)
 
 # ══════════════════════════════════════════════
 # TAB 3 — HOW IT WORKS
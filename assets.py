@@ -0,0 +1,121 @@
+"""
+Static page assets for app.py (lab data lives in data/labs.json, see lab_registry.py).
+Streamlit re-executes app.py on every interaction; anything defined here is built
+once per process when the module is first imported.
+"""
+
+APP_CSS = """<style>
+/* ---------- BASE ---------- */
+.main { background-color: #f4f8ff; }
+header { visibility: hidden; }
+.block-container { padding-top: 1rem; }
+
+/* ---------- HERO ---------- */
+.hero-container {
+    display: flex; align-items: center; justify-content: center;
+    background: linear-gradient(135deg, #e8f4ff 0%, #f0f7ff 100%);
+    padding: 2.5rem; border-radius: 18px;
+    box-shadow: 0 4px 20px rgba(0,123,255,0.08);
+    margin-bottom: 28px; border: 1px solid #d0e8ff;
+}
+.hero-logo { width: 90px; height: auto; margin-right: 24px; }
+.hero-title { font-size: 3.2rem; font-weight: 900; color: #005ecb !important;
+    line-height: 1.1; margin: 0; font-family: 'Helvetica Neue', sans-serif; }
+.hero-subtitle { font-size: 1.15rem; color: #4a6fa5; margin: 6px 0 0 0; font-weight: 400; }
+.hero-badge {
+    display: inline-block; background: #007BFF; color: white;
+    font-size: 0.75rem; font-weight: 700; padding: 3px 10px;
+    border-radius: 20px; margin-top: 8px; letter-spacing: 0.5px;
+}
+
+/* ---------- TABS ---------- */
+.stTabs [data-baseweb="tab-list"] {
+    gap: 8px; background-color: transparent;
+    border-bottom: 2px solid #d0e0f7; padding-bottom: 0;
+}
+.stTabs [data-baseweb="tab"] {
+    height: 50px; background-color: #ffffff;
+    border-radius: 10px 10px 0 0; padding: 10px 20px;
+    border: 1px solid #d0e0f7; border-bottom: none;
+    color: #555; font-weight: 600; flex: 1;
+}
+.stTabs [data-baseweb="tab"][aria-selected="true"] {
+    background-color: #e0f0ff !important; color: #005ecb !important;
+    border: 2px solid #005ecb; border-bottom: none; font-weight: 800;
+}
+.stTabs [data-baseweb="tab"]:hover { color: #005ecb; background-color: #f0f7ff; }
+
+/* ---------- SECTION HEADERS ---------- */
+.section-header {
+    font-size: 1.3rem; font-weight: 700; color: #333;
+    margin-bottom: 12px; padding-bottom: 6px;
+    border-bottom: 2px solid #e0eeff;
+}
+
+/* ---------- REPORT BOX ---------- */
+.report-box {
+    background: #ffffff; padding: 28px; border-radius: 14px;
+    border-left: 5px solid #007BFF;
+    box-shadow: 0 6px 20px rgba(0,123,255,0.07); margin-top: 20px;
+}
+.report-box h3 { color: #005ecb; margin-top: 0; }
+
+/* ---------- DISCLAIMER BOX ---------- */
+.disclaimer-box {
+    background: #fff8e1; padding: 14px 18px; border-radius: 10px;
+    border-left: 4px solid #ffc107; margin-top: 16px;
+    font-size: 0.9rem; color: #7a5c00;
+}
+
+/* ---------- PRIVACY BADGE ---------- */
+.privacy-badge {
+    background: #e8f5e9; border: 1px solid #a5d6a7; border-radius: 8px;
+    padding: 10px 14px; font-size: 0.85rem; color: #2e7d32;
+    display: flex; align-items: center; gap: 8px; margin-top: 12px;
+}
+
+/* ---------- LAB CARDS ---------- */
+.lab-card {
+    background: #ffffff; border-radius: 14px; padding: 20px;
+    margin-bottom: 15px; box-shadow: 0 4px 12px rgba(0,0,0,0.06);
+    border: 1px solid #e1e8f5; text-align: center;
+    transition: transform 0.2s, box-shadow 0.2s;
+    height: 230px; display: flex; flex-direction: column;
+    justify-content: space-between;
+}
+.lab-card:hover {
+    transform: translateY(-5px);
+    box-shadow: 0 12px 24px rgba(0,123,255,0.15);
+    border-color: #007BFF;
+}
+.lab-name { font-size: 1rem; font-weight: 700; color: #333; }
+.lab-price { font-size: 2rem; font-weight: 900; color: #1a7a3a; margin: 10px 0; }
+.lab-price-missing { font-size: 1rem; color: #888; font-style: italic; margin: 15px 0; }
+.lab-btn {
+    display: block; width: 100%; padding: 10px 0;
+    background: linear-gradient(135deg, #007BFF, #0056b3);
+    color: white !important; text-decoration: none; border-radius: 8px;
+    font-weight: 600; transition: opacity 0.2s; text-align: center;
+}
+.lab-btn:hover { opacity: 0.88; }
+
+/* ---------- INFO CARDS ---------- */
+.info-card {
+    background: #f0f7ff; border-radius: 12px; padding: 18px;
+    border: 1px solid #cce0ff; margin-bottom: 12px; font-size: 0.9rem; color: #334;
+}
+
+/* ---------- STEP BADGE ---------- */
+.step-badge {
+    display: inline-block; background: #007BFF; color: white;
+    border-radius: 50%; width: 26px; height: 26px; text-align: center;
+    line-height: 26px; font-weight: 800; font-size: 0.85rem; margin-right: 8px;
+}
+</style>
+"""
+
+COMMON_TESTS = [
+    "Select a test...", "CBC", "HbA1c", "Glucose Profile",
+    "Lipid Profile", "LFTs", "RFTs", "Cardiac Profile",
+    "Thyroid Profile", "Vitamins"
+]
@@ -0,0 +1,166 @@
+"""
+Basket mode for the Price Checker: the cheapest way to get a whole panel of tests done.
+Works on the labs × tests PriceMatrix:
+
+- cheapest single lab: one masked row sum over the basket's columns;
+- cheapest split across at most K labs: each test goes to the cheapest of the chosen
+  labs. The per-test cheapest labs answer it outright when there are at most K of
+  them; otherwise labs dominated by another lab (never cheaper for any basket test) are
+  dropped and an exact branch-and-bound search runs over the rest, a whole level of
+  branches at a time in NumPy.
+"""
+import numpy as np
+
+from price_matrix import MISSING
+
+# Most labs the UI lets a patient split a basket across (the search itself is exact for any K)
+MAX_SPLIT_LABS = 3
+# Rows of the pair-total table built per NumPy call (bounds memory at ~64 × labs × tests)
+_PAIR_CHUNK = 64
+
+
+def _non_dominated(sub, rows):
+    """Drop labs for which another lab is at least as cheap on every test (keeping one of equals)."""
+    prices = sub[rows]
+    no_worse = (prices[:, None, :] <= prices[None, :, :]).all(axis=2)  # [a, b]: a never dearer than b
+    strictly = no_worse & ~no_worse.T
+    equal = no_worse & no_worse.T
+    order = np.arange(len(rows))
+    dominated = strictly.any(axis=0) | (equal & (order[:, None] < order[None, :])).any(axis=0)
+    return rows[~dominated]
+
+
+def _pair_totals(prices):
+    """[a, b]: basket total using the cheaper of labs a and b for each test."""
+    n = len(prices)
+    pair = np.empty((n, n), dtype=np.int64)
+    for s in range(0, n, _PAIR_CHUNK):
+        pair[s:s + _PAIR_CHUNK] = np.minimum(prices[s:s + _PAIR_CHUNK, None, :], prices[None, :, :]).sum(axis=2)
+    return pair
+
+
+def _best_split(prices, k, upper):
+    """
+    Exact minimum of sum(min over chosen rows) over subsets of `prices` rows of size <= k,
+    starting from the incumbent `upper` = (total, rows). Depth-first, bounding each level
+    at once with two lower bounds: the cheapest any later row could make each test, and
+    the current total minus the largest savings the remaining picks could add — a row
+    never saves more on top of a set than it saves next to any single row of that set
+    (solo - pair), so the pair totals cap every later saving.
+    """
+    best_total, best_set = upper
+    n = len(prices)
+    # suffix_min[i]: the cheapest any of rows i: can make each test
+    suffix_min = np.minimum.accumulate(prices[::-1], axis=0)[::-1]
+    solo = prices.sum(axis=1)
+    pair = _pair_totals(prices) if k > 2 else None
+    if pair is not None:
+        # The exact best pair, extended greedily, is usually close to the optimum
+        chosen = list(np.unravel_index(int(pair.argmin()), pair.shape))
+        current = prices[chosen].min(axis=0)
+        while len(chosen) < k:
+            pick = int(np.minimum(current, prices).sum(axis=1).argmin())
+            chosen.append(pick)
+            current = np.minimum(current, prices[pick])
+        if current.sum() < best_total:
+            best_total, best_set = int(current.sum()), sorted({int(i) for i in chosen})
+
+    def search(start, chosen, current, cap):
+        nonlocal best_total, best_set
+        merged = np.minimum(current, prices[start:])
+        totals = merged.sum(axis=1)
+        if len(chosen) == k - 1:
+            i = int(totals.argmin())  # last pick: every remaining row at once
+            if totals[i] < best_total:
+                best_total, best_set = int(totals[i]), chosen + [start + i]
+            return
+        bounds = np.minimum(merged[:-1], suffix_min[start + 1:]).sum(axis=1)
+        picks_left = k - len(chosen) - 1
+        if pair is not None and picks_left and len(bounds) > 1:
+            rows = np.arange(start, n - 1)
+            savings = np.minimum(cap[None, start:], solo[rows, None] - pair[rows, start:])
+            savings[np.arange(start, n)[None, :] <= rows[:, None]] = 0  # only later rows
+            if picks_left < savings.shape[1]:
+                savings = -np.partition(-savings, picks_left - 1, axis=1)[:, :picks_left]
+            bounds = np.maximum(bounds, totals[:-1] - savings.sum(axis=1))
+        for offset in np.flatnonzero(bounds < best_total).tolist():
+            i = start + offset
+            if bounds[offset] >= best_total:
+                continue  # best_total improved since the level was bounded
+            if totals[offset] < best_total:
+                best_total, best_set = int(totals[offset]), chosen + [i]
+            next_cap = np.minimum(cap, solo[i] - pair[i]) if pair is not None else cap
+            search(i + 1, chosen + [i], merged[offset], next_cap)
+        if totals[-1] < best_total:
+            best_total, best_set = int(totals[-1]), chosen + [n - 1]
+
+    # Before any pick: nothing to improve on, and no cap on what a lab can save
+    search(0, [], prices.max(axis=0), np.full(n, solo.max()))
+    return best_total, best_set
+
+
+def optimize_basket(matrix, tests, max_labs=2):
+    """
+    Cheapest single lab and cheapest split across at most `max_labs` labs for `tests`.
+    Returns {"tests", "unavailable", "single", "priciest_single", "split", "savings"};
+    single / priciest_single are {"lab", "total"} (None if no lab offers every test),
+    split is {"labs": {lab: [tests]}, "total"}, and savings compares split vs single.
+    """
+    columns = {test: matrix.test_prices(test) for test in dict.fromkeys(tests)}
+    offered = [test for test, column in columns.items() if (column != MISSING).any()]
+    result = {"tests": offered, "unavailable": [t for t in columns if t not in offered],
+              "single": None, "priciest_single": None, "split": None, "savings": None}
+    if not offered:
+        return result
+
+    sub = np.stack([columns[test] for test in offered], axis=1).astype(np.int64)
+    listed = sub != MISSING
+    # Costs more than any basket of offered prices, so a lab missing a test never wins
+    not_offered = int(sub.sum()) + 1
+    sub[~listed] = not_offered
+
+    # Cheapest / dearest single lab among those offering every test
+    totals = sub.sum(axis=1)
+    complete = listed.all(axis=1)
+    if complete.any():
+        cheapest = int(np.where(complete, totals, not_offered * len(offered)).argmin())
+        dearest = int(np.where(complete, totals, -1).argmax())
+        result["single"] = {"lab": matrix.labs[cheapest], "total": int(totals[cheapest])}
+        result["priciest_single"] = {"lab": matrix.labs[dearest], "total": int(totals[dearest])}
+
+    # Split: the per-test cheapest labs if they fit in max_labs, else search
+    per_test = sub.argmin(axis=0)
+    ideal_labs = sorted(set(per_test.tolist()), key=lambda i: -int((per_test == i).sum()))
+    if len(ideal_labs) <= max_labs:
+        chosen = ideal_labs
+    elif max_labs <= 1:
+        chosen = [cheapest] if result["single"] else []
+    else:
+        candidates = _non_dominated(sub, np.flatnonzero(listed.any(axis=1)))
+        prices = sub[candidates]
+        # Labs that are cheapest for more tests first: good answers early prune more
+        order = np.argsort(-(prices == prices.min(axis=0)).sum(axis=1), kind="stable")
+        candidates, prices = candidates[order], prices[order]
+        # Greedy incumbent: add whichever lab lowers the total most, up to max_labs
+        current, greedy = prices.max(axis=0), []
+        for _ in range(max_labs):
+            pick = int(np.minimum(current, prices).sum(axis=1).argmin())
+            if pick not in greedy:
+                greedy.append(pick)
+            current = np.minimum(current, prices[pick])
+        _, best = _best_split(prices, max_labs, (int(current.sum()), greedy))
+        chosen = candidates[best].tolist()
+
+    if not chosen:
+        return result
+    assigned = np.array(chosen)[sub[chosen].argmin(axis=0)]
+    if not listed[assigned, np.arange(len(offered))].all():
+        return result  # no max_labs labs between them offer every test
+    split = {}
+    for test, lab in zip(offered, assigned.tolist()):
+        split.setdefault(matrix.labs[lab], []).append(test)
+    split_total = int(sub[assigned, np.arange(len(offered))].sum())
+    result["split"] = {"labs": split, "total": split_total}
+    if result["single"]:
+        result["savings"] = result["single"]["total"] - split_total
+    return result
@@ -0,0 +1,300 @@
+"""
+Headless batch analysis for clinics processing folders of reports.
+Every report goes through the same pipeline as the app (open_uploaded_file →
+analyze_report → generate_pdf_report) and gets its own answer and PDF in the output folder.
+
+    python batch.py reports/ --out results/
+    python batch.py --manifest todo.txt --out results/ --workers 4 --rpm 60
+    python batch.py reports/ --out results/ --stub      # local stub model, no API key
+
+Needs GEMINI_API_KEY unless --stub is given. Calls share one rate limiter (--rpm,
+default REPORTSAY_GEMINI_RPM or 15/min) and 429s are retried with backoff.
+Progress is checkpointed to <out>/checkpoint.jsonl; re-running the same command skips
+reports that already finished, so an interrupted run resumes where it stopped.
+With REPORTSAY_METRICS_FILE set, per-stage timings are written there as the run goes.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from metrics import metrics, start_export
+from reports import generate_pdf_report, open_uploaded_file
+
+MIME_TYPES = {
+    ".pdf": "application/pdf",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+}
+# Reports analysed at once; the rate limiter still decides when each model call starts
+DEFAULT_WORKERS = 4
+CHECKPOINT_NAME = "checkpoint.jsonl"
+
+
+class BatchError(Exception):
+    """A report could not be processed (unreadable file, unsupported type, ...)."""
+
+
+class LocalFile:
+    """A report on disk with just enough of Streamlit's UploadedFile for open_uploaded_file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.type = MIME_TYPES.get(os.path.splitext(path)[1].lower())
+        self._data = None
+
+    def getvalue(self):
+        if self._data is None:
+            with open(self.path, "rb") as f:
+                self._data = f.read()
+        return self._data
+
+
+def find_inputs(paths=(), manifest=None):
+    """Supported report files under `paths` (files or folders) and listed in `manifest`, in order."""
+    found = []
+    if manifest:
+        base = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest, "r") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    found.append(os.path.join(base, line))
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                found += [os.path.join(root, name) for name in sorted(files)
+                          if os.path.splitext(name)[1].lower() in MIME_TYPES]
+        else:
+            found.append(path)
+    seen = set()
+    return [p for p in found if not (p in seen or seen.add(p))]
+
+
+def output_stem(path, roots):
+    """
+    Output file name for an input: its path below the input folder, flattened, with the
+    extension kept so a.pdf and a.png don't share one answer (reports/x/a.pdf → x__a_pdf).
+    """
+    path = os.path.abspath(path)
+    for root in roots:
+        root = os.path.abspath(root)
+        if os.path.isdir(root) and path.startswith(root + os.sep):
+            path = os.path.relpath(path, root)
+            break
+    else:
+        path = os.path.basename(path)
+    stem, ext = os.path.splitext(path)
+    return (stem + ext.replace(".", "_", 1)).replace(os.sep, "__")
+
+
+def output_stems(paths, roots):
+    """
+    {path: stem} for a whole run. Inputs that would still share a stem (e.g. manifest
+    entries with the same name in different folders) get a short hash of their full path.
+    """
+    stems = {path: output_stem(path, roots) for path in paths}
+    counts = {}
+    for stem in stems.values():
+        counts[stem] = counts.get(stem, 0) + 1
+    for path, stem in stems.items():
+        if counts[stem] > 1:
+            stems[path] = f"{stem}~{hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:8]}"
+    return stems
+
+
+def _write_atomic(path, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class Checkpoint:
+    """
+    Append-only JSON-lines log of finished reports, fsynced per line, so a crash loses
+    at most the reports that were still in flight. Keyed by file content hash plus the
+    answer language and format.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._done = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # a line cut short by a crash
+                    if entry.get("status") == "ok":
+                        self._done[entry["key"]] = entry
+        self._file = open(path, "a")
+
+    def is_done(self, key):
+        return key in self._done
+
+    def record(self, entry):
+        with self._lock:
+            self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            if entry["status"] == "ok":
+                self._done[entry["key"]] = entry
+
+    def close(self):
+        self._file.close()
+
+
+def analyze_file(upload, out_dir, stem, language, structured=False):
+    """Analyse one report and write <stem>.md|.json and <stem>.pdf. Returns the output paths."""
+    from analysis import analyze_report
+    from structured_report import generate_structured_pdf
+
+    if upload.type is None:
+        raise BatchError(f"Unsupported file type: {upload.name}")
+    pages, error = open_uploaded_file(upload)
+    if error:
+        raise BatchError(error)
+    result = analyze_report(upload.getvalue(), pages, language, structured=structured)
+    text = result["text"]
+
+    answer_path = os.path.join(out_dir, f"{stem}.{'json' if structured else 'md'}")
+    pdf_path = os.path.join(out_dir, f"{stem}.pdf")
+    _write_atomic(answer_path, text.encode("utf-8"))
+    build_pdf = generate_structured_pdf if structured else generate_pdf_report
+    _write_atomic(pdf_path, build_pdf(text, language))
+    return {"answer": answer_path, "pdf": pdf_path, "cached": result["cached"], "model": result["model_name"]}
+
+
+def _log(message):
+    print(message, flush=True)
+
+
+def run_batch(inputs, out_dir, roots=(), language="English", structured=False,
+              workers=DEFAULT_WORKERS, log=_log, limiter=None):
+    """
+    Process `inputs` with at most `workers` in flight, skipping those already in the
+    checkpoint. Returns a summary dict including throughput in reports per minute.
+    `limiter` replaces the process-wide Gemini rate limiter for this and later calls.
+    """
+    import analysis
+    if limiter is not None:
+        analysis.gemini_limiter = limiter
+        metrics.register("gemini_limiter", limiter.stats)
+    gemini_limiter = analysis.gemini_limiter
+
+    os.makedirs(out_dir, exist_ok=True)
+    checkpoint = Checkpoint(os.path.join(out_dir, CHECKPOINT_NAME))
+    pending, skipped = [], 0
+    for path in inputs:
+        upload = LocalFile(path)
+        try:
+            digest = hashlib.sha256(upload.getvalue()).hexdigest()
+        except OSError as e:
+            log(f"   ✗ {path}: {e}")
+            checkpoint.record({"input": path, "key": None, "status": "failed", "error": str(e)})
+            continue
+        upload._data = None  # re-read by the worker; don't hold every file in memory
+        key = f"{digest}:{language}:{'json' if structured else 'md'}"
+        if checkpoint.is_done(key):
+            skipped += 1
+        else:
+            pending.append((path, upload, key))
+    log(f"📂 {len(pending)} report(s) to analyse, {skipped} already done (checkpoint)")
+
+    ok = failed = 0
+    started = time.perf_counter()
+    stems = output_stems(inputs, roots)  # over every input, so a skipped report keeps its name
+
+    def work(path, upload, key):
+        t0 = time.perf_counter()
+        outputs = analyze_file(upload, out_dir, stems[path], language, structured)
+        return outputs, time.perf_counter() - t0
+
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch")
+    try:
+        futures = {pool.submit(work, *item): item for item in pending}
+        for future in as_completed(futures):
+            path, _, key = futures[future]
+            entry = {"input": path, "key": key, "finished": time.time()}
+            try:
+                outputs, seconds = future.result()
+                entry.update(status="ok", seconds=round(seconds, 3), **outputs)
+                ok += 1
+            except Exception as e:
+                entry.update(status="failed", error=str(e))
+                failed += 1
+            checkpoint.record(entry)
+            done = ok + failed
+            rate = done / (time.perf_counter() - started) * 60
+            mark = "✓" if entry["status"] == "ok" else f"✗ {entry['error']}"
+            log(f"   [{done}/{len(pending)}] {os.path.basename(path)} {mark}  ({rate:.1f} reports/min)")
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        checkpoint.close()
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        "analysed": ok,
+        "failed": failed,
+        "skipped": skipped,
+        "elapsed_s": round(elapsed, 2),
+        "reports_per_min": round(ok / elapsed * 60, 2) if ok and elapsed > 0 else 0.0,
+        "limiter": gemini_limiter.stats(),
+    }
+    log(f"✅ {ok} analysed, {failed} failed, {skipped} skipped in {elapsed:.1f}s "
+        f"— {summary['reports_per_min']:.1f} reports/min "
+        f"(rate limited {summary['limiter']['rate_limited']}×, retried {summary['limiter']['retries']}×)")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="report files or folders")
+    parser.add_argument("--manifest", help="text file listing one report path per line")
+    parser.add_argument("--out", required=True, help="output folder for answers, PDFs and the checkpoint")
+    parser.add_argument("--language", default="English", choices=["English", "Urdu (اردو)"])
+    parser.add_argument("--structured", action="store_true", help="compact JSON answers instead of Markdown")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="reports in flight at once")
+    parser.add_argument("--rpm", type=float, help="model requests per minute (default REPORTSAY_GEMINI_RPM or 15)")
+    parser.add_argument("--stub", action="store_true", help="use the local stub model instead of Gemini")
+    parser.add_argument("--stub-latency", type=float, default=0.5, help="seconds per stub model call")
+    args = parser.parse_args(argv)
+
+    if not args.paths and not args.manifest:
+        parser.error("give report paths/folders or --manifest")
+    limiter = None
+    if args.rpm:
+        from rate_limit import RateLimiter, gemini_limiter
+        # Burst and retries still come from the REPORTSAY_GEMINI_* defaults
+        limiter = RateLimiter(rate_per_min=args.rpm, burst=gemini_limiter.burst,
+                              max_retries=gemini_limiter.max_retries)
+
+    from gemini_client import configure_gemini, use_gemini_backend
+    if args.stub:
+        from stub_gemini import StubGenAI
+        use_gemini_backend(StubGenAI(latency_s=args.stub_latency))
+    elif os.environ.get("GEMINI_API_KEY"):
+        configure_gemini(os.environ["GEMINI_API_KEY"])
+    else:
+        parser.error("set GEMINI_API_KEY, or pass --stub to run against the local stub model")
+
+    start_export()
+
+    inputs = find_inputs(args.paths, args.manifest)
+    summary = run_batch(inputs, args.out, roots=args.paths, language=args.language,
+                        structured=args.structured, workers=args.workers, limiter=limiter)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,898 @@
+"""
+Local benchmarks for ReportSay.
+Everything runs offline against local stand-ins: lab pages are served from recorded
+fixtures (fixtures/labs/, synthetic pages for labs not recorded yet), reports are
+generated PDFs and photos, and the model is the stub backend (stub_gemini.py).
+
+    python benchmark.py                                  # everything, human-readable
+    python benchmark.py --only lab_pages,pipeline        # a subset
+    python benchmark.py --json bench/$(git rev-parse --short HEAD).json
+    python benchmark.py --compare bench/old.json bench/new.json
+    python benchmark.py --record-fixtures                # live: save each registry lab page
+    python benchmark.py --accuracy samples/   # live: raw vs preprocessed uploads (needs GEMINI_API_KEY)
+
+--json writes every measurement as {bench, stage, seconds, peak_mb, ...} plus the commit
+and platform, so two runs can be compared with --compare.
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import reports
+import scraper
+
+# Simulated network latency of one lab rate page
+LAB_DELAY_S = 0.3
+# Recorded rate pages, one <slug>.html per registry lab (see --record-fixtures)
+FIXTURE_DIR = 'fixtures/labs'
+# --compare flags a stage as slower / faster beyond this relative change
+COMPARE_THRESHOLD = 0.10
+
+# Every measurement of this run, for --json
+RESULTS = []
+
+
+def record(bench, stage, seconds=None, peak_mb=None, **info):
+    """Keep one measurement for the machine-readable output."""
+    entry = {"bench": bench, "stage": stage}
+    if seconds is not None:
+        entry["seconds"] = round(seconds, 6)
+    if peak_mb is not None:
+        entry["peak_mb"] = round(peak_mb, 3)
+    entry.update(info)
+    RESULTS.append(entry)
+
+
+SAMPLE_PAGE = b"""<html><body><table>
+<tr><th>Test</th><th>Price</th></tr>
+<tr><td>Complete Blood Count (CBC)</td><td>Rs 800</td></tr>
+<tr><td>HbA1c</td><td>Rs 2,300</td></tr>
+<tr><td>Lipid Profile</td><td>Rs 2,500</td></tr>
+</table></body></html>"""
+
+
+class _SlowLabHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so the session pool is exercised
+
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        page = self.server.pages.get(self.path, SAMPLE_PAGE)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(page)))
+        self.end_headers()
+        self.wfile.write(page)
+
+    def log_message(self, *args):
+        pass
+
+
+class _StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # default backlog of 5 would serialise the connects
+
+
+def start_stand_in(pages=None, delay=LAB_DELAY_S):
+    """
+    Start a local lab-site stand-in on a free port. Returns (server, base_url).
+    `pages` maps URL paths to page bytes; any other path gets SAMPLE_PAGE.
+    """
+    server = _StandInServer(("127.0.0.1", 0), _SlowLabHandler)
+    server.pages = pages or {}
+    server.delay = delay
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def bench_scrape(base_url, lab_counts=(6, 20, 60)):
+    """Wall time of sequential vs concurrent scraping as the lab count grows."""
+    print(f"\n⏱️  Scrape wall time (each lab page takes {LAB_DELAY_S}s)")
+    print(f"   {'labs':>5} {'sequential':>12} {'concurrent':>12}")
+    for n in lab_counts:
+        lab_urls = {f"Lab {i}": f"{base_url}/lab/{i}" for i in range(n)}
+
+        start = time.perf_counter()
+        for url in lab_urls.values():
+            scraper.scrape_generic(url)
+        sequential = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = scraper.scrape_all(lab_urls)
+        concurrent = time.perf_counter() - start
+        assert all(results.values()), "stand-in pages should always parse"
+
+        print(f"   {n:>5} {sequential:>11.2f}s {concurrent:>11.2f}s")
+        record("scrape", f"{n} labs sequential", sequential, labs=n)
+        record("scrape", f"{n} labs concurrent", concurrent, labs=n)
+
+
+def make_catalog_page(rows=5000):
+    """Synthetic multi-megabyte rate page shaped like the big lab test lists."""
+    parts = ["<html><head><style>td { padding: 4px; }</style></head><body>",
+             "<table><tr><th>Code</th><th>Test Name</th><th>Sample</th><th>Rate</th></tr>"]
+    for i in range(rows):
+        parts.append(
+            f"<tr><td>{i:05d}</td><td><a href='/test/{i}'>Test Number {i} &amp; Panel</a></td>"
+            f"<td>Serum <span>(5 ml)</span></td><td>Rs {500 + i % 9000:,}</td></tr>"
+        )
+    parts.append("</table></body></html>")
+    return "".join(parts).encode("utf-8")
+
+
+def _slug(lab_name):
+    return re.sub(r"[^a-z0-9]+", "-", lab_name.lower()).strip("-")
+
+
+def fixture_path(lab_name):
+    return os.path.join(FIXTURE_DIR, f"{_slug(lab_name)}.html")
+
+
+def make_lab_page(lab, rows=3000):
+    """Synthetic rate page for a lab with no recorded fixture: its fallback tests in a full catalog."""
+    tests = [(f"{name} (Serum)", price) for name, price in lab.fallback_prices.items()]
+    tests += [(f"Test Number {i} &amp; Panel", 500 + i % 9000) for i in range(rows - len(tests))]
+    parts = ["<html><body><table id='rates'><tr><th>Code</th><th>Test Name</th><th>Sample</th><th>Rate</th></tr>"]
+    for i, (name, price) in enumerate(tests):
+        parts.append(f"<tr><td>{i:05d}</td><td>{name}</td><td>Blood</td><td>Rs {price:,}</td></tr>")
+    parts.append("</table></body></html>")
+    return "".join(parts).encode("utf-8")
+
+
+def record_fixtures():
+    """Live: save every registry lab's rate page under FIXTURE_DIR for the offline benchmarks."""
+    from lab_registry import LabRegistry
+    registry = LabRegistry.load()
+    with scraper.make_session() as session:
+        for lab in registry.labs:
+            try:
+                res = session.get(lab.url, timeout=scraper.timeout_for(lab.url))
+                res.raise_for_status()
+            except Exception as e:
+                print(f"   ✗ {lab.name}: {e}")
+                continue
+            scraper.save_bytes(fixture_path(lab.name), res.content)
+            print(f"   ✓ {lab.name}: {len(res.content) / 1024:,.0f} KB → {fixture_path(lab.name)}")
+
+
+def bench_lab_pages():
+    """Every registry lab's page through the scraper stages: fetch, parse, normalize, catalog."""
+    from lab_registry import LabRegistry
+    registry = LabRegistry.load()
+    pages, sources = {}, {}
+    for lab in registry.labs:
+        path = fixture_path(lab.name)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                pages[f"/{_slug(lab.name)}"] = f.read()
+            sources[lab.name] = "recorded"
+        else:
+            pages[f"/{_slug(lab.name)}"] = make_lab_page(lab)
+            sources[lab.name] = "synthetic"
+
+    server, base_url = start_stand_in(pages, delay=0)
+    try:
+        timings = {}
+        urls = {lab.name: f"{base_url}/{_slug(lab.name)}" for lab in registry.labs}
+        live = scraper.scrape_all(urls, extract={lab.name: lab.extract for lab in registry.labs}, timings=timings)
+    finally:
+        server.shutdown()
+
+    print(f"\n⏱️  Lab pages ({sum(s == 'recorded' for s in sources.values())} recorded, "
+          f"{sum(s == 'synthetic' for s in sources.values())} synthetic fixtures)")
+    print(f"   {'lab':<18} {'KB':>6} {'rows':>6} {'parse':>8} {'peak MB':>8} {'normalize':>10} {'catalog':>8}")
+    for lab in registry.labs:
+        page, rows = pages[f"/{_slug(lab.name)}"], live[lab.name] or {}
+        parse_s, parse_mb, _ = _measure(scraper.stream_price_table, page, "utf-8", lab.extract)
+        start = time.perf_counter()
+        scraper.normalize_and_merge(rows, lab.fallback_prices)
+        normalize_s = time.perf_counter() - start
+        start = time.perf_counter()
+        scraper.build_catalog(rows)
+        catalog_s = time.perf_counter() - start
+        print(f"   {lab.name[:18]:<18} {len(page) / 1024:>6,.0f} {len(rows):>6} {parse_s * 1000:>6.1f}ms "
+              f"{parse_mb:>8.1f} {normalize_s * 1000:>8.1f}ms {catalog_s * 1000:>6.1f}ms")
+        info = {"fixture": sources[lab.name], "bytes": len(page), "rows": len(rows)}
+        record("lab_pages", f"{lab.name} fetch", timings[lab.name]["fetch_s"], **info)
+        record("lab_pages", f"{lab.name} parse", parse_s, parse_mb, **info)
+        record("lab_pages", f"{lab.name} normalize", normalize_s, **info)
+        record("lab_pages", f"{lab.name} catalog", catalog_s, **info)
+
+
+def _measure(fn, *args):
+    """(seconds, peak traced MB, result) — timed untraced, then re-run under tracemalloc."""
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def bench_parse(rows=20000):
+    """Full soup tree vs streaming row extraction on one large page."""
+    page = make_catalog_page(rows)
+    soup_s, soup_mb, soup_rows = _measure(scraper.parse_price_table, page.decode("utf-8"))
+    stream_s, stream_mb, stream_rows = _measure(scraper.stream_price_table, page)
+    assert soup_rows == stream_rows, "streaming extraction must match the soup parser"
+
+    print(f"\n⏱️  Parse {len(page) / 1024 / 1024:.1f} MB page ({rows} rows)")
+    print(f"   {'path':>10} {'time':>9} {'peak MB':>9}")
+    print(f"   {'soup':>10} {soup_s:>8.2f}s {soup_mb:>9.1f}")
+    print(f"   {'stream':>10} {stream_s:>8.2f}s {stream_mb:>9.1f}")
+    record("parse", "soup", soup_s, soup_mb, rows=rows)
+    record("parse", "stream", stream_s, stream_mb, rows=rows)
+
+
+def _legacy_classify(raw_names):
+    """The pre-matcher nested keyword loop, kept here for comparison."""
+    categories = []
+    for raw_name in raw_names:
+        found = None
+        for std_name, keywords in scraper.TARGET_MAP.items():
+            if any(k in raw_name.lower() for k in keywords):
+                found = std_name
+                break
+        categories.append(found)
+    return categories
+
+
+def bench_normalize(rows=5000, labs=30):
+    """Classify full lab catalogs: nested keyword loops vs the compiled matcher."""
+    stems = ["Serum Sodium", "Complete Blood Count", "HbA1c", "Lipid Profile", "Urine C/E",
+             "Serum Creatinine", "Free T4", "Vitamin D 25-Hydroxy", "Ferritin", "Liver Function Test"]
+    names = [f"{stems[i % len(stems)]} {i}" for i in range(rows)]
+
+    start = time.perf_counter()
+    for _ in range(labs):
+        _legacy_classify(names)
+    legacy = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(labs):
+        scraper.classify_names(names)
+    compiled = time.perf_counter() - start
+
+    print(f"\n⏱️  Classify {labs} labs × {rows} rows")
+    print(f"   nested loops: {legacy * 1000:>8.1f} ms")
+    print(f"   compiled:     {compiled * 1000:>8.1f} ms")
+    record("normalize", "nested loops", legacy, labs=labs, rows=rows)
+    record("normalize", "compiled", compiled, labs=labs, rows=rows)
+
+
+def bench_price_snapshot(reruns=2000):
+    """Tab 2's per-rerun price load: read + parse the JSON (old) vs the shared snapshot."""
+    import price_snapshot
+    path = scraper.PRICES_PATH
+
+    def read_every_rerun():
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                json.load(f)
+            os.path.getmtime(path)
+
+    store = price_snapshot.SnapshotStore(price_snapshot.PRICE_MATRIX_PATH, price_snapshot._load_prices)
+    store.get()
+    timings = []
+    for fn in (read_every_rerun, store.get):
+        start = time.perf_counter()
+        for _ in range(reruns):
+            fn()
+        timings.append((time.perf_counter() - start) / reruns)
+    print(f"\n⏱️  Price data per rerun ({path})")
+    print(f"   read + parse every rerun: {timings[0] * 1e6:>8.1f} µs")
+    print(f"   shared snapshot:          {timings[1] * 1e6:>8.1f} µs")
+    record("price_snapshot", "read + parse every rerun", timings[0])
+    record("price_snapshot", "shared snapshot", timings[1])
+
+
+def bench_price_matrix(labs=300, tests=5000):
+    """Nested-dict JSON vs the columnar matrix at scale: snapshot size, load time, memory, summaries."""
+    import random
+    from price_matrix import PriceMatrix
+
+    rng = random.Random(1)
+    names = [f"Test {t}" for t in range(tests)]
+    nested = {f"Lab {l}": {name: rng.randrange(300, 20000) for name in rng.sample(names, tests * 3 // 5)}
+              for l in range(labs)}
+    as_json = json.dumps(nested).encode()
+    matrix = PriceMatrix.from_nested(nested)
+    as_bin = matrix.to_bytes()
+
+    def dict_summaries(data):
+        out = {}
+        for name in names:
+            prices = [offers[name] for offers in data.values() if name in offers]
+            if prices:
+                out[name] = (min(prices), max(prices), sum(prices) // len(prices))
+        return out
+
+    json_load, json_mb, _ = _measure(json.loads, as_json)
+    bin_load, bin_mb, _ = _measure(PriceMatrix.from_bytes, as_bin)
+    start = time.perf_counter()
+    dict_summaries(nested)
+    dict_s = time.perf_counter() - start
+    start = time.perf_counter()
+    matrix.summaries()
+    matrix_s = time.perf_counter() - start
+
+    print(f"\n⏱️  Price table, {labs} labs × {tests} tests")
+    print(f"   {'format':>8} {'snapshot':>9} {'load':>8} {'peak MB':>8} {'all-test min/max/avg':>21}")
+    print(f"   {'json':>8} {len(as_json) / 1024 / 1024:>7.1f}MB {json_load * 1000:>6.0f}ms {json_mb:>8.1f} {dict_s * 1000:>19.0f}ms")
+    print(f"   {'matrix':>8} {len(as_bin) / 1024 / 1024:>7.1f}MB {bin_load * 1000:>6.1f}ms {bin_mb:>8.1f} {matrix_s * 1000:>19.0f}ms")
+    record("price_matrix", "json load", json_load, json_mb, bytes=len(as_json))
+    record("price_matrix", "matrix load", bin_load, bin_mb, bytes=len(as_bin))
+    record("price_matrix", "dict summaries", dict_s)
+    record("price_matrix", "matrix summaries", matrix_s)
+
+
+def bench_basket(labs=150, tests=5000, runs=20):
+    """Basket optimizer on a full catalog: worst-of-`runs` time per basket size and split limit."""
+    import random
+    from basket import MAX_SPLIT_LABS, optimize_basket
+    from price_matrix import PriceMatrix
+
+    rng = random.Random(1)
+    names = [f"Test {t}" for t in range(tests)]
+    list_price = {name: rng.randrange(300, 8000) for name in names}
+    nested = {}
+    for l in range(labs):  # labs have a price level and list 40–98% of the catalog
+        level, coverage = rng.uniform(0.6, 1.6), rng.uniform(0.4, 0.98)
+        nested[f"Lab {l}"] = {name: int(round(list_price[name] * level * rng.uniform(0.85, 1.15), -1))
+                              for name in names if rng.random() < coverage}
+    matrix = PriceMatrix.from_nested(nested)
+
+    print(f"\n⏱️  Basket optimizer, {labs} labs × {tests} tests (worst of {runs} baskets)")
+    print(f"   {'tests':>6}" + "".join(f"{f'≤{k} lab' + ('s' if k > 1 else ''):>10}" for k in range(1, MAX_SPLIT_LABS + 1)))
+    for size in (5, 10, 20):
+        baskets = [rng.sample(names, size) for _ in range(runs)]
+        row = []
+        for k in range(1, MAX_SPLIT_LABS + 1):
+            worst = 0
+            for basket in baskets:
+                start = time.perf_counter()
+                optimize_basket(matrix, basket, max_labs=k)
+                worst = max(worst, time.perf_counter() - start)
+            row.append(f"{worst * 1000:>8.1f}ms")
+            record("basket", f"{size} tests, up to {k} labs", worst, labs=labs)
+        print(f"   {size:>6}" + "".join(row))
+
+
+def bench_price_history(days=180, labs=30, tests=300):
+    """Append-only history: per-scrape write cost and trend / biggest-change queries."""
+    import datetime
+    import random
+    import tempfile
+    from price_history import PriceHistory
+
+    rng = random.Random(1)
+    data = {f"Lab {l}": {("CBC" if t == 0 else f"Test {t}"): 500 + 10 * t for t in range(tests)} for l in range(labs)}
+    first = datetime.date(2025, 1, 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        history = PriceHistory(os.path.join(tmp, "history.sqlite"))
+        start = time.perf_counter()
+        for d in range(days):
+            for prices in data.values():  # ~1% of prices move each day
+                for name in rng.sample(list(prices), 3):
+                    prices[name] = int(prices[name] * rng.uniform(0.9, 1.15))
+            history.record_snapshot(data, observed=first + datetime.timedelta(days=d))
+        per_scrape = (time.perf_counter() - start) / days
+        size_kb = os.path.getsize(history.path) / 1024
+        today = first + datetime.timedelta(days=days - 1)
+        queries = {
+            "CBC trend, 12 months": lambda: history.trend_table("CBC", today - datetime.timedelta(days=365), today),
+            "biggest changes, 7 days": lambda: history.biggest_changes(7, today=today),
+        }
+        print(f"\n⏱️  Price history: {days} daily scrapes × {labs} labs × {tests} tests "
+              f"({days * labs * tests:,} prices, {size_kb:,.0f} KB stored)")
+        print(f"   record one scrape:       {per_scrape * 1000:>7.1f} ms")
+        record("price_history", "record one scrape", per_scrape, kb=round(size_kb))
+        for label, query in queries.items():
+            start = time.perf_counter()
+            query()
+            elapsed = time.perf_counter() - start
+            print(f"   {label + ':':<24} {elapsed * 1000:>7.1f} ms")
+            record("price_history", label, elapsed)
+
+
+def make_report_pdf(pages=3):
+    """Synthetic lab report: a results table per page."""
+    import fitz  # PyMuPDF
+    doc = fitz.open()
+    for p in range(pages):
+        page = doc.new_page()  # A4
+        page.insert_text((50, 50), f"CHUGHTAI LAB — Patient Report (page {p + 1})", fontsize=14)
+        for row in range(40):
+            page.insert_text((50, 90 + row * 18),
+                             f"Test {row:02d}   Hemoglobin   {12 + row % 5}.{row % 10} g/dL   (13.0 - 17.0)",
+                             fontsize=10)
+    return doc.tobytes()
+
+
+def make_scanned_pdf(pdf_bytes):
+    """The same report as an image-only PDF, like a scan — no text layer."""
+    import fitz  # PyMuPDF
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as src, fitz.open() as out:
+        for page in src:
+            scan = page.get_pixmap(dpi=200).tobytes("jpeg", jpg_quality=85)
+            out.new_page(width=page.rect.width, height=page.rect.height).insert_image(page.rect, stream=scan)
+        return out.tobytes()
+
+
+def make_phone_photo(pdf_bytes):
+    """~10 MP colour 'photo' of a report page, with sensor noise."""
+    from PIL import Image
+    import fitz  # PyMuPDF
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        pix = doc[0].get_pixmap(dpi=330)
+    page = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+    noise = Image.effect_noise(page.size, 12).convert("RGB")
+    photo = Image.blend(page, noise, 0.08)
+    buffer = io.BytesIO()
+    photo.save(buffer, format="JPEG", quality=92)
+    return buffer.getvalue()
+
+
+class _Upload:
+    """Just enough of Streamlit's UploadedFile for open_uploaded_file."""
+
+    def __init__(self, data, mime, name="report"):
+        self._data, self.type, self.name = data, mime, name
+
+    def getvalue(self):
+        return self._data
+
+
+def _rendered_pages(upload):
+    """open_uploaded_file, but with every PDF page rendered (not just a text-layer preview)."""
+    if upload.type == "application/pdf":
+        return reports.render_pdf_pages(upload.getvalue())[0], None
+    return reports.open_uploaded_file(upload)
+
+
+def _sdk_bytes(pages):
+    """What the SDK would upload for raw PIL pages (lossless WebP)."""
+    total = 0
+    for page in pages:
+        buffer = io.BytesIO()
+        page.save(buffer, format="webp", lossless=True)
+        total += len(buffer.getvalue())
+    return total
+
+
+def bench_upload():
+    """Bytes sent per request: raw PIL pages vs the preprocessing stage."""
+    pdf = make_report_pdf()
+    samples = {
+        "3-page PDF": _Upload(pdf, "application/pdf"),
+        "phone photo": _Upload(make_phone_photo(pdf), "image/jpeg"),
+    }
+    print("\n⏱️  Upload size per request")
+    print(f"   {'input':>12} {'raw':>10} {'prepared':>10} {'prep time':>10}")
+    for label, upload in samples.items():
+        pages, error = _rendered_pages(upload)
+        assert error is None, error
+        _, stats = reports.prepare_pages(pages)
+        raw_bytes = _sdk_bytes(pages)
+        print(f"   {label:>12} {raw_bytes / 1024:>8,.0f}KB {stats['bytes'] / 1024:>8,.0f}KB "
+              f"{stats['preprocess_s']:>9.2f}s")
+        record("upload", label, stats["preprocess_s"], raw_bytes=raw_bytes, bytes=stats["bytes"])
+
+
+def _estimated_tokens(stats, pages):
+    """Rough input tokens: ~4 chars per text token, 258 per 768 px image tile (Gemini's rule)."""
+    if stats["mode"] == "text":
+        return stats["bytes"] // 4
+    tiles = 0
+    for page in pages:
+        scale = min(1.0, reports.TARGET_LONG_EDGE / max(page.size))
+        w, h = page.width * scale, page.height * scale
+        tiles += -(-int(w) // 768) * -(-int(h) // 768)
+    return tiles * 258
+
+
+def bench_text_layer():
+    """Digital PDFs: text-layer fast path vs rasterised pages."""
+    pdf = make_report_pdf()
+    print("\n⏱️  PDF payload: text layer vs rendered pages")
+    print(f"   {'input':>12} {'path':>6} {'payload':>9} {'prep time':>10} {'~tokens':>8}")
+    for label, data in (("digital PDF", pdf), ("scanned PDF", make_scanned_pdf(pdf))):
+        pages, error = _rendered_pages(_Upload(data, "application/pdf"))
+        assert error is None, error
+        runs = [("auto", reports.prepare_pages(pages, data)), ("image", reports.prepare_pages(pages))]
+        for path, (_, stats) in runs:
+            mode = stats['mode'] if path == 'auto' else 'image'
+            tokens = _estimated_tokens(stats, pages)
+            print(f"   {label:>12} {mode:>6} "
+                  f"{stats['bytes'] / 1024:>7,.1f}KB {stats['preprocess_s']:>9.2f}s "
+                  f"{tokens:>8,}")
+            record("text_layer", f"{label} as {mode}", stats["preprocess_s"], bytes=stats["bytes"], tokens=tokens)
+
+
+def bench_quick_check(runs=1000):
+    """Local reference-range check on a digital PDF, with no model call."""
+    import reference_ranges
+    text = reports.extract_pdf_text(make_report_pdf())
+    values = reference_ranges.extract_values(text)
+    start = time.perf_counter()
+    for _ in range(runs):
+        reference_ranges.extract_values(text)
+    extract = (time.perf_counter() - start) / runs
+    start = time.perf_counter()
+    for _ in range(runs):
+        results = reference_ranges.evaluate(values)
+    evaluate = (time.perf_counter() - start) / runs
+    print(f"\n⏱️  Quick check ({len(results)} value(s) flagged locally)")
+    print(f"   extract values: {extract * 1e6:>8.0f} µs")
+    print(f"   evaluate:       {evaluate * 1e6:>8.0f} µs")
+    record("quick_check", "extract values", extract)
+    record("quick_check", "evaluate", evaluate, values=len(results))
+
+
+def bench_metrics(runs=100_000):
+    """Cost of one stage span with metrics off (the default) and on, and of one export."""
+    from metrics import Metrics
+    costs = {}
+    for label, enabled in (("off", False), ("on", True)):
+        m = Metrics(enabled=enabled)
+        start = time.perf_counter()
+        for _ in range(runs):
+            with m.span("model"):
+                pass
+        costs[label] = (time.perf_counter() - start) / runs
+    start = time.perf_counter()
+    text = m.to_prometheus()
+    export = time.perf_counter() - start
+    print("\n⏱️  Metrics span overhead")
+    print(f"   metrics off:  {costs['off'] * 1e9:>8.0f} ns per span")
+    print(f"   metrics on:   {costs['on'] * 1e9:>8.0f} ns per span")
+    print(f"   export:       {export * 1000:>8.2f} ms ({len(text)} bytes of Prometheus text)")
+    record("metrics", "span, metrics off", costs["off"])
+    record("metrics", "span, metrics on", costs["on"])
+    record("metrics", "export", export)
+
+
+def make_long_analysis(tests=120):
+    """A long Markdown analysis like Gemini returns for a full multi-page panel."""
+    lines = ["---", "**🧪 Tests Detected**", ", ".join(f"Test {i}" for i in range(tests)), "", "**✅ Normal Results**"]
+    lines += [f"Test {i} → {10 + i % 7}.{i % 10} (*9.0 – 18.0*)" for i in range(tests)]
+    lines += ["", "**⚠️ Abnormal Results**"]
+    lines += [f"Test {i} → {20 + i % 5} (9.0 – 18.0) — **slightly high**, discuss with your doctor" for i in range(tests // 4)]
+    lines += ["", "**📋 Summary**", "Most values are within range. " * 6, "---"]
+    return "\n".join(lines)
+
+
+def make_structured_analysis(tests=120):
+    """make_long_analysis's content as the compact JSON mode returns it."""
+    rows = [[f"Test {i}", f"{10 + i % 7}.{i % 10}", "9.0 – 18.0"] for i in range(tests)]
+    rows += [[f"Test {i}", f"{20 + i % 5}", "9.0 – 18.0", "high", "Slightly high, discuss with your doctor"]
+             for i in range(tests // 4)]
+    return json.dumps({
+        "tests": [f"Test {i}" for i in range(tests)],
+        "results": rows,
+        "summary": "Most values are within range. " * 6,
+        "next_steps": [],
+    }, ensure_ascii=False, separators=(",", ":"))
+
+
+def bench_structured():
+    """Markdown vs structured JSON answer: size the model must generate, and render cost."""
+    import structured_report
+    markdown = make_long_analysis() + "\n⚕️ **Important Disclaimer:** " + structured_report.DISCLAIMER
+    answer = make_structured_analysis()
+    reports._pdf_report.__wrapped__("warm-up", "English", reports.generated_at())  # keep reportlab imports out of the timings
+    start = time.perf_counter()
+    markdown.replace("\n", "<br>")
+    reports._pdf_report.__wrapped__(markdown, "English", reports.generated_at())
+    md_render = time.perf_counter() - start
+    start = time.perf_counter()
+    report = structured_report.parse_structured_report(answer)
+    structured_report.to_html(report)
+    structured_report._structured_pdf.__wrapped__(answer, "English", reports.generated_at())
+    json_render = time.perf_counter() - start
+
+    print(f"\n⏱️  Analysis answer for {len(report.results)} results: Markdown vs structured JSON")
+    print(f"   {'mode':>10} {'answer':>9} {'~tokens':>8} {'HTML+PDF':>9}")
+    for mode, text, render in (("markdown", markdown, md_render), ("json", answer, json_render)):
+        print(f"   {mode:>10} {len(text.encode()) / 1024:>7.1f}KB {len(text) // 4:>8,} {render * 1000:>7.0f}ms")
+        record("structured", f"{mode} HTML+PDF", render, bytes=len(text.encode()))
+
+
+def bench_pdf(reruns=20):
+    """Per-rerun cost of the PDF export: rebuilt every rerun (old) vs memoized (new)."""
+    text = make_long_analysis()
+    build = reports._pdf_report.__wrapped__  # bypass the memo = the old behaviour
+
+    start = time.perf_counter()
+    for _ in range(reruns):
+        build(text, "English", reports.generated_at())
+    eager = (time.perf_counter() - start) / reruns
+
+    reports._pdf_report.cache_clear()
+    start = time.perf_counter()
+    reports.generate_pdf_report(text, "English")  # first download click
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(reruns):
+        reports.generate_pdf_report(text, "English")
+    memo = (time.perf_counter() - start) / reruns
+
+    print(f"\n⏱️  PDF export with a {len(text.splitlines())}-line analysis on screen")
+    print(f"   rebuilt every rerun:  {eager * 1000:>8.1f} ms/rerun")
+    print(f"   first download click: {first * 1000:>8.1f} ms")
+    print(f"   later clicks (memo):  {memo * 1000:>8.3f} ms")
+    print("   plain reruns now:        0.0 ms (PDF is built only on click)")
+    record("pdf", "rebuilt every rerun", eager)
+    record("pdf", "first download click", first)
+    record("pdf", "later clicks (memo)", memo)
+
+
+def bench_pipeline(stub_latency_s=0.0):
+    """
+    One report end to end on the stub model, per stage: open → analyse (fresh cache) →
+    analyse again (cache hit) → PDF export, with peak memory per stage.
+    stub_latency_s=0 leaves only ReportSay's own work in the timings.
+    """
+    import analysis
+    from analysis_cache import AnalysisCache
+    from gemini_client import use_gemini_backend
+    from rate_limit import RateLimiter
+    from stub_gemini import StubGenAI
+    import structured_report
+
+    use_gemini_backend(StubGenAI(latency_s=stub_latency_s))
+    analysis.gemini_limiter = RateLimiter(rate_per_min=1e6, burst=1000)  # stages, not throttling
+    digital = make_report_pdf()
+    inputs = {
+        "3-page PDF": (digital, "application/pdf"),
+        "8-page PDF": (make_report_pdf(pages=reports.MAX_PDF_PAGES), "application/pdf"),
+        "scanned PDF": (make_scanned_pdf(digital), "application/pdf"),
+        "phone photo": (make_phone_photo(digital), "image/jpeg"),
+    }
+    reports._pdf_report.__wrapped__("warm-up", "English", reports.generated_at())  # keep reportlab imports out of the timings
+
+    print(f"\n⏱️  Report pipeline on the stub model ({stub_latency_s * 1000:.0f} ms per call)")
+    print(f"   {'input':>12} {'mode':>8} {'open':>8} {'analyse':>9} {'cached':>8} {'PDF':>8} {'peak MB':>8}")
+    for label, (data, mime) in inputs.items():
+        for structured in (False, True):
+            upload = _Upload(data, mime)
+            open_s, open_mb, (pages, error) = _measure(reports.open_uploaded_file, upload)
+            assert error is None, error
+
+            def analyse_fresh():
+                analysis.analysis_cache = AnalysisCache()  # every run is a cache miss
+                return analysis.analyze_report(data, pages, "English", structured=structured)
+
+            analyse_s, analyse_mb, result = _measure(analyse_fresh)
+            cached_s, _, cached = _measure(analysis.analyze_report, data, pages, "English", None, None, structured)
+            assert cached["cached"]
+            build_pdf = (structured_report._structured_pdf if structured else reports._pdf_report).__wrapped__
+            pdf_s, pdf_mb, _ = _measure(build_pdf, result["text"], "English", reports.generated_at())
+
+            mode = "json" if structured else "markdown"
+            print(f"   {label:>12} {mode:>8} {open_s * 1000:>6.0f}ms {analyse_s * 1000:>7.0f}ms "
+                  f"{cached_s * 1000:>6.1f}ms {pdf_s * 1000:>6.0f}ms {max(open_mb, analyse_mb, pdf_mb):>8.1f}")
+            stats = result["upload_stats"]
+            record("pipeline", f"{label} {mode} open", open_s, open_mb, pages=len(pages))
+            record("pipeline", f"{label} {mode} analyse", analyse_s, analyse_mb,
+                   payload=stats["mode"], bytes=stats["bytes"], prepare_s=round(stats["preprocess_s"], 6))
+            record("pipeline", f"{label} {mode} analyse cached", cached_s)
+            record("pipeline", f"{label} {mode} pdf", pdf_s, pdf_mb, answer_bytes=len(result["text"].encode()))
+
+
+# Imported by a fresh process to render app.py once, headless
+_FIRST_PAINT = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=120)
+at.secrets["MY_API_KEY"] = "benchmark"
+at.run()
+elapsed = time.perf_counter() - start
+heavy = ["google.generativeai", "fitz", "reportlab", "requests", "numpy"]
+print(json.dumps({"first_paint_s": elapsed, "exceptions": len(at.exception),
+                  "loaded": [m for m in heavy if m in sys.modules]}))
+"""
+
+# Packages whose import cost we track for cold start regressions
+_TRACKED_IMPORTS = ("streamlit", "google.generativeai", "PIL", "fitz", "reportlab", "requests", "numpy",
+                    "analysis_cache", "assets", "catalog_index", "gemini_client", "reports")
+
+
+def parse_importtime(stderr):
+    """{top-level module: cumulative seconds} from `python -X importtime` output."""
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cum_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if cum_us.isdigit():
+            cumulative[name] = cumulative.get(name, 0) + int(cum_us) / 1e6
+    return cumulative
+
+
+def bench_startup():
+    """Cold start: time to first paint of app.py in a fresh process, and what it imported."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-W", "ignore", "-c", _FIRST_PAINT],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    imports = parse_importtime(proc.stderr)
+
+    print("\n⏱️  Cold start (fresh process, first script run)")
+    print(f"   time to first paint: {result['first_paint_s']:.2f}s  (exceptions: {result['exceptions']})")
+    print(f"   heavy modules loaded by then (incl. background warm-up): {', '.join(result['loaded']) or 'none'}")
+    record("startup", "first paint", result["first_paint_s"], exceptions=result["exceptions"])
+    for name in _TRACKED_IMPORTS:
+        if name in imports:
+            print(f"   import {name:<22} {imports[name] * 1000:>7.0f} ms")
+            record("startup", f"import {name}", imports[name])
+
+
+def _numbers(text):
+    return set(re.findall(r"\d+(?:\.\d+)?", text))
+
+
+def check_accuracy(sample_dir):
+    """
+    Live check that preprocessing doesn't cost accuracy: each sample report is analysed
+    from the raw pages and from the prepared upload, and the numbers quoted back are compared.
+    """
+    import google.generativeai as genai
+    from gemini_client import get_gemini_model
+
+    genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+    model, model_name = get_gemini_model()
+    assert model is not None, model_name
+    prompt = reports.build_analysis_prompt("English")
+
+    print(f"\n🔬 Accuracy check with {model_name}")
+    for name in sorted(os.listdir(sample_dir)):
+        path = os.path.join(sample_dir, name)
+        mime = "application/pdf" if name.lower().endswith(".pdf") else "image/jpeg"
+        with open(path, "rb") as f:
+            pages, error = _rendered_pages(_Upload(f.read(), mime, name))
+        if error:
+            print(f"   {name}: skipped ({error})")
+            continue
+        blobs, stats = reports.prepare_pages(pages)
+
+        start = time.perf_counter()
+        raw = model.generate_content([prompt, *pages]).text
+        raw_s = time.perf_counter() - start
+        start = time.perf_counter()
+        prepared = model.generate_content([prompt, *blobs]).text
+        prepared_s = time.perf_counter() - start
+
+        expected, got = _numbers(raw), _numbers(prepared)
+        agreement = len(expected & got) / len(expected) if expected else 1.0
+        print(f"   {name}: values agree {agreement:.0%} · {_sdk_bytes(pages) / 1024:,.0f}KB → "
+              f"{stats['bytes'] / 1024:,.0f}KB · {raw_s:.1f}s → {prepared_s:.1f}s")
+
+
+def _run_scrape():
+    server, base_url = start_stand_in()
+    try:
+        bench_scrape(base_url)
+    finally:
+        server.shutdown()
+
+
+# --only names, in run order; all of them run offline
+BENCHES = {
+    "scrape": _run_scrape,
+    "lab_pages": bench_lab_pages,
+    "parse": bench_parse,
+    "normalize": bench_normalize,
+    "price_snapshot": bench_price_snapshot,
+    "price_matrix": bench_price_matrix,
+    "basket": bench_basket,
+    "price_history": bench_price_history,
+    "upload": bench_upload,
+    "text_layer": bench_text_layer,
+    "quick_check": bench_quick_check,
+    "metrics": bench_metrics,
+    "structured": bench_structured,
+    "pdf": bench_pdf,
+    "pipeline": bench_pipeline,
+    "startup": bench_startup,
+}
+
+
+def run_metadata():
+    """Where these numbers came from, so saved runs can be told apart."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare_runs(old_path, new_path, threshold=COMPARE_THRESHOLD):
+    """
+    Print every stage measured in both runs with its change in time and peak memory.
+    Returns the number of stages slower than `threshold` (relative).
+    """
+    runs = []
+    for path in (old_path, new_path):
+        with open(path, "r") as f:
+            runs.append(json.load(f))
+    old = {(r["bench"], r["stage"]): r for r in runs[0]["results"]}
+    new = {(r["bench"], r["stage"]): r for r in runs[1]["results"]}
+    print(f"⚖️  {old_path} ({(runs[0]['meta'].get('commit') or '?')[:10]}) → "
+          f"{new_path} ({(runs[1]['meta'].get('commit') or '?')[:10]})")
+    print(f"   {'bench / stage':<48} {'before':>10} {'after':>10} {'change':>8} {'peak MB':>15}")
+    slower = 0
+    for key in [k for k in new if k in old]:
+        before, after = old[key].get("seconds"), new[key].get("seconds")
+        if before is None or after is None:
+            continue
+        change = (after - before) / before if before else 0.0
+        mark = ""
+        if change > threshold:
+            mark, slower = "  ▲ slower", slower + 1
+        elif change < -threshold:
+            mark = "  ▼ faster"
+        memory = ""
+        if "peak_mb" in old[key] and "peak_mb" in new[key]:
+            memory = f"{old[key]['peak_mb']:.1f} → {new[key]['peak_mb']:.1f}"
+        label = f"{key[0]} / {key[1]}"
+        print(f"   {label[:48]:<48} {before * 1000:>8.1f}ms {after * 1000:>8.1f}ms {change:>+7.0%} {memory:>15}{mark}")
+    only = sorted(set(old) ^ set(new))
+    if only:
+        print(f"   ({len(only)} stage(s) measured in only one run)")
+    return slower
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", help=f"comma-separated benches to run: {', '.join(BENCHES)}")
+    parser.add_argument("--json", metavar="PATH", help="also write every measurement to PATH")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two --json runs")
+    parser.add_argument("--threshold", type=float, default=COMPARE_THRESHOLD,
+                        help="relative slowdown --compare flags (default 0.10)")
+    parser.add_argument("--record-fixtures", action="store_true", help=f"live: save each lab page to {FIXTURE_DIR}/")
+    parser.add_argument("--accuracy", metavar="DIR", help="sample reports to compare raw vs preprocessed uploads")
+    args = parser.parse_args()
+
+    if args.compare:
+        raise SystemExit(1 if compare_runs(*args.compare, threshold=args.threshold) else 0)
+    if args.record_fixtures:
+        record_fixtures()
+        raise SystemExit(0)
+    if args.accuracy:
+        check_accuracy(args.accuracy)
+        raise SystemExit(0)
+
+    selected = args.only.split(",") if args.only else list(BENCHES)
+    unknown = [name for name in selected if name not in BENCHES]
+    if unknown:
+        parser.error(f"unknown bench(es): {', '.join(unknown)}")
+    for name in selected:
+        BENCHES[name]()
+
+    if args.json:
+        os.makedirs(os.path.dirname(args.json) or ".", exist_ok=True)
+        with open(args.json, "w") as f:
+            json.dump({"meta": run_metadata(), "results": RESULTS}, f, indent=1, ensure_ascii=False)
+        print(f"\n💾 {len(RESULTS)} measurements written to {args.json}")
@@ -0,0 +1,89 @@
+"""
+In-memory search over every lab's full test catalog (data/lab_catalog.json).
+Built once per data snapshot; each query only touches the postings of its own
+trigrams / word prefixes, never the whole catalog.
+"""
+import heapq
+import re
+from collections import Counter, defaultdict
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+# Word prefixes up to this length go into the prefix index (for 1–2 character queries)
+MAX_PREFIX = 3
+
+
+def normalize_name(name: str) -> str:
+    """Lowercase and collapse punctuation so "S. Creatinine" and "s creatinine" meet."""
+    return _NON_ALNUM.sub(' ', name.lower()).strip()
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CatalogIndex:
+    """Trigram + word-prefix index over {lab: {test name: price}}."""
+
+    def __init__(self, catalog: dict):
+        # One entry per distinct normalized name; offers = [(lab, original name, price)]
+        self.names = []
+        self.offers = []
+        ids = {}
+        for lab_name, tests in catalog.items():
+            for raw_name, price in tests.items():
+                if not isinstance(price, int):
+                    continue
+                key = normalize_name(raw_name)
+                if not key:
+                    continue
+                if key not in ids:
+                    ids[key] = len(self.names)
+                    self.names.append(key)
+                    self.offers.append([])
+                self.offers[ids[key]].append((lab_name, raw_name, price))
+
+        self._trigrams = defaultdict(list)
+        self._prefixes = defaultdict(list)
+        for doc_id, key in enumerate(self.names):
+            for gram in trigrams(key):
+                self._trigrams[gram].append(doc_id)
+            prefixes = {word[:n] for word in key.split() for n in range(1, MAX_PREFIX + 1)}
+            for prefix in prefixes:
+                self._prefixes[prefix].append(doc_id)
+
+    def __len__(self):
+        return len(self.names)
+
+    def search(self, query: str, limit: int = 10) -> list:
+        """
+        Ranked matches for free text. Returns [(test name, [(lab, lab's name, price), ...])],
+        best first, with each test's offers sorted cheapest first.
+        """
+        q = normalize_name(query)
+        if not q:
+            return []
+
+        if len(q) < 3:
+            candidates = {doc_id: 1.0 for doc_id in self._prefixes.get(q, ())}
+        else:
+            grams = trigrams(q)
+            hits = Counter()
+            for gram in grams:
+                hits.update(self._trigrams.get(gram, ()))
+            # Require most of the query's trigrams, so typos still match but noise doesn't
+            cutoff = len(grams) * 0.5
+            candidates = {doc_id: n / len(grams) for doc_id, n in hits.items() if n >= cutoff}
+
+        def rank(doc_id):
+            name = self.names[doc_id]
+            score = candidates[doc_id]
+            if name.startswith(q):
+                score += 0.5
+            elif f" {q}" in f" {name}":
+                score += 0.25
+            return (-score, len(name), name)
+
+        best = heapq.nsmallest(limit, candidates, key=rank)
+        return [(self.offers[d][0][1], sorted(self.offers[d], key=lambda o: o[2])) for d in best]
@@ -0,0 +1,5 @@
+"""pytest: the app's modules live at the repository root, so tests import them directly."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
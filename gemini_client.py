@@ -0,0 +1,150 @@
+"""
+Process-wide Gemini model resolution.
+Streamlit re-runs app.py on every interaction, but this module is imported once per
+process, so the model listing and the GenerativeModel instance are shared by every
+session instead of being rebuilt on each "Analyze" click.
+"""
+import threading
+import time
+
+from metrics import metrics
+
+# How long a model listing is trusted before it is refreshed in the background
+MODEL_TTL_S = 6 * 60 * 60
+
+
+def pick_model_name(models):
+    """Prefer flash (fast & cheap), then 1.5-pro, then anything that can generate content."""
+    names = [m.name for m in models if 'generateContent' in m.supported_generation_methods]
+    for name in names:
+        if 'flash' in name:
+            return name
+    for name in names:
+        if '1.5-pro' in name:
+            return name
+    return names[0] if names else None
+
+
+class ModelResolver:
+    """
+    Caches the chosen model name and a ready GenerativeModel for `ttl` seconds.
+    Only the very first call (or the first after invalidate()) waits on list_models();
+    a stale entry keeps being served while one background thread refreshes it. With no
+    model to serve, callers wait for a listing already in flight (e.g. warm()'s) rather
+    than starting another.
+    """
+
+    def __init__(self, genai=None, ttl=MODEL_TTL_S, clock=time.monotonic):
+        self._genai = genai
+        self._api_key = None
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._resolved = threading.Condition(self._lock)  # notified when a listing finishes
+        self._model = None
+        self._name = None
+        self._resolved_at = None
+        self._refreshing = False
+
+    @property
+    def genai(self):
+        # The SDK takes ~1 s to import, so it is loaded on first use, not at app start
+        if self._genai is None:
+            import google.generativeai as genai
+            if self._api_key:
+                genai.configure(api_key=self._api_key)
+            self._genai = genai
+        return self._genai
+
+    def configure(self, api_key):
+        """Set the API key; the SDK is only (re)configured if it has been imported already."""
+        if api_key == self._api_key:
+            return
+        self._api_key = api_key
+        if self._genai is not None and hasattr(self._genai, "configure"):
+            self._genai.configure(api_key=api_key)
+            self.invalidate()
+
+    def _resolve(self):
+        with metrics.span("list_models"):
+            name = pick_model_name(self.genai.list_models())
+        model = self.genai.GenerativeModel(name) if name else None
+        with self._lock:
+            self._model, self._name = model, name
+            self._resolved_at = self._clock()
+
+    def _refresh_in_background(self):
+        try:
+            self._resolve()
+        except Exception:
+            pass  # keep serving the previous model; the next stale call retries
+        finally:
+            with self._lock:
+                self._refreshing = False
+                self._resolved.notify_all()
+
+    def get(self):
+        """Return (model, model_name), or (None, error message) if nothing is usable."""
+        with self._lock:
+            while self._model is None and self._refreshing:
+                self._resolved.wait()  # nothing to serve yet: share the listing in flight
+            model, name, resolved_at = self._model, self._name, self._resolved_at
+            stale = resolved_at is not None and self._clock() - resolved_at >= self.ttl
+            if stale and model is not None and not self._refreshing:
+                self._refreshing = True
+                threading.Thread(target=self._refresh_in_background, daemon=True).start()
+            if model is not None:
+                return model, name
+            if resolved_at is not None and not stale:
+                return None, None  # listing succeeded recently but offered no usable model
+            self._refreshing = True  # later callers wait for this listing
+
+        try:
+            self._resolve()
+        except Exception as e:
+            return None, str(e)
+        finally:
+            with self._lock:
+                self._refreshing = False
+                self._resolved.notify_all()
+        with self._lock:
+            return self._model, self._name
+
+    def warm(self):
+        """Resolve in the background so the first analysis doesn't pay for list_models()."""
+        with self._lock:
+            if self._resolved_at is not None or self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_in_background, daemon=True).start()
+
+    def invalidate(self):
+        """Forget the cached model, e.g. after a model-not-found error."""
+        with self._lock:
+            self._model = self._name = self._resolved_at = None
+
+
+_resolver = ModelResolver()
+
+
+def configure_gemini(api_key):
+    _resolver.configure(api_key)
+
+
+def get_gemini_model():
+    """Get best available Gemini model with proper error handling."""
+    return _resolver.get()
+
+
+def warm_gemini_model():
+    _resolver.warm()
+
+
+def invalidate_gemini_model():
+    _resolver.invalidate()
+
+
+def use_gemini_backend(genai):
+    """Swap the SDK for a stand-in with the same surface (e.g. stub_gemini.StubGenAI)."""
+    global _resolver
+    _resolver = ModelResolver(genai=genai)
@@ -0,0 +1,94 @@
+"""
+Background job executor for analyses.
+Jobs run on a bounded, process-wide worker pool instead of the Streamlit script thread.
+The UI keeps only the job ID, polls for progress, and picks the result up on a later
+rerun or after a reconnect. The ID is an unguessable secret kept in the session's state
+only (never in the URL), so a job's analysis is readable by the session that started it.
+"""
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import metrics
+
+# Concurrent analyses per process; override with REPORTSAY_ANALYSIS_WORKERS
+MAX_WORKERS = 4
+# Finished jobs are kept this long for reconnecting users
+JOB_TTL_S = 60 * 60
+
+
+class Job:
+    """State of one background job, updated by the worker and read by the UI."""
+
+    def __init__(self, job_id):
+        self.id = job_id
+        self.status = "queued"  # queued → running → done | failed
+        self.message = ""
+        self.partial = ""
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+
+    @property
+    def done(self):
+        return self.status in ("done", "failed")
+
+
+class JobExecutor:
+    def __init__(self, max_workers=MAX_WORKERS, ttl=JOB_TTL_S):
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs) -> str:
+        """Queue fn(job, *args, **kwargs); its return value becomes job.result. Returns the job ID."""
+        job = Job(secrets.token_urlsafe(32))
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._pool.submit(self._run, job, fn, args, kwargs)
+        return job.id
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = "running"
+        metrics.observe("stage_seconds", time.time() - job.created, stage="job_wait")
+        try:
+            job.result = fn(job, *args, **kwargs)
+            status = "done"
+        except Exception as e:
+            job.error = e
+            status = "failed"
+        # finished before status: _prune may see the job as done at any moment
+        job.finished = time.time()
+        job.status = status
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if not job.done)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "active": sum(1 for job in self._jobs.values() if not job.done),
+                "tracked": len(self._jobs),
+            }
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        for job_id in [j.id for j in self._jobs.values() if j.done and j.finished is not None and j.finished < cutoff]:
+            del self._jobs[job_id]
+
+
+# Shared by every Streamlit session in this process
+analysis_jobs = JobExecutor(max_workers=int(os.environ.get("REPORTSAY_ANALYSIS_WORKERS", MAX_WORKERS)))
+metrics.register("analysis_jobs", analysis_jobs.stats)
@@ -0,0 +1,136 @@
+"""
+Declarative lab registry: every lab ReportSay covers, in one data file (data/labs.json).
+scraper.py fans out over it and app.py reads the same file, so adding a lab or a city is
+a data-only change. Each entry:
+
+    name             display name, also the key in the price files
+    city             e.g. "Lahore"; the Price Checker filters by it once there are several
+    url              rate page scraped every hour
+    location         map link (optional; defaults to a map search for "<name> <city>")
+    fallback_prices  {test: price} used when the page can't be scraped, and by the app
+                     when the live price file is unavailable
+    table            optional: which table(s) hold the rates — "#id", ".class" or a 0-based
+                     index among the page's <table>s; default every table on the page
+    columns          optional: {"name": i, "price": j}, 0-based cell positions in a row;
+                     default the name / price heuristics
+"""
+import json
+from urllib.parse import quote_plus
+
+REGISTRY_PATH = 'data/labs.json'
+
+_FIELDS = {"name", "city", "url", "location", "fallback_prices", "table", "columns"}
+
+
+class RegistryError(ValueError):
+    """A registry file that does not match the schema above."""
+
+
+def _check_table(name, table):
+    if table is None:
+        return
+    if isinstance(table, bool) or not (
+        (isinstance(table, int) and table >= 0)
+        or (isinstance(table, str) and len(table) > 1 and table[0] in "#.")
+    ):
+        raise RegistryError(f"{name}: table must be \"#id\", \".class\" or a table index, got {table!r}")
+
+
+def _check_columns(name, columns):
+    if columns is None:
+        return
+    if (not isinstance(columns, dict) or set(columns) != {"name", "price"}
+            or not all(isinstance(i, int) and not isinstance(i, bool) and i >= 0 for i in columns.values())
+            or columns["name"] == columns["price"]):
+        raise RegistryError(f"{name}: columns must be {{\"name\": i, \"price\": j}} with two different cell indices")
+
+
+class Lab:
+    def __init__(self, name, city, url, location=None, fallback_prices=None, table=None, columns=None):
+        self.name = name
+        self.city = city
+        self.url = url
+        self.location = location or f"https://www.google.com/maps/search/{quote_plus(f'{name} {city}')}"
+        self.fallback_prices = dict(fallback_prices or {})
+        self.table = table
+        self.columns = columns
+
+    @classmethod
+    def from_dict(cls, entry):
+        if not isinstance(entry, dict):
+            raise RegistryError("each lab must be an object")
+        name = entry.get("name")
+        if not isinstance(name, str) or not name.strip():
+            raise RegistryError("every lab needs a name")
+        unknown = set(entry) - _FIELDS
+        if unknown:
+            raise RegistryError(f"{name}: unknown field(s) {sorted(unknown)}")
+        for field in ("city", "url"):
+            if not isinstance(entry.get(field), str) or not entry[field].strip():
+                raise RegistryError(f"{name}: {field} is required")
+        if not entry["url"].startswith(("http://", "https://")):
+            raise RegistryError(f"{name}: url must be http(s)")
+        prices = entry.get("fallback_prices", {})
+        if not isinstance(prices, dict) or not all(
+            isinstance(p, int) and not isinstance(p, bool) and p > 0 for p in prices.values()
+        ):
+            raise RegistryError(f"{name}: fallback_prices must map test → positive integer price")
+        _check_table(name, entry.get("table"))
+        _check_columns(name, entry.get("columns"))
+        return cls(**entry)
+
+    @property
+    def extract(self):
+        """Extraction hints for scraper.scrape_generic, or None for the generic heuristics."""
+        hints = {key: value for key, value in (("table", self.table), ("columns", self.columns)) if value is not None}
+        return hints or None
+
+
+class LabRegistry:
+    def __init__(self, labs):
+        self.labs = tuple(labs)
+        self._by_name = {lab.name: lab for lab in self.labs}
+        if len(self._by_name) != len(self.labs):
+            raise RegistryError("duplicate lab names")
+        self._fallback_matrix = None
+
+    @classmethod
+    def from_json(cls, data):
+        if not isinstance(data, dict) or not isinstance(data.get("labs"), list):
+            raise RegistryError('registry must be {"labs": [...]}')
+        return cls(Lab.from_dict(entry) for entry in data["labs"])
+
+    @classmethod
+    def load(cls, path=REGISTRY_PATH):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_json(json.load(f))
+
+    def get(self, name):
+        return self._by_name.get(name)
+
+    def urls(self):
+        """{lab: rate page URL}, in registry order."""
+        return {lab.name: lab.url for lab in self.labs}
+
+    def fallback_prices(self):
+        """{lab: {test: price}} for every lab that has fallback prices."""
+        return {lab.name: dict(lab.fallback_prices) for lab in self.labs if lab.fallback_prices}
+
+    def fallback_matrix(self):
+        """fallback_prices() as a PriceMatrix, built once per registry."""
+        if self._fallback_matrix is None:
+            from price_matrix import PriceMatrix
+            self._fallback_matrix = PriceMatrix.from_nested(self.fallback_prices())
+        return self._fallback_matrix
+
+    def cities(self):
+        """Cities in registry order, so the first lab's city is the default."""
+        return list(dict.fromkeys(lab.city for lab in self.labs))
+
+    def labs_in(self, city):
+        return [lab.name for lab in self.labs if lab.city == city]
+
+    def location(self, name):
+        """Map link for a lab; labs missing from the registry get a generic search."""
+        lab = self._by_name.get(name)
+        return lab.location if lab else "https://www.google.com/maps/search/diagnostic+labs+lahore"
@@ -0,0 +1,281 @@
+"""
+Process-wide latency histograms and counters for the analysis pipeline and the scraper.
+Stages are wrapped in spans (`with metrics.span("model"):` or `@timed("decode")`) that
+feed one `stage_seconds{stage=...}` histogram; counters cover analyses, 429s, errors and
+cache hits, and the limiter / cache / job pool stats are read at export time.
+
+Off unless REPORTSAY_METRICS_FILE or REPORTSAY_METRICS_PORT is set; then start_export()
+writes the file every REPORTSAY_METRICS_INTERVAL_S (".json" → JSON, else Prometheus
+text) and/or serves /metrics and /metrics.json. While off, a span is one shared no-op
+object and counters return at once, so instrumented code pays a few attribute lookups.
+"""
+import atexit
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = "reportsay_"
+# Histogram bucket upper bounds in seconds: a cached lookup to a slow model call
+BUCKETS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+# How often the metrics file is rewritten; override with REPORTSAY_METRICS_INTERVAL_S
+EXPORT_INTERVAL_S = 15.0
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus style."""
+
+    def __init__(self, buckets=BUCKETS_S):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot: above every bound
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """[(upper bound, observations <= bound)], ending with ("+Inf", count)."""
+        total, out = 0, []
+        for bound, n in zip(self.buckets + ("+Inf",), self.counts):
+            total += n
+            out.append((bound, total))
+        return out
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    def __init__(self, metrics, stage, labels):
+        self._metrics = metrics
+        self._stage = stage
+        self._labels = labels
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._metrics.observe("stage_seconds", time.perf_counter() - self._started, stage=self._stage, **self._labels)
+        if exc_type is not None and issubclass(exc_type, Exception):
+            self._metrics.inc("errors_total", stage=self._stage, error=exc_type.__name__)
+        return False
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+
+class Metrics:
+    """
+    Counters and histograms keyed by name + labels, plus `collectors`: named
+    stats() callables (e.g. the rate limiter's) exported as gauges.
+    """
+
+    def __init__(self, enabled=False, buckets=BUCKETS_S):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = {}
+
+    def enable(self):
+        self.enabled = True
+
+    # ── recording ──
+    def inc(self, name, n=1, **labels):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def span(self, stage, **labels):
+        """Context manager timing one pipeline stage; an exception also counts as an error."""
+        if not self.enabled:
+            return _NOOP
+        return _Span(self, stage, labels)
+
+    def register(self, name, stats):
+        """Export stats() (a dict of numbers) as gauges named <name>_<key>."""
+        self._collectors[name] = stats
+
+    # ── export ──
+    def _collect(self):
+        gauges = {}
+        for name, stats in list(self._collectors.items()):
+            try:
+                values = stats()
+            except Exception:
+                continue  # a broken collector must not take the export down with it
+            gauges[name] = {k: v for k, v in values.items() if isinstance(v, (int, float))}
+        return gauges
+
+    def snapshot(self) -> dict:
+        """Everything recorded so far as plain JSON-able data."""
+        with self._lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self._counters.items())]
+            histograms = [{"name": name, "labels": dict(labels), "count": h.count, "sum": round(h.sum, 6),
+                           "buckets": h.cumulative()}
+                          for (name, labels), h in sorted(self._histograms.items())]
+        return {"timestamp": time.time(), "counters": counters, "histograms": histograms, "gauges": self._collect()}
+
+    def to_prometheus(self) -> str:
+        """The Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, h.cumulative(), h.sum, h.count) for key, h in self._histograms.items())
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {PREFIX}{name} counter")
+            lines.append(f"{PREFIX}{name}{_label_text(labels)} {value}")
+        for (name, labels), buckets, total, count in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {PREFIX}{name} histogram")
+            for bound, n in buckets:
+                lines.append(f"{PREFIX}{name}_bucket{_label_text(labels, [('le', str(bound))])} {n}")
+            lines.append(f"{PREFIX}{name}_sum{_label_text(labels)} {total:.6f}")
+            lines.append(f"{PREFIX}{name}_count{_label_text(labels)} {count}")
+        for collector, values in self._collect().items():
+            for key, value in values.items():
+                lines.append(f"# TYPE {PREFIX}{collector}_{key} gauge")
+                lines.append(f"{PREFIX}{collector}_{key} {int(value) if isinstance(value, bool) else value}")
+        return "\n".join(lines) + "\n"
+
+    def render(self, path) -> bytes:
+        if path.endswith(".json"):
+            return json.dumps(self.snapshot(), indent=1).encode("utf-8")
+        return self.to_prometheus().encode("utf-8")
+
+    def write(self, path):
+        """Atomically replace `path` with the current metrics."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(self.render(path))
+        os.replace(tmp, path)
+
+
+def timed(stage):
+    """Decorator form of metrics.span(stage)."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return fn(*args, **kwargs)
+            with metrics.span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path not in ("/metrics", "/metrics.json"):
+            self.send_error(404)
+            return
+        body = metrics.render(path)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json" if path.endswith(".json")
+                         else "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_export_lock = threading.Lock()
+_exporting = False
+
+
+def start_export():
+    """
+    Start the configured exporters once per process: the file writer (also run at exit)
+    and the HTTP endpoint. Does nothing when metrics are off.
+    """
+    global _exporting
+    env = os.environ
+    path = env.get("REPORTSAY_METRICS_FILE")
+    port = env.get("REPORTSAY_METRICS_PORT")
+    with _export_lock:
+        if _exporting or not metrics.enabled:
+            return
+        _exporting = True
+
+    if path:
+        interval = float(env.get("REPORTSAY_METRICS_INTERVAL_S", EXPORT_INTERVAL_S))
+
+        def write_quietly():
+            try:
+                metrics.write(path)
+            except OSError as e:
+                print(f"⚠️  Could not write metrics to {path}: {e}")
+
+        def write_forever():
+            while True:
+                time.sleep(interval)
+                write_quietly()
+
+        threading.Thread(target=write_forever, name="metrics-file", daemon=True).start()
+        atexit.register(write_quietly)
+    if port:
+        host = env.get("REPORTSAY_METRICS_HOST", "127.0.0.1")
+        try:
+            server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+        except OSError as e:  # e.g. another process already serves this port
+            print(f"⚠️  Metrics endpoint not started on {host}:{port}: {e}")
+            return
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+
+
+def _from_env():
+    env = os.environ
+    return Metrics(enabled=bool(env.get("REPORTSAY_METRICS_FILE") or env.get("REPORTSAY_METRICS_PORT")))
+
+
+# Shared by every Streamlit session in this process
+metrics = _from_env()
@@ -0,0 +1,211 @@
+"""
+Append-only price history in SQLite: one row per lab × test × day the price changed.
+scraper.py records each run's prices; only values that differ from the last known price
+are written, so years of hourly scrapes stay small. Trend and "biggest change" queries
+run off the primary key / date index in milliseconds.
+
+    python price_history.py --backfill    # import past snapshots from the git history
+"""
+import argparse
+import datetime
+import json
+import os
+import sqlite3
+import subprocess
+
+HISTORY_PATH = 'data/price_history.sqlite'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS price_changes (
+    test     TEXT NOT NULL,
+    lab      TEXT NOT NULL,
+    observed TEXT NOT NULL,      -- ISO date the new price was first seen
+    price    INTEGER,            -- NULL: the lab stopped listing the test
+    PRIMARY KEY (test, lab, observed)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS price_changes_observed ON price_changes (observed);
+
+-- Last known price per lab × test, so a scrape is diffed without scanning the history
+CREATE TABLE IF NOT EXISTS current_prices (
+    lab   TEXT NOT NULL,
+    test  TEXT NOT NULL,
+    price INTEGER,
+    since TEXT NOT NULL,
+    PRIMARY KEY (lab, test)
+) WITHOUT ROWID;
+"""
+
+
+def _as_price(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class PriceHistory:
+    def __init__(self, path=HISTORY_PATH):
+        self.path = path
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def _connect(self, readonly=False):
+        if readonly:
+            return sqlite3.connect(f"file:{os.path.abspath(self.path)}?mode=ro", uri=True)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        conn.executescript(_SCHEMA)
+        return conn
+
+    # ── writing ──
+    def record_snapshot(self, all_data, observed=None) -> int:
+        """
+        Record one scrape ({lab: {test: price}}) as of `observed` (a date, default today).
+        Only changed prices are written; tests a lab no longer lists get a NULL row.
+        Labs missing from all_data (e.g. their scrape failed) keep their last prices as is.
+        Returns the number of changes written.
+        """
+        day = (observed or datetime.date.today()).isoformat()
+        with self._connect() as conn:
+            current = {(lab, test): price for lab, test, price in
+                       conn.execute("SELECT lab, test, price FROM current_prices")}
+            seen = set()
+            changes = []
+            for lab, tests in all_data.items():
+                for test, value in tests.items():
+                    price = _as_price(value)
+                    if price is None:
+                        continue
+                    seen.add((lab, test))
+                    if current.get((lab, test), -1) != price:
+                        changes.append((test, lab, day, price))
+            changes += [(test, lab, day, None) for (lab, test), price in current.items()
+                        if price is not None and lab in all_data and (lab, test) not in seen]
+
+            # A second change on the same day replaces that day's row
+            conn.executemany("INSERT OR REPLACE INTO price_changes VALUES (?, ?, ?, ?)", changes)
+            conn.executemany(
+                "INSERT OR REPLACE INTO current_prices VALUES (?, ?, ?, ?)",
+                [(lab, test, price, day) for test, lab, day, price in changes],
+            )
+        conn.close()
+        return len(changes)
+
+    # ── queries ──
+    def trend(self, test, since=None):
+        """
+        {lab: [(date, price), ...]} for `test`, oldest first. With `since` (a date), each
+        lab's series starts with the price in effect on that day.
+        """
+        if not self.exists():
+            return {}
+        since_day = since.isoformat() if since else ""
+        conn = self._connect(readonly=True)
+        try:
+            rows = conn.execute(
+                """
+                SELECT lab, observed, price FROM price_changes
+                WHERE test = ? AND observed >= ?
+                UNION ALL
+                SELECT p.lab, ?, p.price FROM price_changes p
+                WHERE p.test = ? AND p.observed = (
+                    SELECT MAX(observed) FROM price_changes
+                    WHERE test = p.test AND lab = p.lab AND observed < ?)
+                ORDER BY 1, 2
+                """,
+                (test, since_day, since_day, test, since_day),
+            ).fetchall() if since else conn.execute(
+                "SELECT lab, observed, price FROM price_changes WHERE test = ? ORDER BY lab, observed",
+                (test,),
+            ).fetchall()
+        finally:
+            conn.close()
+        series = {}
+        for lab, day, price in rows:
+            series.setdefault(lab, []).append((datetime.date.fromisoformat(day), price))
+        return series
+
+    def trend_table(self, test, since=None, until=None):
+        """
+        The trend as chart columns: {"Date": [...], lab: [price on that date, ...]},
+        one row per change date with each lab's price carried forward.
+        """
+        series = self.trend(test, since)
+        if not series:
+            return {}
+        dates = sorted({day for points in series.values() for day, _ in points} | ({until} if until else set()))
+        table = {"Date": dates}
+        for lab, points in sorted(series.items()):
+            column, price, i = [], None, 0
+            for day in dates:
+                while i < len(points) and points[i][0] <= day:
+                    price = points[i][1]
+                    i += 1
+                column.append(price)
+            table[lab] = column
+        return table
+
+    def biggest_changes(self, days=7, limit=10, today=None):
+        """
+        Largest relative price moves first seen in the last `days` days:
+        [(lab, test, old_price, new_price, date), ...].
+        """
+        if not self.exists():
+            return []
+        cutoff = ((today or datetime.date.today()) - datetime.timedelta(days=days)).isoformat()
+        conn = self._connect(readonly=True)
+        try:
+            rows = conn.execute(
+                """
+                SELECT lab, test, old_price, price, observed FROM (
+                    SELECT c.lab, c.test, c.price, c.observed,
+                           (SELECT price FROM price_changes
+                            WHERE test = c.test AND lab = c.lab AND observed < c.observed
+                            ORDER BY observed DESC LIMIT 1) AS old_price
+                    FROM price_changes c
+                    WHERE c.observed > ? AND c.price IS NOT NULL
+                )
+                WHERE old_price IS NOT NULL AND old_price > 0 AND old_price != price
+                ORDER BY ABS(price - old_price) * 1.0 / old_price DESC
+                LIMIT ?
+                """,
+                (cutoff, limit),
+            ).fetchall()
+        finally:
+            conn.close()
+        return [(lab, test, old, new, datetime.date.fromisoformat(day)) for lab, test, old, new, day in rows]
+
+
+def backfill_from_git(history, prices_path='data/lab_prices.json'):
+    """Replay every committed version of the price file into the history, oldest first."""
+    log = subprocess.run(
+        ["git", "log", "--reverse", "--format=%H %cs", "--", prices_path],
+        capture_output=True, text=True, check=True,
+    ).stdout.split("\n")
+    written = 0
+    for line in filter(None, log):
+        commit, day = line.split()
+        blob = subprocess.run(["git", "show", f"{commit}:{prices_path}"], capture_output=True, text=True)
+        if blob.returncode != 0:
+            continue  # the file was deleted in this commit
+        try:
+            snapshot = json.loads(blob.stdout)
+        except ValueError:
+            continue
+        written += history.record_snapshot(snapshot, observed=datetime.date.fromisoformat(day))
+    return written
+
+
+# Shared by every Streamlit session in this process (each query opens its own read-only connection)
+price_history = PriceHistory()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backfill", action="store_true", help="import past snapshots from git history")
+    args = parser.parse_args()
+    if args.backfill:
+        print(f"✅ {backfill_from_git(price_history)} price changes recorded in {price_history.path}")
+    else:
+        parser.print_help()
@@ -0,0 +1,194 @@
+"""
+Canonical labs × tests price matrix.
+Lab and test names are interned into ID tables and prices live in one int32 NumPy array
+(0 = not offered), so min / max / average / cheapest-lab queries are vectorised and the
+whole table costs 4 bytes per cell. scraper.py writes it as a compact binary snapshot:
+
+    magic b"RSPRICE1" · uint32 header length · JSON header {version, labs, tests, dtype}
+    · zero padding to a 16-byte boundary · labs × tests little-endian int32, row-major
+
+The header is validated on load and the price block can be memory-mapped.
+"""
+import json
+import struct
+
+import numpy as np
+
+PRICE_MATRIX_PATH = 'data/lab_prices.bin'
+
+MAGIC = b"RSPRICE1"
+FORMAT_VERSION = 1
+DTYPE = "<i4"
+MISSING = 0
+_ALIGN = 16
+_NO_PRICE = np.iinfo(np.int32).max
+
+
+class PriceDataError(ValueError):
+    """Price data that does not fit the labs × tests schema."""
+
+
+def _check_names(names, kind):
+    if not isinstance(names, list) or not all(isinstance(n, str) and n for n in names):
+        raise PriceDataError(f"{kind} must be a list of non-empty strings")
+    if len(set(names)) != len(names):
+        raise PriceDataError(f"duplicate {kind}")
+
+
+class PriceMatrix:
+    def __init__(self, labs, tests, prices):
+        self.labs = tuple(labs)
+        self.tests = tuple(tests)
+        self.prices = prices
+        self.prices.flags.writeable = False  # shared by every session
+        self._lab_ids = {name: i for i, name in enumerate(self.labs)}
+        self._test_ids = {name: j for j, name in enumerate(self.tests)}
+
+    # ── building ──
+    @classmethod
+    def from_nested(cls, data, strict=True):
+        """
+        Build from {lab: {test: price}}. Prices must be positive integers; with strict=False
+        anything else (e.g. a nested dict) is dropped instead of raising PriceDataError.
+        """
+        if not isinstance(data, dict):
+            raise PriceDataError("price data must map lab → {test: price}")
+        labs, tests, test_ids, cells = [], [], {}, []
+        for lab, offers in data.items():
+            if not isinstance(offers, dict):
+                if strict:
+                    raise PriceDataError(f"{lab}: expected a mapping of test → price")
+                continue
+            i = len(labs)
+            labs.append(lab)
+            for test, price in offers.items():
+                if isinstance(price, bool) or not isinstance(price, int) or price <= 0 or price > _NO_PRICE:
+                    if strict:
+                        raise PriceDataError(f"{lab} → {test}: price must be a positive integer, got {price!r}")
+                    continue
+                if test not in test_ids:
+                    test_ids[test] = len(tests)
+                    tests.append(test)
+                cells.append((i, test_ids[test], price))
+        prices = np.full((len(labs), len(tests)), MISSING, dtype=DTYPE)
+        if cells:
+            rows, cols, values = zip(*cells)
+            prices[list(rows), list(cols)] = values
+        return cls(labs, tests, prices)
+
+    def to_nested(self):
+        return {
+            lab: {self.tests[j]: int(p) for j, p in enumerate(row) if p != MISSING}
+            for lab, row in zip(self.labs, self.prices.tolist())
+        }
+
+    def select_labs(self, labs):
+        """A matrix with just these labs (those present, in the given order), e.g. one city's."""
+        rows = [self._lab_ids[lab] for lab in labs if lab in self._lab_ids]
+        return PriceMatrix([self.labs[i] for i in rows], self.tests, self.prices[rows])
+
+    # ── queries ──
+    def price(self, lab, test):
+        """Price of `test` at `lab`, or None if not offered."""
+        i, j = self._lab_ids.get(lab), self._test_ids.get(test)
+        if i is None or j is None or self.prices[i, j] == MISSING:
+            return None
+        return int(self.prices[i, j])
+
+    def test_prices(self, test):
+        """One price per lab (in self.labs order), MISSING where the lab doesn't offer it."""
+        j = self._test_ids.get(test)
+        if j is None:
+            return np.full(len(self.labs), MISSING, dtype=DTYPE)
+        return self.prices[:, j]
+
+    def test_summary(self, test):
+        """{min, max, avg, count, cheapest_lab} for one test, or None if no lab lists it."""
+        column = self.test_prices(test)
+        offered = column != MISSING
+        count = int(offered.sum())
+        if not count:
+            return None
+        cheapest = int(np.where(offered, column, _NO_PRICE).argmin())
+        return {
+            "min": int(column[cheapest]),
+            "max": int(column.max()),
+            "avg": int(column.sum(dtype=np.int64)) // count,
+            "count": count,
+            "cheapest_lab": self.labs[cheapest],
+        }
+
+    def summaries(self):
+        """Per-test arrays (in self.tests order) of min, max, avg, count and cheapest lab index."""
+        if not self.labs:
+            zeros = np.zeros(len(self.tests), dtype=np.int64)
+            return {key: zeros for key in ("min", "max", "avg", "count", "cheapest")}
+        offered = self.prices != MISSING
+        count = offered.sum(axis=0)
+        masked = np.where(offered, self.prices, _NO_PRICE)
+        cheapest = masked.argmin(axis=0)
+        avg = self.prices.sum(axis=0, dtype=np.int64) // np.maximum(count, 1)
+        return {
+            "min": np.where(count > 0, masked.min(axis=0), MISSING),
+            "max": self.prices.max(axis=0),
+            "avg": avg,
+            "count": count,
+            "cheapest": cheapest,
+        }
+
+    # ── binary snapshot ──
+    def to_bytes(self) -> bytes:
+        header = json.dumps({
+            "version": FORMAT_VERSION,
+            "labs": list(self.labs),
+            "tests": list(self.tests),
+            "dtype": DTYPE,
+        }, ensure_ascii=False).encode("utf-8")
+        prefix = MAGIC + struct.pack("<I", len(header)) + header
+        prefix += b"\0" * (-len(prefix) % _ALIGN)
+        return prefix + np.ascontiguousarray(self.prices, dtype=DTYPE).tobytes()
+
+    @staticmethod
+    def _read_header(buffer):
+        if len(buffer) < len(MAGIC) + 4 or bytes(buffer[:len(MAGIC)]) != MAGIC:
+            raise PriceDataError("not a price matrix snapshot")
+        (header_len,) = struct.unpack_from("<I", buffer, len(MAGIC))
+        start = len(MAGIC) + 4
+        try:
+            header = json.loads(bytes(buffer[start:start + header_len]).decode("utf-8"))
+        except ValueError:
+            raise PriceDataError("corrupt snapshot header")
+        if not isinstance(header, dict) or header.get("version") != FORMAT_VERSION or header.get("dtype") != DTYPE:
+            raise PriceDataError("unsupported snapshot version or dtype")
+        _check_names(header.get("labs"), "labs")
+        _check_names(header.get("tests"), "tests")
+        offset = start + header_len
+        offset += -offset % _ALIGN
+        shape = (len(header["labs"]), len(header["tests"]))
+        if len(buffer) - offset != shape[0] * shape[1] * 4:
+            raise PriceDataError("snapshot size does not match its header")
+        return header, offset, shape
+
+    @classmethod
+    def _validated(cls, header, prices):
+        if prices.size and prices.min() < 0:
+            raise PriceDataError("negative price in snapshot")
+        return cls(header["labs"], header["tests"], prices)
+
+    @classmethod
+    def from_bytes(cls, raw):
+        """Parse a snapshot held in memory (zero-copy view of `raw`)."""
+        header, offset, shape = cls._read_header(memoryview(raw))
+        prices = np.frombuffer(raw, dtype=DTYPE, count=shape[0] * shape[1], offset=offset).reshape(shape)
+        return cls._validated(header, prices)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Open a snapshot file; with mmap the price block is paged in on demand, not read up front."""
+        if not mmap:
+            with open(path, "rb") as f:
+                return cls.from_bytes(f.read())
+        raw = np.memmap(path, dtype=np.uint8, mode="r")
+        header, offset, shape = cls._read_header(raw)
+        prices = np.memmap(path, dtype=DTYPE, mode="r", offset=offset, shape=shape)
+        return cls._validated(header, prices)
@@ -0,0 +1,111 @@
+"""
+Process-wide, hot-reloaded snapshots of the data files: the binary price matrix, the
+full test catalog and the lab registry.
+Every Streamlit session reads the same parsed, read-only object. The file is stat'ed at
+most once per CHECK_INTERVAL_S for the whole process and re-parsed only when its mtime
+moved and its content hash changed, so ordinary reruns do no file I/O.
+scraper.py replaces the files atomically, so a reload never sees a half-written file.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from catalog_index import CatalogIndex
+from lab_registry import REGISTRY_PATH, LabRegistry
+
+CATALOG_PATH = 'data/lab_catalog.json'
+# price_matrix.PRICE_MATRIX_PATH, repeated so importing this module doesn't load NumPy
+PRICE_MATRIX_PATH = 'data/lab_prices.bin'
+# The scraper runs hourly; a new snapshot shows up within this many seconds
+CHECK_INTERVAL_S = 30
+
+
+class Snapshot:
+    """One parsed version of a data file."""
+
+    def __init__(self, data, mtime, digest):
+        self.data = data
+        self.mtime = mtime
+        self.digest = digest
+
+
+class SnapshotStore:
+    """
+    Holds the latest good Snapshot of `path`, built by load(raw_bytes).
+    A file that fails to load keeps the previous snapshot and sets `error`.
+    """
+
+    def __init__(self, path, load, check_interval=CHECK_INTERVAL_S, clock=time.monotonic):
+        self.path = path
+        self._load = load
+        self.check_interval = check_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._checked_at = None
+        self._mtime = None  # as of the last stat; None when the file is missing
+        self._failed_mtime = None
+        self.error = None
+        self.reloads = 0
+
+    def _stat(self):
+        now = self._clock()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            self._mtime = os.stat(self.path).st_mtime
+        except OSError:
+            self._mtime = None
+
+    def exists(self) -> bool:
+        """Whether the file was there at the last (throttled) check."""
+        with self._lock:
+            self._stat()
+            return self._mtime is not None
+
+    def get(self):
+        """The current Snapshot, or None if the file has never been readable."""
+        with self._lock:
+            self._stat()
+            snapshot, mtime = self._snapshot, self._mtime
+            if mtime is None or mtime == self._failed_mtime:
+                return snapshot
+            if snapshot is not None and snapshot.mtime == mtime:
+                return snapshot
+            try:
+                with open(self.path, 'rb') as f:
+                    raw = f.read()
+                digest = hashlib.sha256(raw).hexdigest()
+                if snapshot is not None and digest == snapshot.digest:
+                    data = snapshot.data  # touched but unchanged: keep the parsed object
+                else:
+                    data = self._load(raw)
+                    self.reloads += 1
+                self._snapshot = Snapshot(data, mtime, digest)
+                self.error = None
+            except Exception as e:  # unreadable or malformed: keep serving the last good one
+                self._failed_mtime = mtime  # retried only once the file changes again
+                self.error = str(e)
+            return self._snapshot
+
+
+def _load_prices(raw):
+    from price_matrix import PriceMatrix  # NumPy loads with the first price snapshot
+    return PriceMatrix.from_bytes(raw)  # validated; prices stay a read-only view of `raw`
+
+
+def _load_catalog(raw):
+    return CatalogIndex(json.loads(raw))
+
+
+def _load_registry(raw):
+    return LabRegistry.from_json(json.loads(raw))
+
+
+# Shared by every Streamlit session in this process
+price_snapshot = SnapshotStore(PRICE_MATRIX_PATH, _load_prices)
+catalog_snapshot = SnapshotStore(CATALOG_PATH, _load_catalog)
+registry_snapshot = SnapshotStore(REGISTRY_PATH, _load_registry)
@@ -0,0 +1,152 @@
+"""
+Process-wide client-side rate limiting for Gemini.
+Every Streamlit session in this process queues through one token bucket, first come
+first served, so concurrent users share the quota instead of all hitting 429 together.
+A 429 pauses the whole bucket for a jittered, exponentially growing delay and the
+call is retried.
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from metrics import metrics
+
+# Defaults; override with REPORTSAY_GEMINI_* environment variables
+REQUESTS_PER_MINUTE = 15
+BURST = 3
+MAX_RETRIES = 4
+BACKOFF_BASE_S = 2.0
+BACKOFF_MAX_S = 60.0
+
+
+def is_rate_limited(exc) -> bool:
+    """True for a 429 / ResourceExhausted error from the SDK (or a stub)."""
+    return "429" in str(exc) or type(exc).__name__ == "ResourceExhausted"
+
+
+class RateLimiter:
+    """Token bucket (`rate_per_min`, `burst`) behind a fair FIFO queue."""
+
+    def __init__(self, rate_per_min=REQUESTS_PER_MINUTE, burst=BURST, max_retries=MAX_RETRIES,
+                 backoff_base=BACKOFF_BASE_S, backoff_max=BACKOFF_MAX_S, clock=time.monotonic):
+        self.rate = rate_per_min / 60.0
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._paused_until = 0.0
+        self.calls = 0
+        self.rate_limited = 0
+        self.retries = 0
+
+    # ── bucket ──
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _wait_time(self, now):
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def pause(self, seconds):
+        """Hold every caller for `seconds` (after a 429 from the server)."""
+        with self._cond:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+    def backoff(self, attempt):
+        """Full-jitter exponential backoff for retry number `attempt` (0-based)."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    # ── queue ──
+    def queue_length(self):
+        with self._cond:
+            return len(self._queue)
+
+    def acquire(self, on_wait=None):
+        """
+        Block until it is this caller's turn and a token is free.
+        on_wait(position) is called (outside the lock) whenever the 1-based queue position changes.
+        """
+        ticket = object()
+        with self._cond:
+            self._queue.append(ticket)
+        last_position = None
+        try:
+            while True:
+                with self._cond:
+                    position = self._queue.index(ticket) + 1
+                    wait = 0.5  # re-check at least this often when not at the head
+                    if position == 1:
+                        now = self._clock()
+                        self._refill(now)
+                        wait = self._wait_time(now)
+                        if wait <= 0:
+                            self._tokens -= 1
+                            self._queue.popleft()
+                            self._cond.notify_all()
+                            return
+                if on_wait is not None and position != last_position:
+                    last_position = position
+                    on_wait(position)
+                with self._cond:
+                    self._cond.wait(timeout=min(wait, 0.5))
+        except BaseException:
+            with self._cond:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    self._cond.notify_all()
+            raise
+
+    def call(self, fn, *args, on_wait=None, **kwargs):
+        """Run fn through the queue, retrying 429s with jittered exponential backoff."""
+        for attempt in range(self.max_retries + 1):
+            with metrics.span("queue"):
+                self.acquire(on_wait)
+            with self._cond:
+                self.calls += 1
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if not is_rate_limited(e):
+                    raise
+                with self._cond:
+                    self.rate_limited += 1
+                metrics.inc("gemini_rate_limited_total")
+                if attempt == self.max_retries:
+                    raise
+                with self._cond:
+                    self.retries += 1
+                self.pause(self.backoff(attempt))
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "calls": self.calls,
+                "rate_limited": self.rate_limited,
+                "retries": self.retries,
+                "queued": len(self._queue),
+            }
+
+
+def _from_env():
+    env = os.environ
+    return RateLimiter(
+        rate_per_min=float(env.get("REPORTSAY_GEMINI_RPM", REQUESTS_PER_MINUTE)),
+        burst=int(env.get("REPORTSAY_GEMINI_BURST", BURST)),
+        max_retries=int(env.get("REPORTSAY_GEMINI_RETRIES", MAX_RETRIES)),
+    )
+
+
+# Shared by every Streamlit session in this process
+gemini_limiter = _from_env()
+metrics.register("gemini_limiter", gemini_limiter.stats)
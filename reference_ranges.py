@@ -0,0 +1,129 @@
+"""
+Local reference-range engine for an instant "quick check" without Gemini.
+Values are pulled out of a report's text layer, matched to the canonical test panels
+used across the app (CBC, HbA1c, Lipid Profile, LFTs, ...) and flagged against adult
+reference ranges in one vectorised comparison.
+Ranges are typical adult values (mg/dL units, as Pakistani labs report); the lab's own
+printed range always takes precedence for medical decisions.
+"""
+import re
+
+import numpy as np
+
+# panel → analyte → (low, high, unit, aliases as printed on reports)
+REFERENCE_RANGES = {
+    "CBC": {
+        "Hemoglobin":      (12.0, 17.5, "g/dL", ["hemoglobin", "haemoglobin", "hb", "hgb"]),
+        "Total WBC":       (4.0, 11.0, "×10⁹/L", ["wbc", "tlc", "total leucocyte count", "total leukocyte count", "white blood cells"]),
+        "RBC":             (4.0, 6.0, "×10¹²/L", ["rbc", "red blood cells", "red cell count"]),
+        "Platelets":       (150, 450, "×10⁹/L", ["platelets", "platelet count", "plt"]),
+        "Hematocrit":      (36, 52, "%", ["hematocrit", "haematocrit", "hct", "pcv"]),
+        "MCV":             (80, 100, "fL", ["mcv"]),
+        "MCH":             (27, 33, "pg", ["mch"]),
+        "MCHC":            (32, 36, "g/dL", ["mchc"]),
+        "Neutrophils":     (40, 75, "%", ["neutrophils"]),
+        "Lymphocytes":     (20, 45, "%", ["lymphocytes"]),
+    },
+    "HbA1c": {
+        "HbA1c":           (4.0, 5.6, "%", ["hba1c", "hb a1c", "hb-a1c", "hemoglobin a1c", "haemoglobin a1c", "glycosylated hemoglobin", "glycated hemoglobin"]),
+    },
+    "Glucose Profile": {
+        "Fasting Glucose": (70, 99, "mg/dL", ["fasting glucose", "fasting blood sugar", "fasting plasma glucose", "fbs"]),
+        "Random Glucose":  (70, 139, "mg/dL", ["random glucose", "random blood sugar", "rbs", "bsr"]),
+    },
+    "Lipid Profile": {
+        "Total Cholesterol": (0, 200, "mg/dL", ["total cholesterol", "serum cholesterol", "cholesterol"]),
+        "LDL Cholesterol": (0, 130, "mg/dL", ["ldl cholesterol", "ldl-c", "ldl"]),
+        "HDL Cholesterol": (40, 100, "mg/dL", ["hdl cholesterol", "hdl-c", "hdl"]),
+        "Triglycerides":   (0, 150, "mg/dL", ["triglycerides", "triglyceride", "tg"]),
+    },
+    "LFTs": {
+        "ALT (SGPT)":      (0, 41, "U/L", ["alt", "sgpt", "alanine aminotransferase"]),
+        "AST (SGOT)":      (0, 40, "U/L", ["ast", "sgot", "aspartate aminotransferase"]),
+        "Alkaline Phosphatase": (40, 129, "U/L", ["alkaline phosphatase", "alk phos", "alp"]),
+        "Total Bilirubin": (0.1, 1.2, "mg/dL", ["total bilirubin", "bilirubin total", "serum bilirubin", "bilirubin"]),
+        "Albumin":         (3.5, 5.2, "g/dL", ["albumin"]),
+    },
+    "RFTs": {
+        "Urea":            (15, 45, "mg/dL", ["blood urea", "serum urea", "urea"]),
+        "Creatinine":      (0.6, 1.3, "mg/dL", ["serum creatinine", "creatinine"]),
+        "Uric Acid":       (3.5, 7.2, "mg/dL", ["uric acid"]),
+    },
+    "Cardiac Profile": {
+        "Troponin I":      (0, 0.04, "ng/mL", ["troponin i", "troponin-i", "trop i"]),
+    },
+    "Thyroid Profile": {
+        "TSH":             (0.4, 4.0, "µIU/mL", ["tsh", "thyroid stimulating hormone"]),
+        "Free T4":         (0.8, 1.8, "ng/dL", ["free t4", "ft4"]),
+        "Free T3":         (2.3, 4.2, "pg/mL", ["free t3", "ft3"]),
+    },
+    "Vitamins": {
+        "Vitamin D":       (30, 100, "ng/mL", ["25-hydroxy vitamin d", "25-oh vitamin d", "vitamin d3", "vitamin d", "vit d"]),
+        "Vitamin B12":     (200, 900, "pg/mL", ["vitamin b12", "vit b12", "b12"]),
+    },
+}
+
+# Counts some labs print per µL (e.g. platelets 250,000) instead of ×10⁹/L
+_PER_MICROLITRE = {"Total WBC", "Platelets"}
+
+# Flat lookup tables, built once: analyte i ↔ (panel, name, unit, LOW[i], HIGH[i])
+ANALYTES = [(panel, name, spec[2]) for panel, tests in REFERENCE_RANGES.items() for name, spec in tests.items()]
+LOW = np.array([REFERENCE_RANGES[p][n][0] for p, n, _ in ANALYTES], dtype=float)
+HIGH = np.array([REFERENCE_RANGES[p][n][1] for p, n, _ in ANALYTES], dtype=float)
+_INDEX_BY_ALIAS = {
+    alias: idx
+    for idx, (panel, name, _) in enumerate(ANALYTES)
+    for alias in REFERENCE_RANGES[panel][name][3]
+}
+# Longest alias first, so "hemoglobin a1c" wins over "hemoglobin" at the same position
+_ALIASES = '|'.join(re.escape(a) for a in sorted(_INDEX_BY_ALIAS, key=len, reverse=True))
+_FIRST_CHARS = re.escape(''.join(sorted({a[0] for a in _INDEX_BY_ALIAS})))
+# Matched against lowercased text; the first-character lookahead skips most positions cheaply.
+# An alias followed by "/" or "ratio" (Cholesterol/HDL Ratio) or by "a1c" (Hb A1c) names
+# something else; parenthesised qualifiers such as "(25-OH)" or "(3rd generation)" are
+# skipped; and the value must be a whole number on its own, not the "1" of "A1c" (a unit
+# printed without a space, as in "12.5g/dL", is still fine).
+_GLUED_UNITS = "g|mg|ng|pg|µg|u|iu|miu|µiu|uiu|mmol|µmol|umol|fl|mm"
+_VALUE_PATTERN = re.compile(
+    rf"\b(?=[{_FIRST_CHARS}])(?P<alias>{_ALIASES})\b(?!\s*(?:/|ratio\b|-?a1c\b))"
+    rf"(?:\([^)\n]{{0,30}}\)|(?!ratio\b)[^0-9(\n]){{0,40}}?"
+    rf"(?P<value>\d[\d,]*(?:\.\d+)?)(?![\d.,]*\d|-|(?!(?:{_GLUED_UNITS})\b)\w)"
+)
+
+
+def extract_values(text: str) -> dict:
+    """{analyte index: value} for the first reading of each known test found in report text."""
+    values = {}
+    for match in _VALUE_PATTERN.finditer(text.lower()):
+        idx = _INDEX_BY_ALIAS[match.group("alias")]
+        if idx in values:
+            continue
+        value = float(match.group("value").replace(",", ""))
+        if ANALYTES[idx][1] in _PER_MICROLITRE and value > HIGH[idx] * 10:
+            value /= 1000
+        values[idx] = value
+    return values
+
+
+def evaluate(values: dict) -> list:
+    """Flag every value against its range in one vectorised pass; abnormal results first."""
+    if not values:
+        return []
+    idx = np.fromiter(values.keys(), dtype=int, count=len(values))
+    vals = np.fromiter(values.values(), dtype=float, count=len(values))
+    flags = np.where(vals < LOW[idx], "low", np.where(vals > HIGH[idx], "high", "normal"))
+
+    results = []
+    for i, value, flag in zip(idx.tolist(), vals.tolist(), flags.tolist()):
+        panel, name, unit = ANALYTES[i]
+        results.append({
+            "panel": panel, "test": name, "value": value, "unit": unit,
+            "low": float(LOW[i]), "high": float(HIGH[i]), "flag": flag,
+        })
+    results.sort(key=lambda r: (r["flag"] == "normal", list(REFERENCE_RANGES).index(r["panel"])))
+    return results
+
+
+def quick_check(text: str) -> list:
+    """Instant normal/abnormal check of a report's text, no AI call."""
+    return evaluate(extract_values(text))
@@ -0,0 +1,392 @@
+"""
+Uploaded report handling: turning an image or (multi-page) PDF into PIL images.
+Kept out of app.py so PDF pages can be rendered in worker processes.
+PIL, PyMuPDF and reportlab are imported where they are used, so neither a cold start
+nor a render worker loads them up front.
+"""
+import datetime
+import functools
+import io
+import math
+import multiprocessing
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from metrics import timed
+
+MAX_SIZE_MB = 10
+# Pages beyond this are ignored; lab reports rarely run past 8
+MAX_PDF_PAGES = 8
+# Render resolution when the pixel budget allows it
+PDF_DPI = 150
+# Total pixels rendered per upload (~54 MB of RGB) — 8 A4 pages fit at 150 dpi
+MAX_TOTAL_PIXELS = 18_000_000
+# Worker processes for PDF rendering, shared by every session in this process
+RENDER_WORKERS = 4
+# Workers are spawned, not forked: forking the threaded Streamlit server can deadlock
+RENDER_START_METHOD = "spawn"
+# Finished PDF exports kept in memory, keyed by (analysis text, language)
+PDF_CACHE_SIZE = 32
+
+# --- TEXT-LAYER FAST PATH ---
+# Every page needs at least this much extractable text to skip rasterising the PDF
+MIN_TEXT_CHARS = 200
+# More unmapped glyphs (U+FFFD) than this means the text layer is unreadable
+MAX_GARBLED_RATIO = 0.02
+# Such a PDF is analysed as text, so only page 1 is rendered, at this DPI, as the preview
+PREVIEW_DPI = 72
+
+# --- MODEL UPLOAD PREPROCESSING ---
+# Longest side sent to Gemini; plenty to read a lab table, far smaller than a 12 MP photo
+TARGET_LONG_EDGE = 1600
+# Photos are noisy, so lossy JPEG wins; clean PDF renders are ~10x smaller as lossless WebP
+PHOTO_FORMAT = "JPEG"
+PHOTO_QUALITY = 80
+UPLOAD_GRAYSCALE = True
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _render_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS,
+                                        mp_context=multiprocessing.get_context(RENDER_START_METHOD))
+        return _pool
+
+
+def _discard_render_pool(broken):
+    """Drop a pool whose worker died so the next PDF gets a fresh one (not serial forever)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not broken:
+            return  # another request already replaced it
+        _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+    print("⚠️  PDF render worker died; rendering this PDF serially and starting a new pool for the next one.")
+
+
+def _render_page(file_bytes, page_no, dpi):
+    """Worker: render one page. Returns (width, height, RGB bytes) so it pickles cheaply."""
+    import fitz  # PyMuPDF
+    with fitz.open(stream=file_bytes, filetype="pdf") as doc:
+        pix = doc[page_no].get_pixmap(dpi=dpi)
+        return pix.width, pix.height, pix.samples
+
+
+def page_dpis(page_sizes, dpi=PDF_DPI, max_pixels=MAX_TOTAL_PIXELS, long_edge=TARGET_LONG_EDGE):
+    """
+    Render DPI for each page: no finer than the model upload needs (long_edge pixels)
+    and small enough that the whole document fits in max_pixels.
+    page_sizes are (width, height) in points; every page gets an equal share.
+    """
+    share = max_pixels / max(len(page_sizes), 1)
+    dpis = []
+    for width_pt, height_pt in page_sizes:
+        area_in = (width_pt / 72) * (height_pt / 72)
+        fit = math.sqrt(share / area_in) if area_in else dpi
+        long_in = max(width_pt, height_pt) / 72
+        if long_edge and long_in:
+            fit = min(fit, long_edge / long_in)
+        dpis.append(max(36, min(dpi, int(fit))))
+    return dpis
+
+
+def render_pdf_pages(file_bytes, max_pages=MAX_PDF_PAGES, dpi=PDF_DPI):
+    """
+    Render up to max_pages pages of a PDF, at most at `dpi`, within the pixel budget.
+    Returns (images, total_page_count). Multi-page documents render in parallel.
+    """
+    import fitz  # PyMuPDF
+    from PIL import Image
+    with fitz.open(stream=file_bytes, filetype="pdf") as doc:
+        page_count = doc.page_count
+        sizes = [(doc[i].rect.width, doc[i].rect.height) for i in range(min(page_count, max_pages))]
+    dpis = page_dpis(sizes, dpi=dpi)
+
+    jobs = list(enumerate(dpis))
+    if len(jobs) > 1:
+        pool = _render_pool()
+        try:
+            futures = [pool.submit(_render_page, file_bytes, i, d) for i, d in jobs]
+            rendered = [f.result() for f in futures]
+        except BrokenProcessPool:
+            _discard_render_pool(pool)
+            rendered = [_render_page(file_bytes, i, d) for i, d in jobs]
+    else:
+        rendered = [_render_page(file_bytes, i, d) for i, d in jobs]
+
+    images = [Image.frombytes("RGB", (w, h), samples) for w, h, samples in rendered]
+    for image in images:
+        image.info["source"] = "pdf"  # lets preprocess_for_model pick lossless encoding
+    return images, page_count
+
+
+def _page_text(page):
+    """One page as plain text in reading order, with ruled tables as Markdown tables."""
+    import fitz  # PyMuPDF
+    try:
+        tables = page.find_tables().tables
+    except Exception:
+        tables = []
+    boxes = [fitz.Rect(t.bbox) for t in tables]
+
+    pieces = [(t.bbox[1], t.to_markdown().strip()) for t in tables]
+    for x0, y0, x1, y1, text, *_ in page.get_text("blocks", sort=True):
+        if text.strip() and not any(fitz.Rect(x0, y0, x1, y1).intersects(box) for box in boxes):
+            pieces.append((y0, text.strip()))
+    return "\n".join(text for _, text in sorted(pieces, key=lambda p: p[0]))
+
+
+def extract_pdf_text(file_bytes, max_pages=MAX_PDF_PAGES):
+    """
+    Compact text of a digitally generated PDF (tables as Markdown), or None when any
+    page lacks a usable text layer — scans and photos must be sent as images instead.
+    """
+    import fitz  # PyMuPDF
+    parts = []
+    with fitz.open(stream=file_bytes, filetype="pdf") as doc:
+        for page_no in range(min(doc.page_count, max_pages)):
+            page = doc[page_no]
+            raw = page.get_text("text")
+            if len(raw.strip()) < MIN_TEXT_CHARS or raw.count("\ufffd") > len(raw) * MAX_GARBLED_RATIO:
+                return None
+            parts.append(f"--- Page {page_no + 1} ---\n{_page_text(page)}")
+    return "\n\n".join(parts) if parts else None
+
+
+def _text_layer(file_bytes):
+    """extract_pdf_text, with an unreadable text layer treated as none."""
+    try:
+        return extract_pdf_text(file_bytes)
+    except Exception:
+        return None  # fall back to the rendered pages
+
+
+@timed("decode")
+def open_uploaded_file(uploaded_file):
+    """
+    Safely open uploaded file as a list of PIL Images (one per page).
+    Handles JPG, PNG, and PDF (up to MAX_PDF_PAGES pages). A PDF with a good text layer
+    is only previewed: one small render of page 1 carrying the text (info["pdf_text"])
+    and the document's page count (info["page_count"]).
+    Returns (pages, error_message).
+    """
+    file_bytes = uploaded_file.getvalue()
+
+    if len(file_bytes) > MAX_SIZE_MB * 1024 * 1024:
+        return None, f"File is too large ({len(file_bytes)//1024//1024} MB). Please upload a file under {MAX_SIZE_MB} MB."
+
+    file_type = uploaded_file.type
+
+    if file_type == "application/pdf":
+        try:
+            text = _text_layer(file_bytes)
+            if text is not None:
+                pages, page_count = render_pdf_pages(file_bytes, max_pages=1, dpi=PREVIEW_DPI)
+                pages[0].info.update(pdf_text=text, page_count=page_count)
+            else:
+                pages, _ = render_pdf_pages(file_bytes)
+            if not pages:
+                return None, "PDF appears to be empty."
+            return pages, None
+        except ImportError:
+            return None, "PDF support requires PyMuPDF. Please add `pymupdf` to requirements.txt."
+        except Exception as e:
+            return None, f"Could not read PDF: {e}"
+    else:
+        from PIL import Image
+        try:
+            image = Image.open(io.BytesIO(file_bytes))
+            image.verify()  # Check it's a valid image
+            image = Image.open(io.BytesIO(file_bytes))  # Re-open after verify
+            return [image], None
+        except Exception as e:
+            return None, f"Could not open image: {e}"
+
+
+def preprocess_for_model(image):
+    """
+    One page → compact upload blob: EXIF-upright, grayscale, long edge capped at
+    TARGET_LONG_EDGE, then lossless WebP for PDF renders or PHOTO_FORMAT for photos.
+    Returns {"mime_type", "data"}.
+    """
+    from PIL import Image, ImageOps
+    from_pdf = image.info.get("source") == "pdf"
+    image = ImageOps.exif_transpose(image)
+    image = image.convert("L") if UPLOAD_GRAYSCALE else image.convert("RGB")
+    longest = max(image.size)
+    if longest > TARGET_LONG_EDGE:
+        scale = TARGET_LONG_EDGE / longest
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(size, Image.LANCZOS)
+
+    buffer = io.BytesIO()
+    if from_pdf:
+        image.save(buffer, format="WEBP", lossless=True, method=1)
+        return {"mime_type": "image/webp", "data": buffer.getvalue()}
+    image.save(buffer, format=PHOTO_FORMAT, quality=PHOTO_QUALITY, optimize=True)
+    return {"mime_type": f"image/{PHOTO_FORMAT.lower()}", "data": buffer.getvalue()}
+
+
+def prepare_pages(pages, file_bytes=None):
+    """
+    Build the model payload for a report. Returns (parts, stats) with bytes and timing.
+    A digital PDF (a text-layer preview from open_uploaded_file, or file_bytes with a
+    good text layer) becomes one compact text part; anything else becomes one
+    preprocessed image per page.
+    """
+    start = time.perf_counter()
+    text = pages[0].info.get("pdf_text") if pages else None
+    if text is None and file_bytes is not None and file_bytes[:5] == b"%PDF-":
+        text = _text_layer(file_bytes)
+
+    if text is not None:
+        parts = [f"Report text extracted from the PDF:\n\n{text}"]
+        size = len(parts[0].encode("utf-8"))
+        mode = "text"
+    else:
+        parts = [preprocess_for_model(page) for page in pages]
+        size = sum(len(b["data"]) for b in parts)
+        mode = "image"
+    stats = {
+        "mode": mode,
+        "pages": min(pages[0].info.get("page_count", len(pages)), MAX_PDF_PAGES) if pages else 0,
+        "bytes": size,
+        "preprocess_s": time.perf_counter() - start,
+    }
+    return parts, stats
+
+
+def build_analysis_prompt(language: str) -> str:
+    """Return a structured, consistent prompt for medical report analysis."""
+    return f"""You are a professional medical lab report interpreter. A patient has uploaded their lab report.
+
+Analyze the report carefully and respond ONLY in {language}.
+
+Structure your response exactly as follows:
+
+---
+**🧪 Tests Detected**
+List all tests found in the report (e.g., CBC, HbA1c, etc.)
+
+**✅ Normal Results**
+List each result that is within the normal reference range. Format: Test Name → Value (Normal Range)
+
+**⚠️ Abnormal Results**
+List each result outside the normal range. For each one, briefly explain in simple terms what it may suggest. Format: Test Name → Value (Normal Range) — What this means
+
+**📋 Summary**
+A 2–3 sentence plain-language summary of the overall report for a non-medical reader.
+
+**💡 Suggested Next Steps**
+What should the patient discuss with their doctor? List 2–3 specific points.
+
+---
+⚕️ **Important Disclaimer:** This analysis is generated by AI and is for informational purposes only. It does not constitute medical advice, diagnosis, or treatment. Always consult a qualified physician before making any health decisions.
+"""
+
+
+# Markdown → reportlab mini-markup, compiled once
+_BOLD = re.compile(r'\*\*(.*?)\*\*')
+_ITALIC = re.compile(r'\*(.*?)\*')
+_HEADING = re.compile(r'^#+\s+', flags=re.MULTILINE)
+_ANY_MARKUP = re.compile(r'\*\*|__|\*|_|^#+\s+', flags=re.MULTILINE)
+
+
+@functools.lru_cache(maxsize=1)
+def _pdf_styles():
+    """reportlab paragraph styles, built once per process."""
+    from reportlab.lib.styles import ParagraphStyle
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_LEFT
+
+    return {
+        "title": ParagraphStyle('title', fontSize=18, fontName='Helvetica-Bold',
+                                textColor=colors.HexColor('#005ecb'), spaceAfter=6),
+        "sub": ParagraphStyle('sub', fontSize=10, fontName='Helvetica',
+                              textColor=colors.HexColor('#666666'), spaceAfter=14),
+        "body": ParagraphStyle('body', fontSize=11, fontName='Helvetica',
+                               leading=16, spaceAfter=6, alignment=TA_LEFT),
+    }
+
+
+def generated_at() -> str:
+    """The "Generated" time printed on a PDF export, to the minute."""
+    return datetime.datetime.now().strftime('%d %b %Y, %H:%M')
+
+
+def generate_pdf_report(analysis_text: str, language: str) -> bytes:
+    """
+    Generate a clean PDF report.
+    Uses reportlab for proper Unicode (Urdu) support.
+    Falls back to FPDF for environments without reportlab.
+    Memoized per text, language and minute: repeat downloads reuse the bytes, and the
+    printed "Generated" time is never that of an older build.
+    """
+    return _pdf_report(analysis_text, language, generated_at())
+
+
+@functools.lru_cache(maxsize=PDF_CACHE_SIZE)
+@timed("pdf")  # under the cache: only real builds are timed
+def _pdf_report(analysis_text: str, language: str, generated: str) -> bytes:
+    return _render_pdf_report(analysis_text, language, generated)
+
+
+def _render_pdf_report(analysis_text: str, language: str, generated: str) -> bytes:
+    """The build itself, neither memoized nor timed (structured_report falls back to it)."""
+    try:
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.units import cm
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+
+        styles = _pdf_styles()
+        buffer = io.BytesIO()
+        doc = SimpleDocTemplate(buffer, pagesize=A4,
+                                leftMargin=2*cm, rightMargin=2*cm,
+                                topMargin=2*cm, bottomMargin=2*cm)
+
+        # Clean markdown for PDF
+        clean = _BOLD.sub(r'<b>\1</b>', analysis_text)
+        clean = _ITALIC.sub(r'<i>\1</i>', clean)
+        clean = _HEADING.sub('', clean)
+
+        story = [
+            Paragraph("ReportSay", styles["title"]),
+            Paragraph(f"AI Medical Report Analysis · Generated {generated} · Language: {language}", styles["sub"]),
+            Spacer(1, 0.3*cm),
+        ]
+
+        for line in clean.split('\n'):
+            line = line.strip()
+            if line == '---':
+                story.append(Spacer(1, 0.3*cm))
+            elif line:
+                try:
+                    story.append(Paragraph(line, styles["body"]))
+                except Exception:
+                    story.append(Paragraph(line.encode('ascii', 'replace').decode(), styles["body"]))
+
+        doc.build(story)
+        return buffer.getvalue()
+
+    except ImportError:
+        # Fallback: FPDF (latin-1 only, Urdu will be replaced with ?)
+        from fpdf import FPDF
+        pdf = FPDF()
+        pdf.add_page()
+        pdf.set_font("Arial", 'B', 16)
+        pdf.cell(0, 10, "ReportSay – AI Analysis", ln=True, align='C')
+        pdf.set_font("Arial", size=10)
+        pdf.cell(0, 8, f"Generated: {generated}   Language: {language}", ln=True, align='C')
+        pdf.ln(5)
+        pdf.set_font("Arial", size=11)
+        clean = _ANY_MARKUP.sub('', analysis_text)
+        safe = clean.encode('latin-1', 'replace').decode('latin-1')
+        pdf.multi_cell(0, 7, txt=safe)
+        return pdf.output(dest='S').encode('latin-1')
@@ -1,50 +1,37 @@
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import urlparse
+import codecs
+import hashlib
 import json
 import os
+import re
+import tempfile
+import time
 
-# --- REALISTIC MARKET RATES (VERIFIED 2025/2026) ---
-# All prices stored as integers (not strings) to avoid formatting errors in the app
-BACKUP_PRICES = {
-    "Mughal Labs": {
-        "Mughal Labs": {
-    "CBC": 800,
-    "HbA1c": 2300,
-    "Glucose Profile": 450,
-    "Lipid Profile": 2500,
-    "LFTs": 2200,
-    "RFTs": 1650,
-    "Cardiac Profile": 6400,
-    "Thyroid Profile": 3950,
-    "Vitamins": 3950
-},
-    },
-    "Shaukat Khanum": {
-        "CBC": 1100, "HbA1c": 2400, "Glucose Profile": 850,
-        "Lipid Profile": 3000, "LFTs": 2300, "RFTs": 2100,
-        "Cardiac Profile": 5500, "Thyroid Profile": 5500, "Vitamins": 6000
-    },
-    "IDC": {
-        "CBC": 1100, "HbA1c": 2400, "Glucose Profile": 900,
-        "Lipid Profile": 2700, "LFTs": 2200, "RFTs": 2100,
-        "Cardiac Profile": 5200, "Thyroid Profile": 3800, "Vitamins": 4800
-    },
-    "Chughtai Lab": {
-        "CBC": 800, "HbA1c": 2100, "Glucose Profile": 850,
-        "Lipid Profile": 2400, "LFTs": 1950, "RFTs": 1800,
-        "Cardiac Profile": 5000, "Thyroid Profile": 3800, "Vitamins": 3700
-    },
-    "Al-Noor": {
-        "CBC": 800, "HbA1c": 2100, "Glucose Profile": 600,
-        "Lipid Profile": 2400, "LFTs": 1950, "RFTs": 1600,
-        "Cardiac Profile": 4200, "Thyroid Profile": 3900, "Vitamins": 3700
-    },
-    "Excel Labs": {
-        "CBC": 1050, "HbA1c": 2500, "Glucose Profile": 650,
-        "Lipid Profile": 2700, "LFTs": 2200, "RFTs": 2200,
-        "Cardiac Profile": 5500, "Thyroid Profile": 4200, "Vitamins": 5200
-    }
-}
+from lab_registry import LabRegistry
+from metrics import metrics, start_export
+from price_history import price_history
+from price_matrix import PRICE_MATRIX_PATH, PriceMatrix
+
+# --- HTTP SETTINGS ---
+# Upper bound on labs fetched at once (also the keep-alive pool size)
+MAX_WORKERS = 64
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (5, 10)
+# Per-host overrides for known slow sites, e.g. {"idc.net.pk": (5, 20)}
+HOST_TIMEOUTS = {}
+# Bytes of HTML handed to the row extractor at a time
+STREAM_CHUNK_SIZE = 64 * 1024
+
+PRICES_PATH = 'data/lab_prices.json'
+# Each lab's full test list ({lab: {test name: price}}), not just the TARGET_MAP categories
+CATALOG_PATH = 'data/lab_catalog.json'
+# ETag / Last-Modified / body hash of each rate page, for conditional fetches
+HTTP_CACHE_PATH = 'data/http_cache.json'
 
 # --- STANDARD NAMES MAPPING ---
 TARGET_MAP = {
@@ -55,91 +42,423 @@ TARGET_MAP = {
     "LFTs": ["lft", "liver", "bilirubin", "sgpt", "alt"],
     "RFTs": ["rft", "renal", "kidney", "urea", "creatinine"],
     "Cardiac Profile": ["cardiac", "troponin", "ck-mb", "heart health"],
-    "Thyroid Profile": ["thyroid", "tsh", "t3", "t4", "ft4"],
+    "Thyroid Profile": ["thyroid", "tsh", "t3", "t4", "ft3", "ft4"],
     "Vitamins": ["vitamin", "vit d", "b12", "25-hydroxy"]
 }
 
 
-def normalize_and_merge(lab_name, live_data):
+def compile_matcher(target_map):
     """
-    Merge live scraped data with backup prices.
+    Build one regex over every keyword, one named group per category (c0, c1, ...).
+    Keywords must start at a word boundary, so "alt" no longer matches inside "salt".
+    Priority: the leftmost keyword in a name wins; ties go to the earlier category.
+    """
+    groups = []
+    first_chars = set()
+    for idx, keywords in enumerate(target_map.values()):
+        alternatives = '|'.join(re.escape(k.lower()) for k in sorted(keywords, key=len, reverse=True))
+        groups.append(f"(?P<c{idx}>{alternatives})")
+        first_chars.update(k[0].lower() for k in keywords)
+    # The first-character lookahead lets the engine skip most positions cheaply
+    lookahead = re.escape(''.join(sorted(first_chars)))
+    return re.compile(f"\\b(?=[{lookahead}])(?:{'|'.join(groups)})")
+
+
+TEST_MATCHER = compile_matcher(TARGET_MAP)
+_CATEGORY_BY_GROUP = {f"c{idx}": std_name for idx, std_name in enumerate(TARGET_MAP)}
+
+
+def classify_names(raw_names):
+    """Map each raw test name to its TARGET_MAP category (or None), one regex scan per name."""
+    search = TEST_MATCHER.search
+    categories = []
+    for raw_name in raw_names:
+        match = search(raw_name.lower())
+        categories.append(_CATEGORY_BY_GROUP[match.lastgroup] if match else None)
+    return categories
+
+
+def normalize_and_merge(live_data, fallback_prices=None):
+    """
+    Merge live scraped data over a lab's registry fallback prices.
     Always saves prices as integers so the app never crashes on formatting.
     """
-    # Start with backup prices (already integers)
-    final_data = BACKUP_PRICES.get(lab_name, {}).copy()
+    # Start with the fallback prices (already integers)
+    final_data = dict(fallback_prices or {})
 
-    for raw_name, price in live_data.items():
-        for std_name, keywords in TARGET_MAP.items():
-            if any(k in raw_name.lower() for k in keywords):
-                # Strip everything except digits
-                clean_price = ''.join(filter(str.isdigit, str(price)))
-                if clean_price and len(clean_price) >= 3:
-                    final_data[std_name] = int(clean_price)  # ← always integer
-                break
+    for std_name, price in zip(classify_names(live_data), live_data.values()):
+        if std_name is None:
+            continue
+        clean_price = parse_price(price)
+        if clean_price is not None:
+            final_data[std_name] = clean_price  # ← always integer
 
     return final_data
 
 
-def scrape_generic(url):
-    """Generic table scraper — works on most lab sites with price tables."""
+def parse_price(price):
+    """Raw price text → integer rupees, or None if it doesn't look like a price."""
+    # Strip everything except digits
+    clean_price = ''.join(filter(str.isdigit, str(price)))
+    if clean_price and len(clean_price) >= 3:
+        return int(clean_price)
+    return None
+
+
+def build_catalog(live_data):
+    """Every scraped row with a usable price, keyed by the lab's own test name."""
+    catalog = {}
+    for raw_name, price in live_data.items():
+        clean_price = parse_price(price)
+        if clean_price is not None:
+            catalog[raw_name] = clean_price
+    return catalog
+
+
+def make_session(pool_size=MAX_WORKERS):
+    """One keep-alive connection pool shared by every scrape in a run."""
+    session = requests.Session()
+    session.headers.update({"User-Agent": "Mozilla/5.0"})
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def timeout_for(url):
+    """(connect, read) timeout for a URL, honouring HOST_TIMEOUTS."""
+    return HOST_TIMEOUTS.get(urlparse(url).hostname, DEFAULT_TIMEOUT)
+
+
+def load_json(path):
+    """Read a JSON file from a previous run, or {} if it is missing or unreadable."""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def load_http_cache(path=HTTP_CACHE_PATH):
+    """Read the on-disk response cache ({url: {etag, last_modified, sha256, rows}})."""
+    return load_json(path)
+
+
+def save_bytes(path, data):
+    """
+    Write a file atomically: a temp file in the same folder is fsynced, then renamed over
+    `path`, so a reader (the app) sees either the old snapshot or the new one, never half.
+    """
+    folder = os.path.dirname(path) or '.'
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=folder, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, 0o644)  # mkstemp creates 0600; keep the usual permissions
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def save_json(path, data, **dump_kwargs):
+    save_bytes(path, json.dumps(data, **dump_kwargs).encode('utf-8'))
+
+
+def save_http_cache(cache, path=HTTP_CACHE_PATH):
+    save_json(path, cache, indent=2)
+
+
+def _price_row(row_text):
+    """Pick (name, price) out of one row's cell texts, or None if it isn't a price row."""
+    name = next((t for t in row_text if len(t) > 3 and not t.isdigit()), None)
+    price = next(
+        (t for t in row_text if any(c.isdigit() for c in t) and ("Rs" in t or t.isdigit())),
+        None
+    )
+    if name and price:
+        return name, price
+    return None
+
+
+def parse_price_table(html):
+    """Pull {test name: raw price text} out of every table row on a page (full soup tree)."""
+    soup = BeautifulSoup(html, 'html.parser')
+    results = {}
+    for tr in soup.find_all('tr'):
+        tds = tr.find_all(['td', 'th'])
+        if len(tds) >= 2:
+            row = _price_row([td.text.strip() for td in tds])
+            if row:
+                results[row[0]] = row[1]
+    return results
+
+
+def _table_selector(table):
+    """
+    Turn a registry "table" hint into a test on (index, attrs) of each <table>:
+    "#id", ".class" or a 0-based index. None selects every table.
+    """
+    if table is None:
+        return None
+    if isinstance(table, int):
+        return lambda index, attrs: index == table
+    if table.startswith('#'):
+        return lambda index, attrs: attrs.get('id') == table[1:]
+    return lambda index, attrs: table[1:] in (attrs.get('class') or '').split()
+
+
+class _RowExtractor(HTMLParser):
+    """
+    Collects the cell texts of each <tr> without building a document tree.
+    With a table selector, only rows inside a matching table (or one nested in it) count.
+    """
+
+    def __init__(self, table=None):
+        super().__init__(convert_charrefs=True)
+        self.rows = []
+        self._row = None
+        self._cell = None
+        self._skip = 0
+        self._select = _table_selector(table)
+        self._tables = []  # per open <table>: is it (or an enclosing table) selected
+        self._table_count = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'table' and self._select is not None:
+            selected = bool(self._tables and self._tables[-1]) or self._select(self._table_count, dict(attrs))
+            self._tables.append(selected)
+            self._table_count += 1
+        elif tag == 'tr':
+            self._end_row()
+            if self._select is None or (self._tables and self._tables[-1]):
+                self._row = []
+        elif tag in ('td', 'th') and self._row is not None:
+            self._end_cell()
+            self._cell = []
+        elif tag in ('script', 'style'):
+            self._skip += 1
+
+    def handle_endtag(self, tag):
+        if tag in ('td', 'th'):
+            self._end_cell()
+        elif tag in ('tr', 'table'):
+            self._end_row()
+            if tag == 'table' and self._tables:
+                self._tables.pop()
+        elif tag in ('script', 'style') and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data):
+        if self._cell is not None and not self._skip:
+            self._cell.append(data)
+
+    def _end_cell(self):
+        if self._cell is not None:
+            self._row.append(''.join(self._cell).strip())
+            self._cell = None
+
+    def _end_row(self):
+        self._end_cell()
+        if self._row is not None:
+            self.rows.append(self._row)
+            self._row = None
+
+
+def iter_table_rows(content, encoding='utf-8', chunk_size=STREAM_CHUNK_SIZE, table=None):
+    """Yield each table row's cell texts, feeding the raw bytes through the parser in chunks."""
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    parser = _RowExtractor(table)
+    for start in range(0, len(content), chunk_size):
+        parser.feed(decoder.decode(content[start:start + chunk_size]))
+        yield from parser.rows
+        parser.rows.clear()
+    parser.feed(decoder.decode(b'', final=True))
+    parser.close()
+    parser._end_row()
+    yield from parser.rows
+
+
+def _column_row(row_text, name_col, price_col):
+    """(name, price) from fixed cell positions (registry "columns" hint), or None."""
+    if max(name_col, price_col) >= len(row_text):
+        return None
+    name, price = row_text[name_col], row_text[price_col]
+    if name and any(c.isdigit() for c in price):
+        return name, price
+    return None
+
+
+def stream_price_table(content, encoding='utf-8', extract=None):
+    """
+    Same {test name: raw price text} as parse_price_table, from raw bytes, one row at a time.
+    `extract` holds a lab's registry hints: "table" to pick the rate table(s), "columns"
+    for fixed name / price cell positions instead of the heuristics.
+    """
+    extract = extract or {}
+    columns = extract.get("columns")
+    results = {}
+    for row_text in iter_table_rows(content, encoding, table=extract.get("table")):
+        if len(row_text) >= 2:
+            row = _column_row(row_text, columns["name"], columns["price"]) if columns else _price_row(row_text)
+            if row:
+                results[row[0]] = row[1]
+    return results
+
+
+def scrape_generic(url, session=None, cache=None, extract=None, timing=None):
+    """
+    Generic table scraper — works on most lab sites with price tables.
+    `extract` holds the lab's registry hints (see stream_price_table).
+    With a cache, sends a conditional request and returns None when the page
+    is unchanged (304, or same body hash), so the caller can skip parsing.
+    A `timing` dict is filled with fetch / parse seconds, bytes, rows and status.
+    """
+    timing = {} if timing is None else timing
+    timing.update(fetch_s=0.0, parse_s=0.0, bytes=0, rows=0, status="failed")
+    started = time.perf_counter()
     try:
-        res = requests.get(url, timeout=10, headers={"User-Agent": "Mozilla/5.0"})
-        soup = BeautifulSoup(res.text, 'html.parser')
-        results = {}
-        for tr in soup.find_all('tr'):
-            tds = tr.find_all(['td', 'th'])
-            if len(tds) >= 2:
-                row_text = [td.text.strip() for td in tds]
-                name = next((t for t in row_text if len(t) > 3 and not t.isdigit()), None)
-                price = next(
-                    (t for t in row_text if any(c.isdigit() for c in t) and ("Rs" in t or t.isdigit())),
-                    None
-                )
-                if name and price:
-                    results[name] = price
+        http = session or requests
+        headers = {"User-Agent": "Mozilla/5.0"}
+        entry = cache.get(url) if cache is not None else None
+        if entry and entry.get("extract") != extract:
+            entry = None  # the hints changed: the cached rows no longer apply
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        start = time.perf_counter()
+        res = http.get(url, timeout=timeout_for(url), headers=headers)
+        timing["fetch_s"] = time.perf_counter() - start
+        timing["bytes"] = len(res.content)
+        if entry and res.status_code == 304:
+            timing["status"] = "unchanged"
+            return None
+
+        body_hash = hashlib.sha256(res.content).hexdigest()
+        if entry and entry.get("sha256") == body_hash:
+            timing["status"] = "unchanged"
+            return None
+
+        start = time.perf_counter()
+        results = stream_price_table(res.content, res.encoding or 'utf-8', extract)
+        timing.update(parse_s=time.perf_counter() - start, rows=len(results),
+                      status="ok" if res.ok else f"HTTP {res.status_code}")
+        if cache is not None and res.ok:
+            cache[url] = {
+                "etag": res.headers.get("ETag"),
+                "last_modified": res.headers.get("Last-Modified"),
+                "sha256": body_hash,
+                "extract": extract,
+                "rows": results,
+            }
         return results
     except Exception as e:
+        timing["fetch_s"] = timing["fetch_s"] or time.perf_counter() - started  # time until it failed
         print(f"  ⚠️  Scrape failed for {url}: {e}")
         return {}
 
 
-if __name__ == "__main__":
-    print("🚀 Starting Hybrid Scrape (6 Labs)...")
+def scrape_all(lab_urls, max_workers=MAX_WORKERS, cache=None, extract=None, timings=None):
+    """
+    Scrape every lab concurrently over one pooled session.
+    A lab that fails or times out comes back as {} so the others still merge;
+    with a cache, a lab whose page is unchanged comes back as None.
+    `extract` maps lab → registry hints; `timings` (a dict) gets each lab's timing,
+    which also feeds the scrape_seconds / scrapes_total metrics.
+    """
+    extract = extract or {}
+    timings = {} if timings is None else timings
+    workers = max(1, min(max_workers, len(lab_urls)))
+    with make_session(workers) as session, ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            name: pool.submit(scrape_generic, url, session, cache, extract.get(name), timings.setdefault(name, {}))
+            for name, url in lab_urls.items()
+        }
+        results = {name: future.result() for name, future in futures.items()}
+    for name in lab_urls:
+        t = timings[name]
+        metrics.observe("scrape_seconds", t["fetch_s"], lab=name, phase="fetch")
+        if t["parse_s"]:
+            metrics.observe("scrape_seconds", t["parse_s"], lab=name, phase="parse")
+        metrics.inc("scrapes_total", lab=name, status=t["status"])
+    return results
 
-    print("  → Scraping Mughal Labs...")
-    live_mughal = scrape_generic("https://mughallabs.com/lab-test-rates/")
 
-    print("  → Scraping Shaukat Khanum...")
-    live_skm = scrape_generic("https://shaukatkhanum.org.pk/pathology-test-panels/")
+def timing_report(timings):
+    """Per-lab fetch / parse times, slowest first, as printable lines."""
+    lines = [f"   {'lab':<24} {'fetch':>7} {'parse':>7} {'KB':>7} {'rows':>6}  status"]
+    ranked = sorted(timings.items(), key=lambda item: item[1]["fetch_s"] + item[1]["parse_s"], reverse=True)
+    for lab, t in ranked:
+        lines.append(f"   {lab[:24]:<24} {t['fetch_s']:>6.2f}s {t['parse_s'] * 1000:>5.0f}ms "
+                     f"{t['bytes'] / 1024:>7.0f} {t['rows']:>6}  {t['status']}")
+    return lines
+
+
+if __name__ == "__main__":
+    start_export()  # scrape timings to REPORTSAY_METRICS_FILE at exit, when configured
+    registry = LabRegistry.load()
+    lab_urls = registry.urls()
+    print(f"🚀 Starting Hybrid Scrape ({len(lab_urls)} Labs, {len(registry.cities())} cities)...")
+
+    http_cache = load_http_cache()
+    previous = load_json(PRICES_PATH)
+    previous_catalog = load_json(CATALOG_PATH)
 
-    print("  → Scraping IDC...")
-    live_idc = scrape_generic("https://idc.net.pk/test-list/")
+    timings = {}
+    live_data = scrape_all(lab_urls, cache=http_cache,
+                           extract={lab.name: lab.extract for lab in registry.labs}, timings=timings)
 
-    print("  → Scraping Chughtai Lab...")
-    live_chughtai = scrape_generic("https://chughtailab.com/test-list/")
+    # Merge live data with fallback prices — unchanged pages reuse last run's result
+    all_data = {}
+    catalog = {}
+    unchanged = []
+    # Prices this run actually read off each lab's page, without the fallback prices:
+    # only these go into the price history, so a failed scrape is not a price change
+    live_prices = {}
+    for lab in registry.labs:
+        rows = live_data[lab.name]
+        if rows is None and lab.name in previous and lab.name in previous_catalog:
+            all_data[lab.name] = previous[lab.name]
+            catalog[lab.name] = previous_catalog[lab.name]
+            unchanged.append(lab.name)
+            print(f"  → {lab.name}: unchanged since last run")
+            continue
+        if rows is None:
+            rows = http_cache[lab.url]["rows"]
+        print(f"  → {lab.name}: {len(rows)} rows scraped")
+        live = normalize_and_merge(rows)
+        if live:
+            live_prices[lab.name] = live
+        all_data[lab.name] = {**(lab.fallback_prices or {}), **live}
+        # A failed scrape keeps yesterday's catalog rather than emptying it
+        catalog[lab.name] = build_catalog(rows) or previous_catalog.get(lab.name, {})
 
-    print("  → Scraping Al-Noor...")
-    live_alnoor = scrape_generic("https://alnoordiagnostic.com/service/laboratory/")
+    print("\n⏱️  Per-lab timing (slowest first):")
+    print("\n".join(timing_report(timings)))
 
-    print("  → Scraping Excel Labs...")
-    live_excel = scrape_generic("https://excel-labs.com/lab-test-rates/")
+    save_http_cache(http_cache)
+    if len(unchanged) == len(lab_urls) and list(previous) == list(all_data) and os.path.exists(PRICE_MATRIX_PATH):
+        print("✅ No lab pages changed — data/ left as is.")
+        raise SystemExit(0)
 
-    # Merge live data with backup prices
-    all_data = {
-        "Mughal Labs":    normalize_and_merge("Mughal Labs", live_mughal),
-        "Shaukat Khanum": normalize_and_merge("Shaukat Khanum", live_skm),
-        "IDC":            normalize_and_merge("IDC", live_idc),
-        "Chughtai Lab":   normalize_and_merge("Chughtai Lab", live_chughtai),
-        "Al-Noor":        normalize_and_merge("Al-Noor", live_alnoor),
-        "Excel Labs":     normalize_and_merge("Excel Labs", live_excel),
-    }
+    # Validate before anything is written: a malformed entry (e.g. a nested lab dict)
+    # raises PriceDataError here instead of ending up in the snapshot
+    matrix = PriceMatrix.from_nested(all_data)
 
-    # Save
-    os.makedirs('data', exist_ok=True)
-    with open('data/lab_prices.json', 'w') as f:
-        json.dump(all_data, f, indent=4)
+    # Save — the catalog first, so a new price snapshot never points at an older catalog
+    save_json(CATALOG_PATH, catalog, indent=1, ensure_ascii=False)
+    save_json(PRICES_PATH, all_data, indent=4)
+    save_bytes(PRICE_MATRIX_PATH, matrix.to_bytes())
+    changed = price_history.record_snapshot(live_prices)
 
-    print("✅ Done! data/lab_prices.json saved with integer prices.")
+    print(f"✅ Done! {PRICES_PATH}, {PRICE_MATRIX_PATH} and {CATALOG_PATH} saved with integer prices.")
+    print(f"   Price history: {changed} change(s) recorded in {price_history.path}")
     print(f"   Labs: {list(all_data.keys())}")
 
     # Quick sanity check — print CBC prices
@@ -0,0 +1,218 @@
+"""
+Structured analysis mode: Gemini fills a fixed JSON schema instead of writing a long
+Markdown document. The JSON is parsed once into a StructuredReport, which renders to
+the HTML card, Markdown and PDF — no regex munging of free text.
+The raw JSON stays the storage format, so results cache, index and diff as plain text.
+"""
+import functools
+import html
+import io
+import json
+import re
+
+from metrics import timed
+from reports import PDF_CACHE_SIZE, _pdf_styles, _render_pdf_report, generated_at
+
+FLAGS = ("normal", "low", "high", "abnormal")
+
+# Columns of one row in "results". Rows are plain string arrays so the model doesn't
+# spend output tokens repeating key names, and normal rows stop after the range
+RESULT_COLUMNS = ("test", "value", "range", "flag", "note")
+
+# Gemini response_schema (OpenAPI subset)
+ANALYSIS_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "tests": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "results": {"type": "ARRAY", "items": {"type": "ARRAY", "items": {"type": "STRING"}}},
+        "summary": {"type": "STRING"},
+        "next_steps": {"type": "ARRAY", "items": {"type": "STRING"}},
+    },
+    "required": ["tests", "results", "summary", "next_steps"],
+}
+
+GENERATION_CONFIG = {"response_mime_type": "application/json", "response_schema": ANALYSIS_SCHEMA}
+
+DISCLAIMER = ("This analysis is generated by AI and is for informational purposes only. "
+              "It does not constitute medical advice, diagnosis, or treatment. "
+              "Always consult a qualified physician before making any health decisions.")
+
+_FENCE = re.compile(r'^```(?:json)?\s*|\s*```$')
+
+
+def build_structured_prompt(language: str) -> str:
+    """Prompt for the JSON mode; the layout and the disclaimer come from the renderers, not the model."""
+    return f"""You are a professional medical lab report interpreter. Read the patient's lab report and fill in the JSON schema.
+Write note, summary and next_steps in {language}; keep test names, values, units and ranges as printed on the report.
+- tests: the tests / panels found (e.g. CBC, HbA1c)
+- results: one row per reported value: [test, value with unit, reference range]. For a value outside its range append [flag, note]: flag is low, high, or abnormal (not numeric), note is one short plain-language sentence on what it may suggest.
+- summary: 2–3 plain sentences on the overall report for a non-medical reader.
+- next_steps: 2–3 specific points to discuss with a doctor.
+"""
+
+
+class TestResult:
+    def __init__(self, test, value, range="", flag="normal", note=""):
+        self.test = test
+        self.value = value
+        self.range = range
+        self.flag = flag if flag in FLAGS else "abnormal" if flag else "normal"
+        self.note = note
+
+    @property
+    def is_normal(self):
+        return self.flag == "normal"
+
+    def to_row(self):
+        return [self.test, self.value, self.range, self.flag, self.note]
+
+
+class StructuredReport:
+    """One analysis, parsed from the model's JSON."""
+
+    def __init__(self, tests, results, summary, next_steps):
+        self.tests = tests
+        self.results = results
+        self.summary = summary
+        self.next_steps = next_steps
+
+    @property
+    def normal(self):
+        return [r for r in self.results if r.is_normal]
+
+    @property
+    def abnormal(self):
+        return [r for r in self.results if not r.is_normal]
+
+    def to_json(self) -> str:
+        """Canonical JSON, stable across runs so two analyses can be diffed."""
+        return json.dumps({
+            "tests": self.tests,
+            "results": [r.to_row() for r in self.results],
+            "summary": self.summary,
+            "next_steps": self.next_steps,
+        }, ensure_ascii=False, sort_keys=True, indent=1)
+
+
+def parse_structured_report(text: str) -> StructuredReport:
+    """Parse the model's JSON answer. Raises ValueError if it does not fit the schema."""
+    data = json.loads(_FENCE.sub('', text.strip()))
+    if not isinstance(data, dict) or not isinstance(data.get("results", []), list):
+        raise ValueError("analysis JSON does not match the schema")
+    results = []
+    for row in data.get("results", []):
+        if not isinstance(row, list) or not row or not row[0]:
+            continue
+        cells = [str(cell).strip() for cell in row[:len(RESULT_COLUMNS)]]
+        cells += [""] * (len(RESULT_COLUMNS) - len(cells))
+        test, value, range_, flag, note = cells
+        results.append(TestResult(test, value, range_, flag.lower(), note))
+    return StructuredReport(
+        tests=[str(t) for t in data.get("tests", [])],
+        results=results,
+        summary=str(data.get("summary", "")),
+        next_steps=[str(s) for s in data.get("next_steps", [])],
+    )
+
+
+def to_markdown(report: StructuredReport) -> str:
+    """The same layout the Markdown prompt asks for (PDF fallback, plain-text export)."""
+    lines = ["**🧪 Tests Detected**", ", ".join(report.tests) or "—", "", "**✅ Normal Results**"]
+    lines += [f"{r.test} → {r.value} ({r.range})" for r in report.normal] or ["—"]
+    lines += ["", "**⚠️ Abnormal Results**"]
+    lines += [f"{r.test} → {r.value} ({r.range}) — {r.note}" for r in report.abnormal] or ["—"]
+    lines += ["", "**📋 Summary**", report.summary, "", "**💡 Suggested Next Steps**"]
+    lines += [f"{i}. {step}" for i, step in enumerate(report.next_steps, 1)]
+    lines += ["", "---", f"⚕️ **Important Disclaimer:** {DISCLAIMER}"]
+    return "\n".join(lines)
+
+
+def _results_table_html(results, with_notes):
+    rows = "".join(
+        f"<tr><td>{html.escape(r.test)}</td><td><b>{html.escape(r.value)}</b></td>"
+        f"<td>{html.escape(r.range)}</td>"
+        + (f"<td>{'⬇️' if r.flag == 'low' else '⬆️' if r.flag == 'high' else '⚠️'} {html.escape(r.note)}</td>" if with_notes else "")
+        + "</tr>"
+        for r in results
+    )
+    return f'<table style="width:100%;font-size:0.95rem;">{rows}</table>'
+
+
+def to_html(report: StructuredReport) -> str:
+    """The analysis card, built from the structure (model text is escaped)."""
+    parts = [
+        '<div class="report-box">',
+        "<h3>📝 AI Analysis Result</h3>",
+        f"<b>🧪 Tests Detected</b><br>{html.escape(', '.join(report.tests)) or '—'}<br><br>",
+        "<b>⚠️ Abnormal Results</b>",
+        _results_table_html(report.abnormal, with_notes=True) if report.abnormal else "<br>None found.<br>",
+        "<br><b>✅ Normal Results</b>",
+        _results_table_html(report.normal, with_notes=False) if report.normal else "<br>—<br>",
+        f"<br><b>📋 Summary</b><br>{html.escape(report.summary)}<br><br>",
+        "<b>💡 Suggested Next Steps</b><ol>",
+        "".join(f"<li>{html.escape(step)}</li>" for step in report.next_steps),
+        "</ol></div>",
+    ]
+    return "".join(parts)
+
+
+def generate_structured_pdf(report_json: str, language: str) -> bytes:
+    """PDF export of a structured analysis, with results as a table. Memoized like generate_pdf_report."""
+    return _structured_pdf(report_json, language, generated_at())
+
+
+@functools.lru_cache(maxsize=PDF_CACHE_SIZE)
+@timed("pdf")
+def _structured_pdf(report_json: str, language: str, generated: str) -> bytes:
+    report = parse_structured_report(report_json)
+    try:
+        from reportlab.lib import colors
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.units import cm
+        from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+    except ImportError:
+        return _render_pdf_report(to_markdown(report), language, generated)
+
+    styles = _pdf_styles()
+    body = styles["body"]
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4,
+                            leftMargin=2*cm, rightMargin=2*cm,
+                            topMargin=2*cm, bottomMargin=2*cm)
+
+    def para(text, bold=False):
+        text = html.escape(text)
+        return Paragraph(f"<b>{text}</b>" if bold else text, body)
+
+    def table(results, with_notes):
+        header = ["Test", "Value", "Range"] + (["What this means"] if with_notes else [])
+        rows = [[para(h, bold=True) for h in header]]
+        for r in results:
+            rows.append([para(r.test), para(r.value, bold=True), para(r.range)]
+                        + ([para(r.note)] if with_notes else []))
+        widths = [4.5*cm, 3*cm, 3*cm, 6.5*cm] if with_notes else [7*cm, 5*cm, 5*cm]
+        t = Table(rows, colWidths=widths, repeatRows=1)
+        t.setStyle(TableStyle([
+            ("GRID", (0, 0), (-1, -1), 0.25, colors.HexColor('#cccccc')),
+            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor('#eef5ff')),
+            ("VALIGN", (0, 0), (-1, -1), "TOP"),
+        ]))
+        return t
+
+    story = [
+        Paragraph("ReportSay", styles["title"]),
+        Paragraph(f"AI Medical Report Analysis · Generated {generated} · Language: {language}", styles["sub"]),
+        para("Tests Detected", bold=True), para(", ".join(report.tests) or "—"), Spacer(1, 0.3*cm),
+    ]
+    if report.abnormal:
+        story += [para("Abnormal Results", bold=True), table(report.abnormal, with_notes=True), Spacer(1, 0.3*cm)]
+    if report.normal:
+        story += [para("Normal Results", bold=True), table(report.normal, with_notes=False), Spacer(1, 0.3*cm)]
+    story += [para("Summary", bold=True), para(report.summary), para("Suggested Next Steps", bold=True)]
+    story += [para(f"{i}. {step}") for i, step in enumerate(report.next_steps, 1)]
+    story += [Spacer(1, 0.3*cm), para(f"Important Disclaimer: {DISCLAIMER}")]
+    try:
+        doc.build(story)
+    except Exception:
+        return _render_pdf_report(to_markdown(report), language, generated)  # e.g. glyphs the base font lacks
+    return buffer.getvalue()
@@ -0,0 +1,107 @@
+"""
+Local stand-in for the google.generativeai module, so the analysis pipeline (batch runs,
+benchmarks) can be exercised without an API key or network access.
+Answers are deterministic: digital PDFs are flagged with the local reference-range
+engine, images get a fixed answer. Install it with gemini_client.use_gemini_backend().
+"""
+import json
+import threading
+import time
+
+from reference_ranges import quick_check
+from structured_report import DISCLAIMER
+
+STUB_MODEL_NAME = "models/stub-flash"
+
+
+class _StubModelInfo:
+    name = STUB_MODEL_NAME
+    supported_generation_methods = ["generateContent"]
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubModel:
+    def __init__(self, backend, name):
+        self._backend = backend
+        self.model_name = name
+
+    def generate_content(self, contents, stream=False, generation_config=None, **kwargs):
+        backend = self._backend
+        with backend._lock:
+            backend.calls += 1
+            call_no = backend.calls
+        if backend.rate_limit_every and call_no % backend.rate_limit_every == 0:
+            raise RuntimeError("429 Resource has been exhausted (stub)")
+        time.sleep(backend.latency_s)
+
+        text = "\n".join(part for part in contents[1:] if isinstance(part, str))
+        structured = bool(generation_config and generation_config.get("response_mime_type") == "application/json")
+        answer = _json_answer(text) if structured else _markdown_answer(text)
+        if not stream:
+            return _Chunk(answer)
+        size = max(1, len(answer) // backend.chunks)
+        return iter([_Chunk(answer[i:i + size]) for i in range(0, len(answer), size)])
+
+
+class StubGenAI:
+    """
+    latency_s: simulated generation time per call.
+    rate_limit_every: every Nth call fails with a 429, to exercise retries (0 = never).
+    """
+
+    def __init__(self, latency_s=0.5, rate_limit_every=0, chunks=4):
+        self.latency_s = latency_s
+        self.rate_limit_every = rate_limit_every
+        self.chunks = chunks
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def configure(self, api_key=None, **kwargs):
+        pass
+
+    def list_models(self):
+        return [_StubModelInfo()]
+
+    def GenerativeModel(self, name, **kwargs):
+        return StubModel(self, name)
+
+
+def _results(text):
+    return quick_check(text) if text else []
+
+
+def _markdown_answer(text):
+    results = _results(text)
+    normal = [r for r in results if r["flag"] == "normal"]
+    abnormal = [r for r in results if r["flag"] != "normal"]
+    lines = ["**🧪 Tests Detected**", ", ".join(sorted({r["panel"] for r in results})) or "Lab report (image)", "",
+             "**✅ Normal Results**"]
+    lines += [f"{r['test']} → {r['value']:g} {r['unit']} ({r['low']:g} – {r['high']:g})" for r in normal] or ["—"]
+    lines += ["", "**⚠️ Abnormal Results**"]
+    lines += [f"{r['test']} → {r['value']:g} {r['unit']} ({r['low']:g} – {r['high']:g}) — {r['flag']}, discuss with your doctor"
+              for r in abnormal] or ["—"]
+    lines += ["", "**📋 Summary**", f"{len(abnormal)} of {len(results)} values are outside the usual range.", "",
+              "**💡 Suggested Next Steps**", "1. Review these results with your doctor.", "",
+              "---", f"⚕️ **Important Disclaimer:** {DISCLAIMER}"]
+    return "\n".join(lines)
+
+
+def _json_answer(text):
+    results = _results(text)
+    rows = []
+    for r in results:
+        row = [r["test"], f"{r['value']:g} {r['unit']}", f"{r['low']:g} – {r['high']:g}"]
+        if r["flag"] != "normal":
+            row += [r["flag"], "Outside the usual range, discuss with your doctor."]
+        rows.append(row)
+    abnormal = sum(r["flag"] != "normal" for r in results)
+    return json.dumps({
+        "tests": sorted({r["panel"] for r in results}),
+        "results": rows,
+        "summary": f"{abnormal} of {len(results)} values are outside the usual range.",
+        "next_steps": ["Review these results with your doctor."],
+    }, ensure_ascii=False)
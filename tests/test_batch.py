@@ -0,0 +1,88 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+from PIL import Image
+
+from batch import CHECKPOINT_NAME, find_inputs, output_stems
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_reports(root):
+    """Eight distinct report images, several sharing a file name."""
+    names = ["a/x.png", "b/x.png", "x.png", "x.jpg", "c/d/y.png", "c/d/z.png"]
+    for i, name in enumerate(names + ["one/r.png", "two/r.png"]):
+        folder = "reports" if i < len(names) else "extra"
+        path = root / folder / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        Image.new("RGB", (64, 64), (i * 30, 0, 0)).save(path)
+    # Same base name in two folders outside the input folder: only a hash tells them apart
+    (root / "todo.txt").write_text("extra/one/r.png\nextra/two/r.png\n")
+    return str(root / "reports"), str(root / "todo.txt")
+
+
+def batch_command(reports, manifest, out):
+    return [sys.executable, "batch.py", reports, "--manifest", manifest, "--out", out,
+            "--stub", "--stub-latency", "0.3", "--workers", "1", "--rpm", "6000"]
+
+
+def checkpoint_entries(out):
+    path = os.path.join(out, CHECKPOINT_NAME)
+    if not os.path.exists(path):
+        return []
+    entries = []
+    with open(path) as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                pass  # a line cut short by the kill
+    return entries
+
+
+def test_resume_after_kill_redoes_nothing(tmp_path):
+    reports, manifest = make_reports(tmp_path)
+    out = str(tmp_path / "out")
+    inputs = find_inputs([reports], manifest)
+    assert len(inputs) == 8
+
+    # First run: killed once a couple of reports are checkpointed
+    env = {k: v for k, v in os.environ.items() if not k.startswith("REPORTSAY_")}
+    first = subprocess.Popen(batch_command(reports, manifest, out), cwd=REPO, env=env,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 60
+        while sum(e["status"] == "ok" for e in checkpoint_entries(out)) < 2:
+            assert first.poll() is None, "the batch finished before it could be interrupted"
+            assert time.monotonic() < deadline, "no checkpoint written"
+            time.sleep(0.05)
+    finally:
+        first.kill()
+        first.wait()
+    done_before = {e["key"] for e in checkpoint_entries(out) if e["status"] == "ok"}
+    assert 2 <= len(done_before) < len(inputs)
+
+    # Resume: only what is left is analysed
+    second = subprocess.run(batch_command(reports, manifest, out), cwd=REPO, env=env,
+                            capture_output=True, text=True, timeout=120)
+    assert second.returncode == 0, second.stdout + second.stderr
+    assert f"{len(inputs) - len(done_before)} report(s) to analyse, {len(done_before)} already done" in second.stdout
+
+    ok = [e for e in checkpoint_entries(out) if e["status"] == "ok"]
+    assert len(ok) == len(inputs)
+    assert len({e["key"] for e in ok}) == len(inputs)  # nothing analysed twice
+    assert sorted(e["input"] for e in ok) == sorted(inputs)
+
+    # Every input wrote its own answer and PDF, under the stem output_stems gives it
+    stems = output_stems(inputs, [reports])
+    assert len(set(stems.values())) == len(inputs)
+    assert [s[:6] for s in stems.values() if "~" in s] == ["r_png~", "r_png~"]  # hashed apart
+    for entry in ok:
+        stem = stems[entry["input"]]
+        assert entry["answer"] == os.path.join(out, f"{stem}.md")
+        assert entry["pdf"] == os.path.join(out, f"{stem}.pdf")
+    produced = sorted(name for name in os.listdir(out) if name.endswith((".md", ".pdf")))
+    assert produced == sorted(f"{stem}.{ext}" for stem in stems.values() for ext in ("md", "pdf"))
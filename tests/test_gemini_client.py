@@ -0,0 +1,78 @@
+import threading
+import time
+
+from gemini_client import ModelResolver
+from stub_gemini import STUB_MODEL_NAME, StubGenAI
+
+
+class CountingGenAI(StubGenAI):
+    """The stub backend, counting list_models() calls and optionally slowing them down."""
+
+    def __init__(self, list_delay_s=0.0):
+        super().__init__(latency_s=0)
+        self.list_delay_s = list_delay_s
+        self.listings = 0
+
+    def list_models(self):
+        with self._lock:
+            self.listings += 1
+        time.sleep(self.list_delay_s)
+        return super().list_models()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_list_models_once_per_ttl():
+    genai, clock = CountingGenAI(), FakeClock()
+    resolver = ModelResolver(genai=genai, ttl=60, clock=clock)
+
+    for _ in range(5):
+        model, name = resolver.get()
+        clock.now += 10
+    assert name == STUB_MODEL_NAME and model is not None
+    assert genai.listings == 1
+
+    # Past the TTL: the stale model is still served while one background refresh runs
+    clock.now += 60
+    for _ in range(5):
+        assert resolver.get()[1] == STUB_MODEL_NAME
+    assert wait_for(lambda: genai.listings == 2 and not resolver._refreshing)
+    for _ in range(5):
+        resolver.get()
+    assert genai.listings == 2
+
+
+def test_get_waits_for_warm_instead_of_listing_again():
+    genai = CountingGenAI(list_delay_s=0.2)
+    resolver = ModelResolver(genai=genai)
+    resolver.warm()
+    results = []
+    callers = [threading.Thread(target=lambda: results.append(resolver.get())) for _ in range(4)]
+    for t in callers:
+        t.start()
+    for t in callers:
+        t.join(5)
+    assert [name for _, name in results] == [STUB_MODEL_NAME] * 4
+    assert genai.listings == 1
+
+
+def test_invalidate_lists_again():
+    genai = CountingGenAI()
+    resolver = ModelResolver(genai=genai)
+    resolver.get()
+    resolver.invalidate()
+    resolver.get()
+    assert genai.listings == 2
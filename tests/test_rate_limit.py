@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+
+from rate_limit import RateLimiter
+from stub_gemini import StubGenAI
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def stub_model(rate_limit_every=0):
+    genai = StubGenAI(latency_s=0.001, rate_limit_every=rate_limit_every, chunks=1)
+    return genai, genai.GenerativeModel("models/stub-flash")
+
+
+def test_callers_are_served_first_come_first_served():
+    genai, model = stub_model()
+    limiter = RateLimiter(rate_per_min=6000, burst=1)
+    served, positions = [], {}
+
+    def analyse(n):
+        served.append(n)
+        return model.generate_content(["prompt", f"report {n}"])
+
+    def caller(n):
+        limiter.call(analyse, n, on_wait=lambda position: positions.setdefault(n, []).append(position))
+
+    # Hold the bucket so every caller is queued, each joining after the one before it
+    limiter.pause(0.5)
+    threads = []
+    for n in range(5):
+        threads.append(threading.Thread(target=caller, args=(n,)))
+        threads[-1].start()
+        assert wait_for(lambda: limiter.queue_length() == n + 1)
+    for t in threads:
+        t.join(timeout=5)
+
+    assert served == [0, 1, 2, 3, 4]
+    assert positions[4][0] == 5 and positions[4] == sorted(positions[4], reverse=True)
+    assert genai.calls == 5
+    assert limiter.stats() == {"calls": 5, "rate_limited": 0, "retries": 0, "queued": 0}
+
+
+def test_429s_back_off_and_retry_until_done():
+    genai, model = stub_model(rate_limit_every=2)  # every second call is a 429
+    limiter = RateLimiter(rate_per_min=6000, burst=4, backoff_base=0.01, backoff_max=0.05)
+
+    answers = [limiter.call(model.generate_content, ["prompt", f"report {n}"]) for n in range(4)]
+
+    assert all(answer.text for answer in answers)
+    # Calls 2, 4 and 6 were rejected; each was retried once and then succeeded
+    assert genai.calls == 7
+    assert limiter.stats() == {"calls": 7, "rate_limited": 3, "retries": 3, "queued": 0}
+
+
+def test_gives_up_after_max_retries():
+    genai, model = stub_model(rate_limit_every=1)  # every call is a 429
+    limiter = RateLimiter(rate_per_min=6000, burst=4, max_retries=2, backoff_base=0.01)
+
+    with pytest.raises(RuntimeError, match="429"):
+        limiter.call(model.generate_content, ["prompt", "report"])
+    assert genai.calls == 3
+    assert limiter.stats() == {"calls": 3, "rate_limited": 3, "retries": 2, "queued": 0}
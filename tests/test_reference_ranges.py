@@ -0,0 +1,35 @@
+import pytest
+
+from reference_ranges import quick_check
+
+
+def readings(text):
+    return {r["test"]: (r["value"], r["flag"]) for r in quick_check(text)}
+
+
+@pytest.mark.parametrize("text, expected", [
+    # "hb" must not resolve "Hb A1c" to Hemoglobin = 1 (the "1" of "A1c")
+    ("Hb A1c: 6.5 %", {"HbA1c": (6.5, "high")}),
+    ("Hb-A1c 6.5", {"HbA1c": (6.5, "high")}),
+    ("HbA1c 7.1%", {"HbA1c": (7.1, "high")}),
+    # Parenthesised qualifiers are not the value
+    ("Vitamin D (25-OH) 18 ng/mL", {"Vitamin D": (18.0, "low")}),
+    ("TSH (3rd generation) 2.5", {"TSH": (2.5, "normal")}),
+    # A ratio is not the analyte it is a ratio of
+    ("Total Cholesterol/HDL Ratio 4.1\nTotal Cholesterol 250", {"Total Cholesterol": (250.0, "high")}),
+    ("Cholesterol HDL ratio 4.1", {}),
+])
+def test_qualifiers_and_ratios_are_not_values(text, expected):
+    assert readings(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Hb 11.2", {"Hemoglobin": (11.2, "low")}),
+    ("Hemoglobin 13.5 g/dL.", {"Hemoglobin": (13.5, "normal")}),
+    ("Hemoglobin 12.5g/dl", {"Hemoglobin": (12.5, "normal")}),
+    ("TSH 2.5µIU/mL", {"TSH": (2.5, "normal")}),
+    ("Platelets 1,50,000", {"Platelets": (150.0, "normal")}),
+    ("Hemoglobin: 14.0, WBC: 7.2", {"Hemoglobin": (14.0, "normal"), "Total WBC": (7.2, "normal")}),
+])
+def test_plain_readings(text, expected):
+    assert readings(text) == expected